@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.profiling.RequestProfilingMiddleware',
+    'main.routers.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +87,127 @@ DATABASES = {
     }
 }
 
+# IWATCHED_SQLITE_REPLICAS=N adds N SQLite files standing in for read replicas, filled
+# from the primary by the sync_replicas command, and keeps the cache in files so every
+# process sees the pins. Leave it unset for the test suite, whose routing tests set up
+# their own replica files.
+for number in range(1, int(os.environ.get('IWATCHED_SQLITE_REPLICAS', 0)) + 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.replica{number}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Read replicas of the primary (`default`) database, see main.routers: safe-method requests
+# of the views with ReplicaReadMixin read them, except for users who wrote in the last
+# PIN_SECONDS (recorded in the PIN_CACHE alias). Replicas failing a health check are
+# skipped for HEALTH_INTERVAL seconds. With replicas, the PIN_CACHE and the default cache
+# (holding the response cache versions) must be shared by all processes, see main.checks.
+DATABASE_ROUTERS = ['main.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_REPLICA_HEALTH_INTERVAL = 5
+DATABASE_PIN_CACHE = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'iwatched',
+    }
+}
+if int(os.environ.get('IWATCHED_SQLITE_REPLICAS', 0)):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+
+# Seconds a cached films list/detail response is kept, see main.api.cache
+API_RESPONSE_CACHE_TIMEOUT = 300
+
+# Authenticated tokens kept per process (and optionally in a shared cache alias
+# for `timeout` seconds), see main.api.authentication. Without the shared cache,
+# other processes learn of no logout or deactivation: they keep accepting a revoked
+# token for up to LOCAL_CACHE_TIMEOUT seconds, so keep it short.
+API_TOKEN_CACHE_SIZE = 10000
+API_TOKEN_CACHE_TIMEOUT = 60
+API_TOKEN_LOCAL_CACHE_TIMEOUT = 5
+API_TOKEN_SHARED_CACHE = None
+
+# Write throttling, see main.api.throttling: "<requests>/<period>" (s, m, h or d) rates
+# per view `throttle_scope`, for each authenticated user and each anonymous client IP.
+# The sliding-window counters are kept per process (at most MAX_KEYS clients), or in
+# the SHARED_CACHE alias when set.
+API_THROTTLE_RATES = {
+    'comment': {'user': '30/min', 'anon': '10/min'},
+    'rate': {'user': '120/min'},
+}
+API_THROTTLE_MAX_KEYS = 100000
+API_THROTTLE_SHARED_CACHE = None
+
+# Threads running the database work of the async views, see main.api.async_views.
+# None runs it on asgiref's single thread-sensitive thread instead.
+ASYNC_DATABASE_THREADS = 16
+
+# Per-request timings, see main.profiling. The Server-Timing header exposes them to clients.
+# A SAMPLE_RATE share of the requests is profiled with cProfile; with SLOW_MS every request's
+# stack is sampled every STACK_INTERVAL_MS and kept for requests at least that slow.
+REQUEST_PROFILING_HEADER = DEBUG
+REQUEST_PROFILING_SAMPLE_RATE = 0.0
+REQUEST_PROFILING_SLOW_MS = None
+REQUEST_PROFILING_STACK_INTERVAL_MS = 5
+REQUEST_PROFILING_DIRECTORY = BASE_DIR / 'profiles'
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+# main.profiling logs one JSON record per request at INFO to stderr; set IWATCHED_REQUEST_LOG_LEVEL=WARNING
+# to silence them, e.g. in test runs.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'main.profiling': {
+            'handlers': ['console'],
+            'level': os.environ.get('IWATCHED_REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Prior of the Bayesian top rated leaderboards: every film starts with PRIOR_VOTES
+# votes of PRIOR_RATING, see main.models.LeaderboardEntry
+LEADERBOARD_PRIOR_RATING = 3.0
+LEADERBOARD_PRIOR_VOTES = 10
+
+# Activity feeds, see main.feed: events are copied into the inbox of each follower,
+# which keeps about the INBOX_LENGTH newest ones, unless the actor has more than
+# FANOUT_MAX_FOLLOWERS followers, whose feeds read the actor's events instead
+FEED_INBOX_LENGTH = 500
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+
+# Film full-text search backend, see main.search
+FILM_SEARCH_BACKEND = 'main.search.SQLiteFTS5Backend'
+
+# Poster thumbnails generated on upload, see main.posters
+POSTER_THUMBNAIL_SIZES = {
+    'small': (160, 240),
+    'medium': (320, 480),
+    'large': (640, 960),
+}
+POSTER_THUMBNAIL_FORMAT = 'WEBP'
+POSTER_THUMBNAIL_QUALITY = 80
+
+# Thumbnail names change with their content, so clients may cache them for a year
+POSTER_THUMBNAIL_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -144,11 +267,14 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'main.api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    # Reverse proxies in front of the app (main.api.throttling): anonymous clients are throttled by the address
+    # the last of them saw, or by REMOTE_ADDR with none. Unset, the client-controlled X-Forwarded-For is trusted.
+    'NUM_PROXIES': 0,
 }
@@ -18,11 +18,22 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path
 
+from main.posters import THUMBNAIL_DIRECTORY
+from main.views import serve_poster_thumbnail
+
 
 urlpatterns = [
     path('main/', include('main.urls')),
     path('api/', include('main.api.urls')),
     path('admin/', admin.site.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Served with far-future cache headers, ahead of the plain media files
+    urlpatterns.append(
+        path(f'{settings.MEDIA_URL.strip("/")}/{THUMBNAIL_DIRECTORY}/<path:path>', serve_poster_thumbnail)
+    )
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from main.models import Film, CustomUser, Comment, Franchise, Genre, FilmsList, Rate
+from main.models import Film, CustomUser, Comment, Franchise, Genre, FilmsList, Rate, SimilarFilm
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
 
@@ -38,3 +38,8 @@ class FranchiseAdmin(admin.ModelAdmin):
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
+
+
+@admin.register(SimilarFilm)
+class SimilarFilmAdmin(admin.ModelAdmin):
+    list_display = ('id', 'film', 'similar_film', 'score')
@@ -1,9 +1,14 @@
 from django.contrib.auth import login, authenticate
-from django.db.models import Avg
+from django.db import transaction
+from django.db.models import Count, OuterRef, prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import status, filters
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import (
+    GenericAPIView,
     RetrieveAPIView,
     CreateAPIView,
     ListAPIView,
@@ -14,41 +19,182 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from main.api.cache import CachedResponseMixin, FILM_VERSION_KEY
+from main.api.fieldsets import FieldSelection
+from main.api.filters import FieldMapOrderingFilter, GenreFilter
+from main.api.pagination import KeysetPagination, MergedIdPagination
 from main.api.permissions import IsAnonymousUser, IsCurrentUserByUserId, IsCurrentUserByFilmsListId
+from main.api.routing import ReplicaReadMixin
 from main.api.serializers import (
+    ActivityEventSerializer,
+    CommentSerializer,
     FilmDetailSerializer,
+    FilmWithCommentsSerializer,
+    FilmsListsBatchSerializer,
+    LeaderboardEntrySerializer,
     RegisterSerializer,
     ProfileSerializer,
+    ProfileSummarySerializer,
     CommentCreateSerializer,
     RateSerializer,
     UserFilmsListUpdateSerializer,
+    UserStatsSerializer,
 )
-from main.models import Film, FilmsList, CustomUser, Comment, Rate
+from main.api.throttling import SlidingWindowThrottle
+from main.constants import COMMENTED_VERB, LEADERBOARD_FRANCHISE, LEADERBOARD_GENRE, LISTED_VERB, RATED_VERB
+from main.export import get_export_extension, iter_user_export
+from main.feed import follow, get_feed_event_ids, record_event, unfollow
+from main.models import (
+    ActivityEvent,
+    Film,
+    FilmsList,
+    CustomUser,
+    Comment,
+    Franchise,
+    Genre,
+    LeaderboardEntry,
+    Rate,
+    UserStats,
+)
+from main.recommendations import get_recommended_film_ids, get_similar_films
+from main.search import get_search_backend
+
 
+def get_film_comments(film_id):
+    return (
+        Comment.objects.filter(film_id=film_id).select_related('author')
+        .only('id', 'film', 'text', 'date', 'author__id', 'author__username').order_by('-date', '-id')
+    )
 
-class FilmsListAPIView(ListAPIView):
-    queryset = Film.objects.all().annotate(film_rating=Avg('rates__value'))
+
+class FilmsListAPIView(ReplicaReadMixin, CachedResponseMixin, ListAPIView):
+    queryset = Film.objects.all()
     serializer_class = FilmDetailSerializer
     permission_classes = [AllowAny, ]
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [GenreFilter, FieldMapOrderingFilter]
+    pagination_class = KeysetPagination
+    ordering = ['id', ]
     ordering_fields = ['film_rating', ]
+    ordering_fields_map = {'film_rating': 'rating_avg'}
 
     def get_queryset(self):
-        qs = self.queryset.all()
-        genre = self.request.query_params.get('genre')
-        if genre:
-            for genre_name in genre.split(','):
-                qs = qs.filter(genre__name=genre_name)
-                if not qs:
-                    break
-        return qs
+        return FilmDetailSerializer.setup_eager_loading(self.queryset.all(), FieldSelection.from_request(self.request))
 
 
-class FilmDetailAPIView(RetrieveAPIView):
+class FilmSearchAPIView(ListAPIView):
+    """
+    Full-text search over film names and synopses (`?q=`), best matches first.
+    Combines with the `genre`/`match` and `franchise` filters of the catalogue.
+    """
     queryset = Film.objects.all()
     serializer_class = FilmDetailSerializer
     permission_classes = [AllowAny, ]
+    filter_backends = [DjangoFilterBackend, GenreFilter]
+    filterset_fields = ['franchise', ]
+    pagination_class = KeysetPagination
+    search_query_param = 'q'
+
+    def get_queryset(self):
+        query = self.request.query_params.get(self.search_query_param, '').strip()
+        if not query:
+            raise ValidationError({self.search_query_param: 'This query parameter is required.'})
+        queryset = get_search_backend().search(self.queryset.all(), query).order_by('search_rank', 'id')
+        return FilmDetailSerializer.setup_eager_loading(queryset, FieldSelection.from_request(self.request))
+
+
+class FilmDetailAPIView(ReplicaReadMixin, CachedResponseMixin, RetrieveAPIView):
+    """
+    A film with its `comment_count` and newest `comments_limit` comments,
+    read through the (film, date, id) index instead of counting or scanning comments.
+    """
+    queryset = Film.objects.all()
+    serializer_class = FilmWithCommentsSerializer
+    permission_classes = [AllowAny, ]
     lookup_url_kwarg = 'film_id'
+    comments_limit_query_param = 'comments_limit'
+    comments_limit = 5
+
+    def get_queryset(self):
+        return FilmDetailSerializer.setup_eager_loading(self.queryset.all(), FieldSelection.from_request(self.request))
+
+    def get_object(self):
+        film = super().get_object()
+        if FieldSelection.from_request(self.request).includes('latest_comments'):
+            limit = KeysetPagination.get_limit(self.request, self.comments_limit_query_param, self.comments_limit)
+            film.latest_comments = list(get_film_comments(film.id)[:limit])
+        return film
+
+    def get_cache_version_keys(self):
+        return [FILM_VERSION_KEY.format(self.kwargs['film_id'])]
+
+
+class FilmCommentsAPIView(ListAPIView):
+    """A film's comments, newest first, keyset-paginated on (date, id)."""
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+    permission_classes = [AllowAny, ]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        film = get_object_or_404(Film.objects.only('id'), id=self.kwargs.get('film_id'))
+        return get_film_comments(film.id)
+
+
+class FilmSimilarAPIView(ListAPIView):
+    """Films most similar to a film, read from the precomputed neighbour table."""
+    queryset = Film.objects.all()
+    serializer_class = FilmDetailSerializer
+    permission_classes = [AllowAny, ]
+    pagination_class = None
+    limit_query_param = 'limit'
+
+    def get_queryset(self):
+        film = get_object_or_404(self.queryset.only('id'), id=self.kwargs.get('film_id'))
+        films = FilmDetailSerializer.setup_eager_loading(
+            get_similar_films(film.id), FieldSelection.from_request(self.request)
+        )
+        return films[:KeysetPagination.get_limit(self.request, self.limit_query_param)]
+
+
+class LeaderboardAPIView(ListAPIView):
+    """
+    Films of a genre or franchise (the view's `group`) ranked by a precomputed
+    leaderboard: `top-rated` (Bayesian average), `most-watched` or `most-planned`.
+    A page reads its rows off the board's index, then loads the films of the page.
+    """
+    queryset = LeaderboardEntry.objects.all()
+    serializer_class = LeaderboardEntrySerializer
+    permission_classes = [AllowAny, ]
+    pagination_class = KeysetPagination
+    group = LEADERBOARD_GENRE
+    group_models = {LEADERBOARD_GENRE: Genre, LEADERBOARD_FRANCHISE: Franchise}
+
+    def get_score_field(self):
+        try:
+            return LeaderboardEntry.boards[self.kwargs.get('board')]
+        except KeyError:
+            raise Http404
+
+    def get_queryset(self):
+        score_field = self.get_score_field()
+        group = get_object_or_404(self.group_models[self.group].objects.only('id'), id=self.kwargs.get('group_id'))
+        return (
+            self.queryset.filter(group=self.group, group_id=group.id)
+            .only('id', 'film_id', score_field).order_by(f'-{score_field}', 'id')
+        )
+
+    def paginate_queryset(self, queryset):
+        entries = super().paginate_queryset(queryset)
+        selection = FieldSelection.from_request(self.request)
+        if not (selection.includes('film') and selection.is_expanded('film')):
+            return entries
+        films = FilmDetailSerializer.setup_eager_loading(
+            Film.objects.filter(id__in=[entry.film_id for entry in entries]), selection.nested('film')
+        )
+        films_by_id = {film.id: film for film in films}
+        for entry in entries:
+            entry.film = films_by_id[entry.film_id]
+        return entries
 
 
 class RegisterAPIView(CreateAPIView):
@@ -75,21 +221,240 @@ class LogoutAPIView(APIView):
         return Response(data={'message': 'User Logged out successfully!'}, status=status.HTTP_200_OK)
 
 
-class ProfileAPIView(RetrieveUpdateAPIView):
+class ProfileAPIView(ReplicaReadMixin, RetrieveUpdateAPIView):
+    """
+    User profile with the films lists visible to the requesting user.
+
+    Private lists are filtered out in SQL and every list carries only its first
+    `films_limit` films plus a link to the rest, so the query count doesn't
+    depend on the number of films. `?summary=1` returns film ids and names only.
+    """
     queryset = CustomUser.objects.all()
     serializer_class = ProfileSerializer
     lookup_url_kwarg = 'user_id'
+    films_limit_query_param = 'films_limit'
 
     def get_permissions(self):
         if self.request.method == 'GET':
             return [AllowAny(), ]
         return [IsCurrentUserByUserId(), ]
 
+    def is_summary(self):
+        return self.request.method == 'GET' and self.request.query_params.get('summary') in ('1', 'true')
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return ProfileSummarySerializer
+        return self.serializer_class
+
+    def get_object(self):
+        user = super().get_object()
+        selection = FieldSelection.from_request(self.request)
+        if not selection.includes('films_lists'):
+            return user
+        films_lists = FilmsList.objects.filter(user=user).annotate(films_count=Count('film')).order_by('id')
+        if self.request.user.id != user.id:
+            films_lists = films_lists.filter(private=False)
+        user.visible_films_lists = list(films_lists)
+        if not selection.is_expanded('films_lists'):
+            return user
+        if self.is_summary():
+            self.attach_summary_films(user.visible_films_lists)
+            return user
+        lists_selection = selection.nested('films_lists')
+        if lists_selection.includes('film') or lists_selection.includes('films_next'):
+            load_films = lists_selection.includes('film') and lists_selection.is_expanded('film')
+            self.attach_page_films(user.visible_films_lists, lists_selection.nested('film'), load_films)
+        return user
+
+    def get_films_limit(self):
+        return KeysetPagination.get_limit(self.request, self.films_limit_query_param)
+
+    def attach_page_films(self, films_lists, selection=None, load_films=True):
+        lists_by_id = {films_list.id: films_list for films_list in films_lists}
+        for films_list in films_lists:
+            films_list.page_films = []
+        if not films_lists:
+            return
+        through = FilmsList.film.through
+        first_films = (
+            through.objects.filter(filmslist_id=OuterRef('filmslist_id'))
+            .order_by('film_id').values('film_id')[:self.get_films_limit()]
+        )
+        rows = through.objects.filter(filmslist_id__in=lists_by_id, film_id__in=first_films).order_by(
+            'filmslist_id', 'film_id'
+        )
+        if not load_films:
+            for films_list_id, film_id in rows.values_list('filmslist_id', 'film_id'):
+                lists_by_id[films_list_id].page_films.append(Film(id=film_id))
+            return
+        select_related = [f'film__{name}' for name in FilmDetailSerializer.get_select_related(selection)]
+        rows = rows.select_related('film', *select_related)
+        only_fields = FilmDetailSerializer.get_only_fields(selection)
+        if only_fields is not None:
+            rows = rows.only('filmslist', 'film', *[f'film__{name}' for name in only_fields], *select_related)
+        for row in rows:
+            lists_by_id[row.filmslist_id].page_films.append(row.film)
+        films = [film for films_list in films_lists for film in films_list.page_films]
+        prefetch_related_objects(films, *FilmDetailSerializer.get_prefetch_lookups(selection))
+
+    @staticmethod
+    def attach_summary_films(films_lists):
+        lists_by_id = {films_list.id: films_list for films_list in films_lists}
+        for films_list in films_lists:
+            films_list.summary_films = []
+        if not films_lists:
+            return
+        rows = (
+            FilmsList.film.through.objects.filter(filmslist_id__in=lists_by_id)
+            .order_by('filmslist_id', 'film_id').values_list('filmslist_id', 'film_id', 'film__name')
+        )
+        for films_list_id, film_id, film_name in rows:
+            lists_by_id[films_list_id].summary_films.append({'id': film_id, 'name': film_name})
+
+
+class UserFilmsListFilmsAPIView(ListAPIView):
+    queryset = Film.objects.all()
+    serializer_class = FilmDetailSerializer
+    permission_classes = [AllowAny, ]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        films_list = get_object_or_404(
+            FilmsList.objects.only('id', 'user_id', 'private'),
+            id=self.kwargs.get('films_list_id'),
+            user_id=self.kwargs.get('user_id'),
+        )
+        if films_list.private and films_list.user_id != self.request.user.id:
+            raise Http404
+        queryset = self.queryset.filter(films_lists=films_list).order_by('id')
+        return FilmDetailSerializer.setup_eager_loading(queryset, FieldSelection.from_request(self.request))
+
+
+class ProfileStatsAPIView(RetrieveAPIView):
+    """
+    The current user's stats: a primary key read of their UserStats row, plus
+    the names of their `top_genres` most watched genres when those are selected.
+    """
+    queryset = UserStats.objects.all()
+    serializer_class = UserStatsSerializer
+    permission_classes = [IsCurrentUserByUserId, ]
+    lookup_url_kwarg = 'user_id'
+    top_genres_query_param = 'top_genres'
+    top_genres = 5
+
+    def get_object(self):
+        try:
+            stats = super().get_object()
+        except Http404:
+            # Users from before the stats existed, until backfill_user_stats reaches them
+            UserStats.recompute([self.request.user.id])
+            stats = super().get_object()
+        if FieldSelection.from_request(self.request).includes('top_genres'):
+            limit = KeysetPagination.get_limit(self.request, self.top_genres_query_param, self.top_genres)
+            stats.top_genres = self.get_top_genres(stats.genre_counts, limit)
+        return stats
+
+    @staticmethod
+    def get_top_genres(genre_counts, limit):
+        # JSON object keys are strings
+        counts = [(int(genre_id), count) for genre_id, count in genre_counts.items()]
+        top = sorted(counts, key=lambda item: (-item[1], item[0]))[:limit]
+        names = dict(Genre.objects.filter(id__in=[genre_id for genre_id, _ in top]).values_list('id', 'name'))
+        return [
+            {'id': genre_id, 'name': names[genre_id], 'watched_count': count}
+            for genre_id, count in top if genre_id in names
+        ]
+
+
+class ProfileRecommendationsAPIView(ListAPIView):
+    """Films recommended to the current user from the neighbours of the films they rated."""
+    queryset = Film.objects.all()
+    serializer_class = FilmDetailSerializer
+    permission_classes = [IsCurrentUserByUserId, ]
+    pagination_class = None
+    limit_query_param = 'limit'
+
+    def get_queryset(self):
+        film_ids = get_recommended_film_ids(
+            self.request.user, KeysetPagination.get_limit(self.request, self.limit_query_param)
+        )
+        films = FilmDetailSerializer.setup_eager_loading(
+            self.queryset.filter(id__in=film_ids), FieldSelection.from_request(self.request)
+        )
+        films_by_id = {film.id: film for film in films}
+        return [films_by_id[film_id] for film_id in film_ids if film_id in films_by_id]
+
+
+class FollowAPIView(APIView):
+    """Follow (POST) or unfollow (DELETE) the user `followee_id` as the current user."""
+    permission_classes = [IsCurrentUserByUserId, ]
+
+    def post(self, request, *args, **kwargs):
+        followee = get_object_or_404(CustomUser.objects.only('id'), id=self.kwargs.get('followee_id'))
+        if followee.id == request.user.id:
+            raise ValidationError({'message': 'Users can not follow themselves!'})
+        created = follow(request.user.id, followee.id)
+        return Response(
+            data={'message': f'User {followee.id} followed successfully!'},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    def delete(self, request, *args, **kwargs):
+        followee_id = self.kwargs.get('followee_id')
+        if unfollow(request.user.id, followee_id):
+            return Response(data={'message': f'User {followee_id} unfollowed successfully!'}, status=status.HTTP_200_OK)
+        return Response(data={'message': f'User {followee_id} is not followed!'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class FeedAPIView(GenericAPIView):
+    """
+    The current user's feed: the rates, comments and list moves of the users
+    they follow, newest first, read from their inbox (see main.feed) in
+    queries bounded by the page size.
+    """
+    queryset = ActivityEvent.objects.select_related('actor', 'film', 'comment').only(
+        'id', 'verb', 'value', 'created', 'actor__id', 'actor__username', 'film__id', 'film__name', 'comment__text',
+    )
+    serializer_class = ActivityEventSerializer
+    permission_classes = [IsAuthenticated, ]
+    pagination_class = MergedIdPagination
+
+    def get(self, request, *args, **kwargs):
+        page = self.paginator.paginate_ids(
+            lambda before_id, limit: get_feed_event_ids(request.user.id, before_id, limit), self.load_events, request
+        )
+        return self.paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def load_events(self, event_ids):
+        events = {event.id: event for event in self.get_queryset().filter(id__in=event_ids)}
+        return [events[event_id] for event_id in event_ids if event_id in events]
+
+
+class ProfileExportAPIView(APIView):
+    """
+    The current user's films lists, rates and comments streamed as JSONL, one
+    record per line, or gzip-compressed with `?gzip=1`.
+    """
+    permission_classes = [IsCurrentUserByUserId, ]
+
+    def get(self, request, *args, **kwargs):
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        response = StreamingHttpResponse(
+            iter_user_export(request.user.id, compress),
+            content_type='application/gzip' if compress else 'application/x-ndjson',
+        )
+        filename = f'iwatched-{request.user.id}{get_export_extension(compress)}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 
 class CommentCreateAPIView(CreateAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentCreateSerializer
     permission_classes = [AllowAny, ]
+    throttle_classes = [SlidingWindowThrottle, ]
+    throttle_scope = 'comment'
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -98,7 +463,9 @@ class CommentCreateAPIView(CreateAPIView):
         data['film'] = self.kwargs.get('film_id')
         serializer = self.get_serializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            comment = serializer.save()
+            if comment.author_id is not None:
+                record_event(comment.author_id, COMMENTED_VERB, comment.film_id, comment_id=comment.id)
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -107,7 +474,10 @@ class CreateUpdateRateAPIView(APIView):
     queryset = Rate.objects.all()
     serializer_class = RateSerializer
     permission_classes = [IsAuthenticated, ]
+    throttle_classes = [SlidingWindowThrottle, ]
+    throttle_scope = 'rate'
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         data = request.data.copy()
         data['user'] = request.user.id
@@ -118,41 +488,64 @@ class CreateUpdateRateAPIView(APIView):
             return Response(data={'message': 'More than one value!'}, status=status.HTTP_400_BAD_REQUEST)
         if rates_list:
             rate = rates_list.first()
+            old_value = rate.value
             serializer = self.serializer_class(rate, data={'value': data['value']}, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                rate = serializer.save()
+                if rate.value != old_value:
+                    record_event(rate.user_id, RATED_VERB, rate.film_id, value=rate.value)
                 return Response(data=serializer.data, status=status.HTTP_200_OK)
         if serializer.is_valid():
-            serializer.save()
+            rate = serializer.save()
+            record_event(rate.user_id, RATED_VERB, rate.film_id, value=rate.value)
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AddFilmToListAPIView(APIView):
+class FilmsListObjectMixin:
+    """
+    Resolve the films list and film of the URL once per request, so the
+    IsCurrentUserByFilmsListId permission and the view share a single query
+    each. Missing objects are a 404.
+    """
+    films_list_url_kwarg = 'films_list_id'
+    film_url_kwarg = 'film_id'
+
+    def get_films_list(self):
+        if not hasattr(self, '_films_list'):
+            self._films_list = get_object_or_404(
+                FilmsList.objects.only('id', 'type', 'user_id', 'private'),
+                id=self.kwargs.get(self.films_list_url_kwarg),
+            )
+        return self._films_list
+
+    def get_film(self):
+        if not hasattr(self, '_film'):
+            self._film = get_object_or_404(Film.objects.only('id'), id=self.kwargs.get(self.film_url_kwarg))
+        return self._film
+
+
+class AddFilmToListAPIView(FilmsListObjectMixin, APIView):
     queryset = Film.objects.all()
     permission_classes = [IsCurrentUserByFilmsListId, ]
 
-    def get_film_and_list(self, **kwargs):
-        film_id = kwargs.get('film_id')
-        films_list_id = kwargs.get('films_list_id')
-        film = get_object_or_404(self.queryset, id=film_id)
-        films_list = get_object_or_404(FilmsList, id=films_list_id)
-        return film, films_list
+    def get_film_and_list(self):
+        return self.get_film(), self.get_films_list()
 
     def post(self, request, *args, **kwargs):
-        film, films_list = self.get_film_and_list(**kwargs)
-        films_list.film.add(film)
-        user_lists = request.user.films_lists.all().exclude(id=films_list.id)
-        for user_list in user_lists:
-            user_list.film.remove(film)
+        film, films_list = self.get_film_and_list()
+        moved = FilmsList.move_films(films_list.user_id, {film.id: films_list.type})
+        # Moves into private lists, and adds of films already listed, stay out of the followers' feeds
+        if moved and not films_list.private:
+            record_event(films_list.user_id, LISTED_VERB, film.id, value=films_list.type)
         return Response(
             data={'message': f'Film {film.id} added to list {films_list.id} successfully!'},
             status=status.HTTP_200_OK
         )
 
     def delete(self, request, *args, **kwargs):
-        film, films_list = self.get_film_and_list(**kwargs)
-        if film in films_list.film.all():
+        film, films_list = self.get_film_and_list()
+        if films_list.film.filter(id=film.id).exists():
             films_list.film.remove(film)
             return Response(
                 data={'message': f'Film {film.id} removed from list {films_list.id} successfully!'},
@@ -164,8 +557,28 @@ class AddFilmToListAPIView(APIView):
         )
 
 
-class PrivateStatusAPIView(UpdateAPIView):
+class FilmsListsBatchAPIView(APIView):
+    """
+    Move many films across the current user's planned/watched/dropped lists
+    in one request and transaction, e.g. to sync a whole watch history.
+    A film ends up in the list it is given for and out of the others.
+    """
+    permission_classes = [IsCurrentUserByUserId, ]
+    serializer_class = FilmsListsBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        film_types = serializer.validated_data['film_types']
+        FilmsList.move_films(request.user.id, film_types)
+        return Response(data={'message': f'{len(film_types)} film(s) moved successfully!'}, status=status.HTTP_200_OK)
+
+
+class PrivateStatusAPIView(FilmsListObjectMixin, UpdateAPIView):
     queryset = FilmsList.objects.all()
     permission_classes = [IsCurrentUserByFilmsListId, ]
     serializer_class = UserFilmsListUpdateSerializer
     lookup_url_kwarg = 'films_list_id'
+
+    def get_object(self):
+        return self.get_films_list()
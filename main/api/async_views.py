@@ -0,0 +1,92 @@
+"""
+Async read endpoints for serving the hot read paths under ASGI (uvicorn, daphne).
+
+Under ASGI every sync view runs through asgiref's single thread-sensitive
+thread, so concurrent requests queue behind each other's queries. The async
+views here serve cached responses right on the event loop, and run the
+database work of a miss as one unit in a dedicated pool of
+`settings.ASYNC_DATABASE_THREADS` threads, each with its own connection.
+
+Django 4.0 has no async ORM (it arrives in 4.1), so the database work itself
+is the existing sync DRF view, forced to render JSON.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.renderers import JSONRenderer
+
+from main.api.api_views import FilmDetailAPIView, FilmsListAPIView, ProfileAPIView
+from main.api.cache import CachedResponseMixin, aget_cached_data
+from main.profiling import record_queries
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@lru_cache(maxsize=None)
+def get_database_executor(max_workers):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-db')
+
+
+def run_recorded(func, *args, **kwargs):
+    with record_queries():
+        return func(*args, **kwargs)
+
+
+def run_with_connection(func, *args, **kwargs):
+    # Pool threads outlive requests, so expire their connections like a request would
+    close_old_connections()
+    try:
+        return run_recorded(func, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def database_sync_to_async(func, *args, **kwargs):
+    """
+    Run `func` in the database thread pool. Without `ASYNC_DATABASE_THREADS`
+    it runs on asgiref's thread-sensitive thread, sharing the caller's connection.
+    """
+    threads = settings.ASYNC_DATABASE_THREADS
+    if not threads:
+        return await sync_to_async(run_recorded, thread_sensitive=True)(func, *args, **kwargs)
+    executor = get_database_executor(threads)
+    return await sync_to_async(run_with_connection, thread_sensitive=False, executor=executor)(func, *args, **kwargs)
+
+
+def render_sync_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    response.render()
+    return response
+
+
+def async_read_view(view_class):
+    """
+    Async view reading through `view_class`, a sync DRF view. Responses cached
+    by CachedResponseMixin views are served without leaving the event loop.
+    """
+    view = view_class.as_view(renderer_classes=[JSONRenderer])
+
+    async def async_view(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return HttpResponseNotAllowed(SAFE_METHODS)
+        if request.method == 'GET' and issubclass(view_class, CachedResponseMixin):
+            cached_view = view_class(kwargs=kwargs)
+            data = await aget_cached_data(request, cached_view.get_cache_version_keys())
+            if data is not None:
+                response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+                response['X-Cache'] = 'HIT'
+                return response
+        return await database_sync_to_async(render_sync_view, view, request, *args, **kwargs)
+
+    async_view.__name__ = async_view.__qualname__ = f'Async{view_class.__name__}'
+    async_view.__doc__ = view_class.__doc__
+    return async_view
+
+
+films_list = async_read_view(FilmsListAPIView)
+film_detail = async_read_view(FilmDetailAPIView)
+profile = async_read_view(ProfileAPIView)
@@ -0,0 +1,190 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from main.profiling import count
+
+SHARED_TOKEN_KEY = 'api:token:{}'
+REVOKED_TOKEN_KEY = 'api:token:{}:revoked'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def get_token_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = sum(stats.values())
+    stats['hit_rate'] = (stats['hits'] + stats['shared_hits']) / lookups if lookups else None
+    return stats
+
+
+def reset_token_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _record(name):
+    with _stats_lock:
+        _stats[name] += 1
+    # Per request too, so the hit rate of every process shows in the main.profiling records
+    count(f'token_cache_{name}')
+
+
+class TokenCache:
+    """Size-bounded LRU of token key -> (token with its user, time it was cached), entries expiring after a timeout."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            token, cached_at, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return token, cached_at
+
+    def set(self, key, token, timeout):
+        with self._lock:
+            self._entries[key] = (token, time.time(), time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.API_TOKEN_CACHE_SIZE)
+
+
+def get_shared_cache():
+    alias = settings.API_TOKEN_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def get_local_timeout():
+    # Without a shared cache other processes can't learn of a revocation, so they only keep tokens briefly
+    if get_shared_cache() is None:
+        return settings.API_TOKEN_LOCAL_CACHE_TIMEOUT
+    return settings.API_TOKEN_CACHE_TIMEOUT
+
+
+def hash_key(key):
+    # Raw token keys are credentials, so they never become cache keys
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def get_shared_key(key):
+    return SHARED_TOKEN_KEY.format(hash_key(key))
+
+
+def get_revoked_key(key):
+    return REVOKED_TOKEN_KEY.format(hash_key(key))
+
+
+def _forget_tokens(keys):
+    shared_cache = get_shared_cache()
+    for key in keys:
+        token_cache.delete(key)
+    if shared_cache is not None:
+        shared_cache.delete_many([get_shared_key(key) for key in keys])
+        # Outlives every in-process entry cached before now, see CachedTokenAuthentication
+        revoked_at = time.time()
+        shared_cache.set_many({get_revoked_key(key): revoked_at for key in keys}, settings.API_TOKEN_CACHE_TIMEOUT)
+
+
+def invalidate_tokens(keys):
+    """
+    Forget the given tokens, now and again once the current transaction
+    commits, so a request racing with the write can't cache them back.
+    Other processes drop them from their in-process tier on their next use
+    with a shared cache, and on expiry without one.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    _forget_tokens(keys)
+    transaction.on_commit(lambda: _forget_tokens(keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    `TokenAuthentication` that resolves tokens from an in-process LRU, then
+    from the optional `settings.API_TOKEN_SHARED_CACHE`, before querying the
+    token and its user. main.signals invalidates the cached tokens on logout,
+    password change and deactivation of a saved user; queryset updates of
+    `is_active` or `password` must call `invalidate_tokens()` themselves.
+
+    With a shared cache, an in-process hit also reads the token's revocation
+    time there, so a token revoked by another process is dropped at once.
+    Without one, other processes keep accepting a revoked token for up to
+    `settings.API_TOKEN_LOCAL_CACHE_TIMEOUT` seconds.
+    """
+
+    def authenticate_credentials(self, key):
+        token, cached_at = token_cache.get(key)
+        if token is not None and self.is_revoked(key, cached_at):
+            token_cache.delete(key)
+            token = None
+        if token is not None:
+            _record('hits')
+        else:
+            token = self.get_shared_token(key)
+            if token is None:
+                _record('misses')
+                user, token = super().authenticate_credentials(key)
+                self.set_shared_token(key, token)
+            token_cache.set(key, token, get_local_timeout())
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # Requests may cache relations on their user, so each one gets its own copies
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
+
+    @staticmethod
+    def is_revoked(key, cached_at):
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return False
+        revoked_at = shared_cache.get(get_revoked_key(key))
+        return revoked_at is not None and revoked_at >= cached_at
+
+    @staticmethod
+    def get_shared_token(key):
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return None
+        token = shared_cache.get(get_shared_key(key))
+        if token is not None:
+            _record('shared_hits')
+        return token
+
+    @staticmethod
+    def set_shared_token(key, token):
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.set(get_shared_key(key), token, settings.API_TOKEN_CACHE_TIMEOUT)
@@ -0,0 +1,144 @@
+"""
+Versioned response cache of the films list and detail, see CachedResponseMixin.
+
+Every film detail is stored under its own version key, and every films list
+page under the single catalogue version key. A page can't tell which films
+it holds (it depends on the filters, the ordering and the cursor), and a
+rating or comment count change can move a film across pages of the rating
+ordering, so any change to a field the list shows evicts every cached page.
+Changes only the detail shows, such as comment edits in `latest_comments`,
+evict just the film's detail.
+
+Hits and misses are counted per process (`get_cache_stats()`) and per request
+in the main.profiling log records and Server-Timing header, from which the hit
+rate of a deployment can be aggregated.
+"""
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from main.profiling import count
+from main.routers import get_routing_state
+
+CATALOGUE_VERSION_KEY = 'api:catalogue:version'
+FILM_VERSION_KEY = 'api:film:{}:version'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _record(name):
+    with _stats_lock:
+        _stats[name] += 1
+    count(f'response_cache_{name}')
+
+
+def get_version(key):
+    # A fresh version starts from the current time, so a version key evicted
+    # from the cache never brings back entries stored under an older value.
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def _bump_versions(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_versions(keys):
+    """
+    Invalidate every response stored under the given version keys, now and
+    again once the current transaction commits, so a read racing with the
+    write can't keep a stale entry under the new version.
+    """
+    keys = list(keys)
+    _bump_versions(keys)
+    transaction.on_commit(lambda: _bump_versions(keys))
+
+
+def invalidate_films(film_ids, catalogue=True):
+    """Evict the cached detail of the given films and, unless only detail fields changed, every films list."""
+    film_keys = [FILM_VERSION_KEY.format(film_id) for film_id in set(film_ids)]
+    bump_versions([CATALOGUE_VERSION_KEY, *film_keys] if catalogue else film_keys)
+
+
+def build_cache_key(request, versions):
+    # GET works for both Django and DRF requests, so async views share the keys
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    raw = f'{request.get_host()}{request.path}?{query}|{":".join(map(str, versions))}'
+    return 'api:response:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+async def aget_cached_data(request, version_keys):
+    """
+    Cached response data for an async view, None on a miss (left for the sync
+    view to record and fill). In-process backends are read right on the event
+    loop since they never block; others go through the async cache API.
+    """
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        data = cache.get(build_cache_key(request, [get_version(key) for key in version_keys]))
+    else:
+        versions = []
+        for key in version_keys:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions.append(await cache.aget(key))
+        data = await cache.aget(build_cache_key(request, versions))
+    if data is not None:
+        _record('hits')
+    return data
+
+
+class CachedResponseMixin:
+    """
+    Serve successful GET responses from Django's cache.
+
+    Entries are keyed by host, path, query params and the versions returned
+    by `get_cache_version_keys()`; bumping a version (see main.signals) makes
+    the entries stored under it unreachable. Only responses read from the
+    primary are stored: one read from a lagging replica could hold data older
+    than its version, and serve it to the users pinned to the primary.
+    """
+    cache_timeout = settings.API_RESPONSE_CACHE_TIMEOUT
+
+    def get_cache_version_keys(self):
+        return [CATALOGUE_VERSION_KEY]
+
+    def get(self, request, *args, **kwargs):
+        versions = [get_version(key) for key in self.get_cache_version_keys()]
+        key = build_cache_key(request, versions)
+        data = cache.get(key)
+        if data is not None:
+            _record('hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        _record('misses')
+        response = super().get(request, *args, **kwargs)
+        state = get_routing_state()
+        if response.status_code == status.HTTP_200_OK and (state is None or state.read_alias is None):
+            cache.set(key, response.data, self.cache_timeout)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,109 @@
+from rest_framework import serializers
+
+from main.profiling import timed
+
+
+def parse_field_paths(value):
+    """Turn 'id,film.id,film.name' into {'id': {}, 'film': {'id': {}, 'name': {}}}."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSelection:
+    """
+    Fields requested with `?fields=` and relations requested with `?expand=`, both as dotted paths.
+
+    Without `?fields=` everything is rendered in full. With it only the listed
+    fields are rendered, and nested relations collapse to primary keys unless
+    they are listed in `?expand=` or some of their own fields are selected
+    (`?fields=franchise.name`).
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields or None
+        self.expand = expand or {}
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return cls()
+        fields = parse_field_paths(request.query_params.get(cls.fields_query_param, ''))
+        expand = parse_field_paths(request.query_params.get(cls.expand_query_param, ''))
+        return cls(fields, expand)
+
+    @property
+    def is_restricted(self):
+        return self.fields is not None
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def is_expanded(self, name):
+        return self.fields is None or name in self.expand or bool(self.fields.get(name))
+
+    def nested(self, name):
+        """Selection for the nested serializer rendered under `name`."""
+        return FieldSelection(None if self.fields is None else self.fields.get(name), self.expand.get(name))
+
+
+class SparseFieldsetMixin:
+    """
+    Drop the fields a GET request didn't ask for and collapse unexpanded nested
+    serializers to primary keys, according to the request's FieldSelection.
+    Views use the same selection to trim their querysets. Only read serializers
+    use it; create and update responses are always rendered in full.
+
+    Rendering the outermost serializer is timed as the request's `serialize` timing.
+    """
+
+    def is_outermost(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def to_representation(self, instance):
+        if not self.is_outermost():
+            return super().to_representation(instance)
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return reversed(path)
+
+    def get_field_selection(self):
+        selection = FieldSelection.from_request(self.context.get('request'))
+        for name in self.get_field_path():
+            selection = selection.nested(name)
+        return selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_field_selection()
+        if not selection.is_restricted:
+            return fields
+        for name, field in list(fields.items()):
+            if field.write_only:
+                continue
+            if not selection.includes(name):
+                del fields[name]
+            elif isinstance(field, serializers.BaseSerializer) and not selection.is_expanded(name):
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True,
+                    source=field.source,
+                    many=isinstance(field, serializers.ListSerializer),
+                )
+        return fields
@@ -0,0 +1,60 @@
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from main.models import Film, Genre
+
+
+class FieldMapOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that translates public ordering names into model fields
+    using the view's `ordering_fields_map`, e.g. {'film_rating': 'rating_avg'}.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        fields_map = getattr(view, 'ordering_fields_map', {})
+        mapped = []
+        for term in ordering:
+            descending = term.startswith('-')
+            field = fields_map.get(term.lstrip('-'), term.lstrip('-'))
+            mapped.append(f'-{field}' if descending else field)
+        return mapped
+
+
+class GenreFilter(BaseFilterBackend):
+    """
+    Filter films by `?genre=a,b,c`, matching all of the genres (`match=all`, default) or any of them (`match=any`).
+
+    Genre names are resolved to ids with one indexed lookup, then films are
+    selected with a single GROUP BY/HAVING subquery on the film-genre table,
+    so the cost doesn't grow with the number of requested genres.
+    """
+    genre_query_param = 'genre'
+    match_query_param = 'match'
+    match_choices = ('all', 'any')
+
+    def filter_queryset(self, request, queryset, view):
+        names = {name.strip() for name in request.query_params.get(self.genre_query_param, '').split(',')}
+        names.discard('')
+        if not names:
+            return queryset
+        match = request.query_params.get(self.match_query_param, 'all')
+        if match not in self.match_choices:
+            raise ValidationError({self.match_query_param: f'Must be one of: {", ".join(self.match_choices)}.'})
+
+        genres = dict(Genre.objects.filter(name__in=names).values_list('id', 'name'))
+        found_names = set(genres.values())
+        if not found_names or (match == 'all' and found_names != names):
+            return queryset.none()
+
+        film_genres = Film.genre.through.objects.filter(genre_id__in=genres)
+        if match == 'all':
+            film_genres = (
+                film_genres.values('film_id')
+                .annotate(matched=Count('genre__name', distinct=True))
+                .filter(matched=len(names))
+            )
+        return queryset.filter(id__in=film_genres.values('film_id'))
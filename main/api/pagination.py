@@ -0,0 +1,251 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def table_row_estimate(model, using):
+    """Row count of the model's table from planner statistics, or None when the backend has none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+def approximate_count(queryset):
+    """Cheap total for a queryset: table statistics when unfiltered, COUNT(*) otherwise."""
+    if not queryset.query.where:
+        estimate = table_row_estimate(queryset.model, queryset.db)
+        if estimate is not None:
+            return estimate
+    return queryset.count()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (ordering value, id).
+
+    Every page is fetched with a WHERE clause on the position of the last seen
+    row instead of an OFFSET, so deep pages cost the same as the first one and
+    no COUNT(*) is issued. NULL ordering values sort as the smallest ones.
+    A total is only returned on request (`?with_total=1`) and is approximate
+    for unfiltered querysets.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    total_query_param = 'with_total'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.cursor = self.decode_cursor(request, queryset)
+        self.total = None
+        if request.query_params.get(self.total_query_param):
+            self.total = approximate_count(queryset)
+
+        reverse = self.cursor is not None and self.cursor['reverse']
+        ordering = [(field, descending != reverse) for field, descending in self.ordering]
+        queryset = self.load_ordering_fields(queryset)
+        queryset = queryset.order_by(*[self.get_order_expression(field, descending) for field, descending in ordering])
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, self.cursor['position']))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.total is not None:
+            response['total'] = self.total
+        response['results'] = data
+        return Response(response)
+
+    @classmethod
+    def get_limit(cls, request, query_param, default=None):
+        """Page size read from `query_param`, bounded like regular pages."""
+        paginator = cls()
+        paginator.page_size_query_param = query_param
+        if default is not None:
+            paginator.page_size = default
+        return paginator.get_page_size(request)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    @staticmethod
+    def get_ordering(queryset):
+        pk_name = queryset.model._meta.pk.attname
+        ordering = []
+        for term in queryset.query.order_by or queryset.model._meta.ordering:
+            descending = term.startswith('-')
+            field = term.lstrip('-')
+            ordering.append((pk_name if field == 'pk' else field, descending))
+        if pk_name not in [field for field, _ in ordering]:
+            ordering.append((pk_name, ordering[-1][1] if ordering else False))
+        return ordering
+
+    def load_ordering_fields(self, queryset):
+        """Make sure only()/defer() don't defer the fields cursors are built from."""
+        field_names, defer = queryset.query.deferred_loading
+        model_fields = {field.attname for field in queryset.model._meta.concrete_fields}
+        ordering_fields = {field for field, _ in self.ordering} & model_fields
+        if not defer:
+            return queryset.only(*field_names, *ordering_fields)
+        if field_names & ordering_fields:
+            return queryset.defer(None).defer(*(field_names - ordering_fields))
+        return queryset
+
+    @staticmethod
+    def get_order_expression(field, descending):
+        if descending:
+            return F(field).desc(nulls_last=True)
+        return F(field).asc(nulls_first=True)
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        """Rows strictly after `position` in `ordering`, compared lexicographically."""
+        conditions = []
+        equal = Q()
+        for (field, descending), value in zip(ordering, position):
+            if value is None:
+                if not descending:
+                    conditions.append(equal & Q(**{f'{field}__isnull': False}))
+                equal &= Q(**{f'{field}__isnull': True})
+            else:
+                beyond = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+                if descending:
+                    beyond |= Q(**{f'{field}__isnull': True})
+                conditions.append(equal & beyond)
+                equal &= Q(**{field: value})
+        return reduce(or_, conditions) if conditions else Q(pk__in=[])
+
+    def get_position(self, instance):
+        return [getattr(instance, field) for field, _ in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+        return self.encode_cursor(self.cursor['position'], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+        return self.encode_cursor(self.cursor['position'], reverse=True)
+
+    @staticmethod
+    def get_output_field(queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, request, queryset=None):
+        """The cursor of the request, its position values converted to the types of the `queryset` ordering fields."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = cursor['p'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if queryset is not None:
+            # A tampered value would otherwise fail in the position filter's lookups, as a server error
+            try:
+                position = [
+                    None if value is None else self.get_output_field(queryset, field).to_python(value)
+                    for (field, _), value in zip(self.ordering, position)
+                ]
+            except (TypeError, ValueError, ValidationError, FieldDoesNotExist):
+                raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'reverse': reverse}
+
+    def encode_cursor(self, position, reverse):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.build_cursor(position, reverse))
+
+    @staticmethod
+    def build_cursor(position, reverse=False):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=str, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+class MergedIdPagination(KeysetPagination):
+    """
+    Newest first pages of objects whose ids are merged from several sources,
+    e.g. feed inboxes and pulled events. `fetch_ids(before_id, limit)` returns
+    the ids of a page and `load(ids)` the objects in that order. Cursors hold
+    the last id and only lead to the next page.
+    """
+
+    def paginate_ids(self, fetch_ids, load, request):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = [('id', True)]
+        self.cursor = self.decode_cursor(request)
+        self.total = None
+        before_id = None
+        if self.cursor is not None:
+            before_id = self.cursor['position'][0]
+            if self.cursor['reverse'] or not isinstance(before_id, int):
+                raise NotFound(self.invalid_cursor_message)
+        ids = fetch_ids(before_id, self.page_size + 1)
+        self.has_next, self.has_previous = len(ids) > self.page_size, False
+        self.page_ids = ids[:self.page_size]
+        self.page = load(self.page_ids)
+        return self.page
+
+    def get_next_link(self):
+        # Rows deleted since their ids were read are missing from the page, not from the ids
+        if not self.has_next:
+            return None
+        return self.encode_cursor([self.page_ids[-1]], reverse=False)
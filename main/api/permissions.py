@@ -1,7 +1,5 @@
 from rest_framework.permissions import BasePermission
 
-from main.models import FilmsList
-
 
 class IsAnonymousUser(BasePermission):
 
@@ -17,8 +15,9 @@ class IsCurrentUserByUserId(BasePermission):
 
 
 class IsCurrentUserByFilmsListId(BasePermission):
+    """Owner of the films list resolved by the view's `get_films_list()`, see FilmsListObjectMixin."""
 
     def has_permission(self, request, view):
-        films_list_user = FilmsList.objects.get(id=view.kwargs.get('films_list_id')).user
-        is_current_user_by_films_list_id = films_list_user == request.user
-        return request.user.is_authenticated and is_current_user_by_films_list_id
+        if not request.user.is_authenticated:
+            return False
+        return view.get_films_list().user_id == request.user.id
@@ -0,0 +1,32 @@
+from django.db import DatabaseError
+from rest_framework.permissions import SAFE_METHODS
+
+from main.routers import get_routing_state, is_pinned_to_primary, replica_pool
+
+
+class ReplicaReadMixin:
+    """
+    Serve safe-method requests from a healthy read replica, see main.routers,
+    unless the user is pinned to the primary after a recent write. A request
+    failing on its replica is retried once on the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        state = get_routing_state()
+        if state is not None and request.method in SAFE_METHODS and not getattr(self, '_skip_replicas', False):
+            user = request.user
+            if not (user.is_authenticated and is_pinned_to_primary(user.id)):
+                state.read_alias = replica_pool.choose()
+        super().initial(request, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except DatabaseError:
+            state = get_routing_state()
+            if state is None or state.read_alias is None:
+                raise
+            replica_pool.mark_unhealthy(state.read_alias)
+            state.read_alias = None
+            self._skip_replicas = True
+            return super().dispatch(request, *args, **kwargs)
@@ -1,35 +1,123 @@
+from urllib.parse import urlencode
+
 from django.contrib.auth.password_validation import validate_password
+from django.db.models import Prefetch
+from django.urls import reverse
 from rest_framework import serializers
 
-from main.models import Film, FilmsList, CustomUser, Comment, Franchise, Genre, Rate
-
-
-class FranchiseSerializer(serializers.ModelSerializer):
+from main.api.fieldsets import FieldSelection, SparseFieldsetMixin
+from main.api.pagination import KeysetPagination
+from main.constants import FILM_LIST_TYPES
+from main.models import (
+    ActivityEvent,
+    Film,
+    FilmsList,
+    CustomUser,
+    Comment,
+    Franchise,
+    Genre,
+    LeaderboardEntry,
+    Rate,
+    UserStats,
+)
+from main.posters import get_thumbnail_urls
+
+
+class FranchiseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Franchise
         fields = ['name', ]
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['name', ]
 
 
-class FilmDetailSerializer(serializers.ModelSerializer):
+class FilmDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     franchise = FranchiseSerializer()
     genre = GenreSerializer(many=True)
     rating = serializers.SerializerMethodField()
     franchise_films = serializers.SerializerMethodField()
+    poster_thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Film
-        fields = ['id', 'name', 'synopsis', 'genre', 'poster', 'release_date', 'franchise', 'franchise_films', 'rating']
+        fields = [
+            'id', 'name', 'synopsis', 'genre', 'poster', 'poster_thumbnails', 'release_date', 'franchise',
+            'franchise_films', 'rating', 'comment_count',
+        ]
+
+    # Film columns each field reads, used to trim queries for sparse fieldsets
+    field_columns = {
+        'id': ['id'],
+        'name': ['name'],
+        'synopsis': ['synopsis'],
+        'genre': [],
+        'poster': ['poster'],
+        'poster_thumbnails': ['poster_hash'],
+        'release_date': ['release_date'],
+        'franchise': ['franchise'],
+        'franchise_films': ['franchise'],
+        'rating': ['rating_avg'],
+        'comment_count': ['comment_count'],
+    }
+
+    @classmethod
+    def get_only_fields(cls, selection=None):
+        """Columns to load for the selected fields, or None to load them all."""
+        if selection is None or not selection.is_restricted:
+            return None
+        columns = {'id'}
+        for name, field_columns in cls.field_columns.items():
+            if selection.includes(name):
+                columns.update(field_columns)
+        return sorted(columns)
+
+    @staticmethod
+    def get_select_related(selection=None):
+        selection = selection or FieldSelection()
+        if selection.includes('franchise') and selection.is_expanded('franchise'):
+            return ['franchise']
+        return []
+
+    @staticmethod
+    def get_prefetch_lookups(selection=None):
+        selection = selection or FieldSelection()
+        lookups = []
+        if selection.includes('genre'):
+            genres = Genre.objects.all() if selection.is_expanded('genre') else Genre.objects.only('id')
+            lookups.append(Prefetch('genre', queryset=genres))
+        if selection.includes('franchise_films'):
+            franchise_films = Film.objects.only('id', 'name', 'franchise').order_by('id')
+            lookups.append(Prefetch('franchise__films', queryset=franchise_films))
+        return lookups
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, selection=None):
+        """
+        Load everything the serializer reads in a fixed number of queries, whatever
+        the number of films, leaving out columns and relations that `selection` drops.
+        """
+        only_fields = cls.get_only_fields(selection)
+        if only_fields is not None:
+            queryset = queryset.only(*only_fields)
+        return queryset.select_related(*cls.get_select_related(selection)).prefetch_related(
+            *cls.get_prefetch_lookups(selection)
+        )
 
     def get_rating(self, film):
         if film.rating:
             return round(film.rating, 1)
 
+    def get_poster_thumbnails(self, film):
+        urls = get_thumbnail_urls(film.poster_hash)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {size_name: request.build_absolute_uri(url) for size_name, url in urls.items()}
+
     def get_franchise_films(self, obj):
         if obj.franchise:
             franchise_films = {}
@@ -38,21 +126,90 @@ class FilmDetailSerializer(serializers.ModelSerializer):
             return franchise_films
 
 
-class FilteredUserFilmsListSerializer(serializers.ListSerializer):
-    def to_representation(self, data):
-        if self.context['request'].user.id == self.context.get('view').kwargs.get('user_id'):
-            return super(FilteredUserFilmsListSerializer, self).to_representation(data)
-        data = data.filter(private=False)
-        return super(FilteredUserFilmsListSerializer,  self).to_representation(data)
+class CommentAuthorSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username']
+
+
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    author = CommentAuthorSerializer(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'film', 'author', 'text', 'date']
+
+
+class FilmWithCommentsSerializer(FilmDetailSerializer):
+    """Film detail with the film's newest comments (`latest_comments`), attached by FilmDetailAPIView."""
+    latest_comments = CommentSerializer(many=True, read_only=True)
+
+    class Meta(FilmDetailSerializer.Meta):
+        fields = [*FilmDetailSerializer.Meta.fields, 'latest_comments']
+
+
+class LeaderboardEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """A film of a leaderboard and its `score` on the board, see LeaderboardAPIView."""
+    film = FilmDetailSerializer(read_only=True)
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['film', 'score']
+
+    def get_score(self, entry):
+        return getattr(entry, self.context['view'].get_score_field())
+
+
+class FilmSummarySerializer(SparseFieldsetMixin, serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class ActivityEventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """A feed event: `value` is the rate value or the list type, `comment` the comment text."""
+    actor = CommentAuthorSerializer(read_only=True)
+    verb = serializers.CharField(source='get_verb_display', read_only=True)
+    film = FilmSummarySerializer(read_only=True)
+    comment = serializers.CharField(source='comment.text', default=None, read_only=True)
+
+    class Meta:
+        model = ActivityEvent
+        fields = ['id', 'actor', 'verb', 'film', 'value', 'comment', 'created']
+
+
+class UserFilmsListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    A films list with the first page of its films (`page_films`) and the
+    total `films_count`, both attached by ProfileAPIView. `films_next` links
+    to the list's films endpoint for the following pages.
+    """
+    film = FilmDetailSerializer(many=True, required=False, source='page_films')
+    films_count = serializers.IntegerField(read_only=True)
+    films_next = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FilmsList
+        fields = ['id', 'type', 'user', 'film', 'private', 'films_count', 'films_next']
 
+    def get_films_next(self, films_list):
+        if films_list.films_count <= len(films_list.page_films):
+            return None
+        url = reverse('films_list_films', kwargs={'user_id': films_list.user_id, 'films_list_id': films_list.id})
+        query = urlencode({
+            'cursor': KeysetPagination.build_cursor([films_list.page_films[-1].id]),
+            'page_size': len(films_list.page_films),
+        })
+        return self.context['request'].build_absolute_uri(f'{url}?{query}')
 
-class UserFilmsListSerializer(serializers.ModelSerializer):
-    film = FilmDetailSerializer(many=True, required=False)
+
+class UserFilmsListSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    film = FilmSummarySerializer(many=True, read_only=True, source='summary_films')
+    films_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = FilmsList
-        list_serializer_class = FilteredUserFilmsListSerializer
-        fields = ['id', 'type', 'user', 'film', 'private']
+        fields = ['id', 'type', 'film', 'private', 'films_count']
 
 
 class UserFilmsListUpdateSerializer(serializers.ModelSerializer):
@@ -60,9 +217,35 @@ class UserFilmsListUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = FilmsList
         fields = ['id', 'type', 'user', 'private']
+        # Only the private flag is updatable; this also skips the (user, type) uniqueness lookups
+        read_only_fields = ['type', 'user']
+
+
+class FilmsListsBatchSerializer(serializers.Serializer):
+    """Film ids to move into each of the user's lists, e.g. `{"watched": [1, 2], "planned": [3]}`."""
+    max_films = 10000
+
+    planned = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=max_films)
+    watched = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=max_films)
+    dropped = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=max_films)
+
+    def validate(self, attrs):
+        film_types = {}
+        for list_type, name in FILM_LIST_TYPES:
+            for film_id in attrs.get(name, []):
+                if film_types.setdefault(film_id, list_type) != list_type:
+                    raise serializers.ValidationError({name: f'Film {film_id} is listed for more than one list.'})
+        if len(film_types) > self.max_films:
+            raise serializers.ValidationError(f'Ensure there are no more than {self.max_films} films.')
+        found = set(Film.objects.filter(id__in=film_types).values_list('id', flat=True))
+        missing = sorted(set(film_types) - found)
+        if missing:
+            raise serializers.ValidationError({'films': f'Films not found: {missing}.'})
+        attrs['film_types'] = film_types
+        return attrs
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
@@ -102,9 +285,38 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     email = serializers.CharField(required=False)
-    films_lists = UserFilmsListSerializer(read_only=True, many=True)
+    films_lists = UserFilmsListSerializer(read_only=True, many=True, source='visible_films_lists')
+
+    class Meta:
+        model = CustomUser
+        fields = ['email', 'first_name', 'last_name', 'films_lists']
+
+
+class UserStatsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    A user's stats: `genre_counts` maps genre ids to watched films, and
+    `top_genres` (attached by ProfileStatsAPIView) names the most watched ones.
+    """
+    rating_avg = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+    top_genres = serializers.ListField(child=serializers.DictField(), read_only=True)
+
+    class Meta:
+        model = UserStats
+        fields = [
+            'planned_count', 'watched_count', 'dropped_count', 'rating_count', 'rating_avg', 'rating_histogram',
+            'genre_counts', 'top_genres', 'follower_count', 'following_count',
+        ]
+
+    def get_rating_avg(self, stats):
+        if stats.rating_avg is not None:
+            return round(stats.rating_avg, 2)
+
+
+class ProfileSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    films_lists = UserFilmsListSummarySerializer(read_only=True, many=True, source='visible_films_lists')
 
     class Meta:
         model = CustomUser
@@ -0,0 +1,139 @@
+"""
+Write throttling with sliding-window counters, see SlidingWindowThrottle.
+
+A sliding-window counter approximates the requests of the last `period`
+seconds from the counts of the current and the previous fixed windows, the
+previous one weighted by how much of it the sliding window still covers. It
+needs two integers per client instead of a log of timestamps, and unlike a
+fixed window it doesn't let a client burst twice the limit across a window
+boundary.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+SHARED_THROTTLE_KEY = 'api:throttle:{}:{}'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'<requests>/<period>' with a period in seconds, minutes, hours or days, e.g. '20/min' -> (20, 60)."""
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period[0]]
+
+
+def get_wait(current, previous, limit, period, elapsed):
+    """
+    Seconds until one more request fits in the sliding window, or None if it
+    fits now. `current` and `previous` are the counts of the current window,
+    started `elapsed` seconds ago, and of the previous one.
+    """
+    weight = (period - elapsed) / period
+    if previous * weight + current + 1 <= limit:
+        return None
+    if current + 1 > limit:
+        # Only fits once the current window became the previous one and slid far enough
+        return period - elapsed + period * max(0.0, 1 - (limit - 1) / current)
+    # The previous window's weight has to drop to (limit - 1 - current) / previous
+    return period * (1 - (limit - 1 - current) / previous) - elapsed
+
+
+def get_window(now, period):
+    """Index of the fixed window containing `now`, and the seconds elapsed since it started."""
+    window = int(now // period)
+    return window, now - window * period
+
+
+class LocalWindowCounter:
+    """Size-bounded LRU of key -> (window, current count, previous count) in process memory."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period, now):
+        """Count a request of `key` if it's within `limit` per `period` seconds, else return the wait."""
+        window, elapsed = get_window(now, period)
+        with self._lock:
+            stored_window, current, previous = self._windows.get(key, (window, 0, 0))
+            if stored_window == window - 1:
+                current, previous = 0, current
+            elif stored_window != window:
+                current, previous = 0, 0
+            wait = get_wait(current, previous, limit, period, elapsed)
+            if wait is None:
+                current += 1
+            self._windows[key] = (window, current, previous)
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+
+class SharedWindowCounter:
+    """Counters of the current and previous windows kept in a cache shared between processes."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def hit(self, key, limit, period, now):
+        cache = caches[self.alias]
+        window, elapsed = get_window(now, period)
+        current_key = SHARED_THROTTLE_KEY.format(key, window)
+        counts = cache.get_many([current_key, SHARED_THROTTLE_KEY.format(key, window - 1)])
+        current = counts.get(current_key, 0)
+        previous = sum(counts.values()) - current
+        wait = get_wait(current, previous, limit, period, elapsed)
+        if wait is None:
+            # Concurrent requests may both pass the check: the limit is approximate across processes
+            if not cache.add(current_key, 1, period * 2):
+                cache.incr(current_key)
+        return wait
+
+
+local_counter = LocalWindowCounter(settings.API_THROTTLE_MAX_KEYS)
+
+
+def get_counter():
+    alias = settings.API_THROTTLE_SHARED_CACHE
+    return SharedWindowCounter(alias) if alias else local_counter
+
+
+def reset_throttles():
+    """Forget the in-process counters, e.g. between tests and benchmark requests."""
+    local_counter.clear()
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Limit the requests of a view's `throttle_scope` to the rates of
+    `settings.API_THROTTLE_RATES[scope]`: `'user'` per authenticated user and
+    `'anon'` per client IP, as REST_FRAMEWORK['NUM_PROXIES'] resolves it.
+    Rejections are a 429 with Retry-After, raised by DRF before the handler
+    runs, so they cost no database work.
+    """
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        rates = settings.API_THROTTLE_RATES.get(getattr(view, 'throttle_scope', None), {})
+        is_authenticated = request.user is not None and request.user.is_authenticated
+        kind = 'user' if is_authenticated else 'anon'
+        if kind not in rates:
+            return True
+        limit, period = parse_rate(rates[kind])
+        ident = request.user.pk if is_authenticated else self.get_ident(request)
+        self.wait_seconds = get_counter().hit(f'{view.throttle_scope}:{kind}:{ident}', limit, period, time.time())
+        return self.wait_seconds is None
+
+    def wait(self):
+        return math.ceil(self.wait_seconds) if self.wait_seconds is not None else None
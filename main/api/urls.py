@@ -1,27 +1,68 @@
 from django.urls import path
 from rest_framework.authtoken.views import ObtainAuthToken
 
+from main.api import async_views
 from main.api.api_views import (
     FilmsListAPIView,
     FilmDetailAPIView,
+    FilmCommentsAPIView,
+    FilmSearchAPIView,
+    FilmSimilarAPIView,
+    LeaderboardAPIView,
     RegisterAPIView,
     LogoutAPIView,
+    FeedAPIView,
+    FollowAPIView,
     ProfileAPIView,
+    ProfileRecommendationsAPIView,
+    ProfileStatsAPIView,
+    ProfileExportAPIView,
+    UserFilmsListFilmsAPIView,
+    FilmsListsBatchAPIView,
     CommentCreateAPIView,
     CreateUpdateRateAPIView,
     AddFilmToListAPIView,
     PrivateStatusAPIView,
 )
+from main.constants import LEADERBOARD_FRANCHISE, LEADERBOARD_GENRE
 
 urlpatterns = [
     path('films/', FilmsListAPIView.as_view(), name='films'),
+    path('films/search', FilmSearchAPIView.as_view(), name='film_search'),
     path('films/<int:film_id>/', FilmDetailAPIView.as_view(), name='film'),
+    path('films/<int:film_id>/similar', FilmSimilarAPIView.as_view(), name='similar'),
+    path('films/<int:film_id>/comments', FilmCommentsAPIView.as_view(), name='film_comments'),
     path('films/<int:film_id>/create-comment', CommentCreateAPIView.as_view(), name='comment'),
     path('films/<int:film_id>/rate', CreateUpdateRateAPIView.as_view(), name='rate'),
     path('films/<int:film_id>/add-to-list/<int:films_list_id>', AddFilmToListAPIView.as_view(), name='add_to_list'),
+    path(
+        'genres/<int:group_id>/leaderboards/<str:board>',
+        LeaderboardAPIView.as_view(group=LEADERBOARD_GENRE),
+        name='genre_leaderboard',
+    ),
+    path(
+        'franchises/<int:group_id>/leaderboards/<str:board>',
+        LeaderboardAPIView.as_view(group=LEADERBOARD_FRANCHISE),
+        name='franchise_leaderboard',
+    ),
     path('register/', RegisterAPIView.as_view(), name='register'),
     path('login/', ObtainAuthToken.as_view(), name='login'),
     path('logout/', LogoutAPIView.as_view(), name='logout'),
     path('profile/<int:user_id>/', ProfileAPIView.as_view(), name='profile'),
+    path('feed/', FeedAPIView.as_view(), name='feed'),
+    path('profile/<int:user_id>/following/<int:followee_id>', FollowAPIView.as_view(), name='follow'),
+    path('profile/<int:user_id>/stats', ProfileStatsAPIView.as_view(), name='profile_stats'),
+    path('profile/<int:user_id>/recommendations', ProfileRecommendationsAPIView.as_view(), name='recommendations'),
+    path('profile/<int:user_id>/export', ProfileExportAPIView.as_view(), name='export'),
+    path(
+        'profile/<int:user_id>/films-lists/<int:films_list_id>/films',
+        UserFilmsListFilmsAPIView.as_view(),
+        name='films_list_films',
+    ),
+    path('profile/<int:user_id>/films-lists/batch', FilmsListsBatchAPIView.as_view(), name='films_lists_batch'),
     path('profile/<int:user_id>/private-status/<int:films_list_id>', PrivateStatusAPIView.as_view(), name='private'),
+    # Async counterparts of the hot read endpoints, for ASGI deployments
+    path('async/films/', async_views.films_list, name='async_films'),
+    path('async/films/<int:film_id>/', async_views.film_detail, name='async_film'),
+    path('async/profile/<int:user_id>/', async_views.profile, name='async_profile'),
 ]
@@ -0,0 +1,462 @@
+"""
+Endpoint benchmarks on seeded datasets, see the benchmark_endpoints command.
+
+`seed_dataset` fills an empty database from the model factories with bulk
+inserts, then derives what the signals would have maintained: rating
+aggregates, comment counts, the search index and the similar films. Every
+route of main.urls and main.api.urls has a BenchmarkCase, and `run_case`
+measures its latency percentiles over many requests plus the query count and
+peak Python memory (tracemalloc) of one more.
+"""
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+import factory.random
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.urls import URLResolver, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from main.api.throttling import LocalWindowCounter, SharedWindowCounter, reset_throttles
+from main.constants import DROPPED_TYPE, FILM_LIST_TYPES, PLANNED_TYPE, RATED_VERB, VALUES_CHOICES, WATCHED_TYPE
+from main.feed import follow, unfollow
+from main.models import (
+    ActivityEvent,
+    Comment,
+    CustomUser,
+    FeedItem,
+    Film,
+    FilmsList,
+    Follow,
+    Franchise,
+    Genre,
+    LeaderboardEntry,
+    Rate,
+    UserStats,
+)
+from main.recommendations import compute_neighbours, get_recommended_film_ids, load_ratings, save_neighbours
+from main.search import get_search_backend
+from main.tests.factories import CommentFactory, CustomUserFactory, FilmFactory, FranchiseFactory, GenreFactory
+
+DATASETS = {
+    'tiny': {
+        'films': 50, 'genres': 5, 'franchises': 5, 'users': 10, 'rates': 200, 'comments': 100, 'list_films': 20,
+    },
+    'small': {
+        'films': 1000, 'genres': 20, 'franchises': 50, 'users': 100, 'rates': 10000, 'comments': 5000,
+        'list_films': 500,
+    },
+    'large': {
+        'films': 100000, 'genres': 50, 'franchises': 2000, 'users': 10000, 'rates': 1000000, 'comments': 200000,
+        'list_films': 5000,
+    },
+}
+BENCHMARK_PASSWORD = 'benchmark-password'
+OTHER_USER_LIST_FILMS = 10
+# Rates of the users the benchmark user follows that also get a feed event
+FEED_EVENTS = 2000
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class BenchmarkData:
+    """The seeded objects the benchmark cases request."""
+
+    def __init__(self, user, other_user, film):
+        self.user = user
+        self.other_user = other_user
+        self.film = film
+        self.films_lists = {films_list.type: films_list for films_list in user.films_lists.all()}
+        self.film_ids = list(Film.objects.order_by('id').values_list('id', flat=True)[:100])
+        self.search_query = film.name.split()[0]
+        self.counter = itertools.count()
+
+
+def _bulk_create(model, objects, batch_size):
+    for start in range(0, len(objects), batch_size):
+        model.objects.bulk_create(objects[start:start + batch_size])
+
+
+def _ids(model):
+    return list(model.objects.order_by('id').values_list('id', flat=True))
+
+
+def seed_dataset(sizes, seed=0, batch_size=5000):
+    """
+    Seed `sizes` (a DATASETS entry) into an empty database and return its BenchmarkData.
+    The first user is the benchmark user: it owns `list_films` listed films,
+    logs in with BENCHMARK_PASSWORD and follows, and is followed by, every
+    other user.
+    """
+    rng = random.Random(seed)
+    factory.random.reseed_random(seed)
+    with transaction.atomic():
+        _bulk_create(Genre, GenreFactory.build_batch(sizes['genres']), batch_size)
+        _bulk_create(Franchise, FranchiseFactory.build_batch(sizes['franchises']), batch_size)
+        genre_ids, franchise_ids = _ids(Genre), _ids(Franchise)
+
+        films = [
+            FilmFactory.build(franchise_id=rng.choice(franchise_ids) if rng.random() < 0.3 else None)
+            for _ in range(sizes['films'])
+        ]
+        _bulk_create(Film, films, batch_size)
+        film_ids = _ids(Film)
+        film_genres = Film.genre.through
+        _bulk_create(film_genres, [
+            film_genres(film_id=film_id, genre_id=genre_id)
+            for film_id in film_ids
+            for genre_id in rng.sample(genre_ids, min(len(genre_ids), rng.randint(1, 3)))
+        ], batch_size)
+
+        users = CustomUserFactory.build_batch(sizes['users'])
+        users[0].set_password(BENCHMARK_PASSWORD)
+        _bulk_create(CustomUser, users, batch_size)
+        user_ids = _ids(CustomUser)
+        _bulk_create(FilmsList, [
+            FilmsList(user_id=user_id, type=list_type, private=rng.random() < 0.5)
+            for user_id in user_ids
+            for list_type, _ in FILM_LIST_TYPES
+        ], batch_size)
+        FilmsList.objects.filter(user_id=user_ids[0], type=WATCHED_TYPE).update(private=False)
+        list_ids = dict(
+            ((user_id, list_type), list_id)
+            for list_id, user_id, list_type in FilmsList.objects.values_list('id', 'user_id', 'type')
+        )
+        list_films = FilmsList.film.through
+        rows = []
+        for user_id in user_ids:
+            count = sizes['list_films'] if user_id == user_ids[0] else OTHER_USER_LIST_FILMS
+            for film_id in rng.sample(film_ids, min(len(film_ids), count)):
+                list_type = rng.choice([PLANNED_TYPE, WATCHED_TYPE, DROPPED_TYPE])
+                rows.append(list_films(filmslist_id=list_ids[user_id, list_type], film_id=film_id))
+        _bulk_create(list_films, rows, batch_size)
+
+        pairs = set()
+        target = min(sizes['rates'], len(user_ids) * len(film_ids))
+        while len(pairs) < target:
+            pairs.add((rng.choice(user_ids), rng.choice(film_ids)))
+        values = [value for value, _ in VALUES_CHOICES]
+        _bulk_create(Rate, [
+            Rate(user_id=user_id, film_id=film_id, value=rng.choice(values)) for user_id, film_id in sorted(pairs)
+        ], batch_size)
+
+        _bulk_create(Comment, [
+            CommentFactory.build(film_id=rng.choice(film_ids), author_id=rng.choice(user_ids))
+            for _ in range(sizes['comments'])
+        ], batch_size)
+
+        _bulk_create(Follow, [
+            Follow(follower_id=follower_id, followee_id=followee_id)
+            for user_id in user_ids[1:]
+            for follower_id, followee_id in ((user_ids[0], user_id), (user_id, user_ids[0]))
+        ], batch_size)
+        _bulk_create(ActivityEvent, [
+            ActivityEvent(actor_id=user_id, verb=RATED_VERB, film_id=film_id, value=value)
+            for user_id, film_id, value in Rate.objects.exclude(user_id=user_ids[0]).order_by('id').values_list(
+                'user_id', 'film_id', 'value'
+            )[:FEED_EVENTS]
+        ], batch_size)
+        _bulk_create(FeedItem, [
+            FeedItem(user_id=user_ids[0], event_id=event_id)
+            for event_id in ActivityEvent.objects.order_by('-id').values_list('id', flat=True)[
+                :settings.FEED_INBOX_LENGTH
+            ]
+        ], batch_size)
+
+        derive_denormalized_data(film_ids, user_ids, batch_size)
+
+    film = Film.objects.order_by('-rating_count', '-comment_count', 'id').first()
+    return BenchmarkData(CustomUser.objects.get(id=user_ids[0]), CustomUser.objects.get(id=user_ids[-1]), film)
+
+
+def derive_denormalized_data(film_ids, user_ids, batch_size=5000):
+    """Fill what the signals maintain on single writes, after rows were bulk inserted."""
+    comment_counts = dict(
+        Comment.objects.order_by().values('film_id').annotate(total=Count('id')).values_list('film_id', 'total')
+    )
+    backend = get_search_backend()
+    for start in range(0, len(film_ids), batch_size):
+        chunk = film_ids[start:start + batch_size]
+        Film.recompute_ratings(chunk)
+        Film.objects.bulk_update(
+            [Film(id=film_id, comment_count=comment_counts.get(film_id, 0)) for film_id in chunk], ['comment_count']
+        )
+        backend.index(Film.objects.filter(id__in=chunk).only('id', 'name', 'synopsis'))
+        LeaderboardEntry.rebuild(chunk)
+    for start in range(0, len(user_ids), batch_size):
+        UserStats.recompute(user_ids[start:start + batch_size])
+    try:
+        save_neighbours(compute_neighbours(*load_ratings()), batch_size=batch_size)
+    except ImportError:
+        # numpy and scipy are optional; the similar films endpoints then serve empty lists
+        pass
+
+
+class BenchmarkCase:
+    """
+    One request to benchmark, authenticated with the token of the `auth` user.
+    `data` may be a callable of the request number, for payloads that must
+    differ between requests, and `setup` a callable of the BenchmarkData run
+    untimed before each request.
+    """
+
+    def __init__(self, name, route, method='get', kwargs=None, query='', data=None, format=None, auth=None,
+                 setup=None):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.query = query
+        self.data = data
+        self.format = format
+        self.auth = auth
+        self.setup = setup
+
+    def get_headers(self):
+        headers = {}
+        if self.auth is not None:
+            token, _ = Token.objects.get_or_create(user=self.auth)
+            headers['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+        if self.method != 'get':
+            headers['format'] = self.format
+        return headers
+
+    def request(self, client, headers, number):
+        url = reverse(self.route, kwargs=self.kwargs) + (f'?{self.query}' if self.query else '')
+        payload = self.data(number) if callable(self.data) else self.data
+        response = getattr(client, self.method)(url, payload, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def get_cases(data):
+    user_id, film_id = data.user.id, data.film.id
+    watched, planned = data.films_lists[WATCHED_TYPE], data.films_lists[PLANNED_TYPE]
+
+    genres = ','.join(data.film.genre.values_list('name', flat=True))
+    genre_id = data.film.genre.order_by('id').values_list('id', flat=True).first()
+    franchise_id = data.film.franchise_id or Franchise.objects.order_by('id').values_list('id', flat=True).first()
+
+    def register_payload(number):
+        username = f'benchmark{next(data.counter)}'
+        return {
+            'username': username,
+            'email': f'{username}@example.org',
+            'password': BENCHMARK_PASSWORD,
+            'confirm_password': BENCHMARK_PASSWORD,
+        }
+
+    return [
+        BenchmarkCase('main about', 'main:about'),
+        BenchmarkCase('main films', 'main:films'),
+        BenchmarkCase('films', 'films'),
+        BenchmarkCase('films by rating', 'films', query='ordering=-film_rating&page_size=50&with_total=1'),
+        BenchmarkCase('films by genres', 'films', query=f'genre={genres}'),
+        BenchmarkCase('film search', 'film_search', query=f'q={data.search_query}'),
+        BenchmarkCase('genre leaderboard', 'genre_leaderboard', kwargs={'group_id': genre_id, 'board': 'top-rated'},
+                      query='page_size=50'),
+        BenchmarkCase('franchise leaderboard', 'franchise_leaderboard',
+                      kwargs={'group_id': franchise_id, 'board': 'most-watched'}),
+        BenchmarkCase('film', 'film', kwargs={'film_id': film_id}),
+        BenchmarkCase('similar', 'similar', kwargs={'film_id': film_id}),
+        BenchmarkCase('film comments', 'film_comments', kwargs={'film_id': film_id}),
+        BenchmarkCase('comment', 'comment', 'post', {'film_id': film_id}, data={'text': 'Benchmark'}, auth=data.user),
+        BenchmarkCase('rate', 'rate', 'post', {'film_id': film_id}, data=lambda number: {'value': number % 5 + 1},
+                      auth=data.user),
+        BenchmarkCase('add to list', 'add_to_list', 'post', {'film_id': film_id, 'films_list_id': watched.id},
+                      auth=data.user),
+        BenchmarkCase('remove from list', 'add_to_list', 'delete', {'film_id': film_id, 'films_list_id': planned.id},
+                      auth=data.user, setup=lambda data: FilmsList.move_films(data.user.id, {film_id: PLANNED_TYPE})),
+        BenchmarkCase('register', 'register', 'post', data=register_payload),
+        BenchmarkCase('login', 'login', 'post', data={'username': data.user.username, 'password': BENCHMARK_PASSWORD}),
+        BenchmarkCase('logout', 'logout', 'post', auth=data.other_user),
+        BenchmarkCase('profile', 'profile', kwargs={'user_id': user_id}, auth=data.user),
+        BenchmarkCase('profile of another user', 'profile', kwargs={'user_id': data.other_user.id}, auth=data.user),
+        BenchmarkCase('profile summary', 'profile', kwargs={'user_id': user_id}, query='summary=1', auth=data.user),
+        BenchmarkCase('profile update', 'profile', 'patch', {'user_id': user_id},
+                      data=lambda number: {'first_name': f'Benchmark{number}'}, format='json', auth=data.user),
+        BenchmarkCase('feed', 'feed', auth=data.user),
+        BenchmarkCase('follow', 'follow', 'post', {'user_id': user_id, 'followee_id': data.other_user.id},
+                      auth=data.user, setup=lambda data: unfollow(data.user.id, data.other_user.id)),
+        BenchmarkCase('unfollow', 'follow', 'delete', {'user_id': user_id, 'followee_id': data.other_user.id},
+                      auth=data.user, setup=lambda data: follow(data.user.id, data.other_user.id)),
+        BenchmarkCase('profile stats', 'profile_stats', kwargs={'user_id': user_id}, auth=data.user),
+        BenchmarkCase('recommendations', 'recommendations', kwargs={'user_id': user_id}, auth=data.user),
+        BenchmarkCase('export', 'export', kwargs={'user_id': user_id}, auth=data.user),
+        BenchmarkCase('export gzip', 'export', kwargs={'user_id': user_id}, query='gzip=1', auth=data.user),
+        BenchmarkCase('films lists batch', 'films_lists_batch', 'post', {'user_id': user_id},
+                      data={'watched': data.film_ids}, format='json', auth=data.user),
+        BenchmarkCase('films list films', 'films_list_films', kwargs={'user_id': user_id, 'films_list_id': watched.id},
+                      query='page_size=50', auth=data.user),
+        BenchmarkCase('private', 'private', 'patch', {'user_id': user_id, 'films_list_id': watched.id},
+                      data={'private': False}, format='json', auth=data.user),
+        BenchmarkCase('async films', 'async_films'),
+        BenchmarkCase('async film', 'async_film', kwargs={'film_id': film_id}),
+        BenchmarkCase('async profile', 'async_profile', kwargs={'user_id': user_id}, auth=data.user),
+    ]
+
+
+def get_route_names():
+    """Names of every route of main.urls and main.api.urls, namespaced like `reverse()` takes them."""
+    from main import urls as main_urls
+    from main.api import urls as api_urls
+
+    names = set()
+    for namespace, patterns in ((main_urls.app_name, main_urls.urlpatterns), (None, api_urls.urlpatterns)):
+        for pattern in patterns:
+            if not isinstance(pattern, URLResolver) and pattern.name:
+                names.add(f'{namespace}:{pattern.name}' if namespace else pattern.name)
+    return names
+
+
+def check_coverage(cases):
+    missing = get_route_names() - {case.route for case in cases}
+    if missing:
+        raise BenchmarkError(f'Routes without a benchmark case: {", ".join(sorted(missing))}.')
+
+
+def get_percentile(latencies, percent):
+    if len(latencies) < 2:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method='inclusive')[percent - 1]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def run_case(client, data, case, requests=50, warm_cache=False):
+    """Latency percentiles (ms) of `requests` requests, and the query count and peak memory (KiB) of one more."""
+    def prepare():
+        # Requests are measured through the throttle check, never against a rejection
+        reset_throttles()
+        if case.setup is not None:
+            case.setup(data)
+        if not warm_cache:
+            cache.clear()
+        return case.get_headers()
+
+    case.request(client, prepare(), 0)
+
+    headers = prepare()
+    counter = QueryCounter()
+    # Async views then query on this thread, where the counter sees them
+    with override_settings(ASYNC_DATABASE_THREADS=None), connection.execute_wrapper(counter):
+        tracemalloc.start()
+        try:
+            response = case.request(client, headers, 1)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    latencies = []
+    for number in range(2, requests + 2):
+        headers = prepare()
+        started = time.perf_counter()
+        case.request(client, headers, number)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'route': case.route,
+        'method': case.method.upper(),
+        'status': response.status_code,
+        'queries': counter.count,
+        'peak_memory_kib': round(peak_memory / 1024, 1),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(get_percentile(latencies, 50), 3),
+        'p95_ms': round(get_percentile(latencies, 95), 3),
+        'p99_ms': round(get_percentile(latencies, 99), 3),
+    }
+
+
+def run_benchmarks(data, cases, requests=50, warm_cache=False):
+    client = APIClient()
+    return {case.name: run_case(client, data, case, requests, warm_cache) for case in cases}
+
+
+def benchmark_throttle(checks=100000, clients=1000, shared_cache=None):
+    """
+    Mean microseconds per sliding-window check of `checks` checks spread over
+    `clients` keys, in process memory and, with a cache alias, in that cache.
+    """
+    counters = {'local': LocalWindowCounter(clients)}
+    if shared_cache:
+        counters['shared'] = SharedWindowCounter(shared_cache)
+    keys = [f'benchmark:user:{number}' for number in range(clients)]
+    results = {}
+    for name, counter in counters.items():
+        started = time.perf_counter()
+        for number in range(checks):
+            counter.hit(keys[number % clients], checks, 60, time.time())
+        results[name] = round((time.perf_counter() - started) / checks * 1e6, 3)
+    return results
+
+
+def benchmark_recommendations(user, calls=50, limit=20):
+    """
+    Latency percentiles (ms) of `calls` recommendation computations for
+    `user`, and the query count and number of films of one more.
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        film_ids = get_recommended_film_ids(user, limit)
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        get_recommended_film_ids(user, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'films': len(film_ids),
+        'queries': counter.count,
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(get_percentile(latencies, 50), 3),
+        'p95_ms': round(get_percentile(latencies, 95), 3),
+    }
+
+
+def compare_results(results, baseline, latency_tolerance=0.5, tail_latency_tolerance=None, memory_tolerance=0.5,
+                    min_latency_ms=1.0):
+    """
+    Regressions of `results` against `baseline` (both benchmark_endpoints JSON documents):
+    a changed status, any extra query, or p50 latency, peak memory or, when
+    given a tolerance, the noisier p95 latency beyond their tolerance (a
+    fraction of the baseline value).
+    """
+    if (results['dataset'], results['warm_cache']) != (baseline['dataset'], baseline['warm_cache']):
+        raise BenchmarkError('The baseline was recorded on a different dataset or cache mode.')
+    regressions = []
+    for name, expected in baseline['endpoints'].items():
+        actual = results['endpoints'].get(name)
+        if actual is None:
+            continue
+        if actual['status'] != expected['status']:
+            regressions.append(f'{name}: status {expected["status"]} -> {actual["status"]}')
+        if actual['queries'] > expected['queries']:
+            regressions.append(f'{name}: {expected["queries"]} -> {actual["queries"]} queries')
+        for key, tolerance in (('p50_ms', latency_tolerance), ('p95_ms', tail_latency_tolerance)):
+            if tolerance is None:
+                continue
+            limit = max(expected[key] * (1 + tolerance), expected[key] + min_latency_ms)
+            if actual[key] > limit:
+                regressions.append(f'{name}: {key} {expected[key]} -> {actual[key]}')
+        if actual['peak_memory_kib'] > expected['peak_memory_kib'] * (1 + memory_tolerance):
+            regressions.append(
+                f'{name}: peak memory {expected["peak_memory_kib"]} -> {actual["peak_memory_kib"]} KiB'
+            )
+    return regressions
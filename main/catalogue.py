@@ -0,0 +1,150 @@
+"""
+Streaming import of catalogue dumps (CSV or JSONL) into Film, Genre and Franchise.
+
+Each record needs an `external_id` and may carry `name`, `synopsis`,
+`release_date` (ISO date), `franchise` (name) and `genres` (a list in JSONL,
+names separated by `|` in CSV). Films are upserted by `external_id`.
+"""
+import csv
+import json
+from datetime import date
+
+from django.db import transaction
+
+from main.api.cache import invalidate_films
+from main.models import Film, Franchise, Genre, LeaderboardEntry
+from main.search import get_search_backend
+
+FILM_FIELDS = ['name', 'synopsis', 'release_date', 'franchise']
+FILM_COLUMNS = ['name', 'synopsis', 'release_date', 'franchise_id']
+
+
+class CatalogueImportError(Exception):
+    pass
+
+
+class DimensionCache:
+    """In-memory name -> id map of a lookup model, creating missing names in bulk."""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            self.ids.update(self.model.objects.filter(name__in=missing).values_list('name', 'id'))
+            new_names = missing - self.ids.keys()
+            if new_names:
+                self.model.objects.bulk_create([self.model(name=name) for name in new_names])
+                self.ids.update(self.model.objects.filter(name__in=new_names).values_list('name', 'id'))
+        return {name: self.ids[name] for name in names}
+
+
+def read_records(path, offset=0):
+    """
+    Yield (record, end_offset) for every record of a CSV or JSONL file, starting at byte `offset`.
+
+    The file is read in binary line by line, so the byte offset right after
+    each record is known and can be stored to resume the import later.
+    """
+    with open(path, 'rb') as file:
+        if path.endswith('.csv'):
+            header = next(csv.reader([file.readline().decode('utf-8')]))
+            file.seek(max(offset, file.tell()))
+            position = {'offset': file.tell()}
+
+            def lines():
+                for line in iter(file.readline, b''):
+                    position['offset'] = file.tell()
+                    yield line.decode('utf-8')
+
+            for row in csv.DictReader(lines(), fieldnames=header):
+                row['genres'] = [name for name in (row.get('genres') or '').split('|') if name]
+                yield row, position['offset']
+        elif path.endswith('.jsonl'):
+            file.seek(offset)
+            for line in iter(file.readline, b''):
+                if line.strip():
+                    yield json.loads(line), file.tell()
+        else:
+            raise CatalogueImportError(f'Unsupported catalogue format: {path}')
+
+
+def parse_record(record):
+    external_id = str(record.get('external_id') or '').strip()
+    if not external_id:
+        raise CatalogueImportError(f'Record without external_id: {record}')
+    release_date = record.get('release_date') or None
+    return {
+        'external_id': external_id,
+        'name': record.get('name') or '',
+        'synopsis': record.get('synopsis') or '',
+        'release_date': date.fromisoformat(release_date) if release_date else None,
+        'franchise': (record.get('franchise') or '').strip() or None,
+        'genres': [name.strip() for name in record.get('genres') or [] if name.strip()],
+    }
+
+
+class CatalogueImporter:
+    """Upsert films batch by batch, each batch in its own transaction."""
+
+    def __init__(self):
+        self.genres = DimensionCache(Genre)
+        self.franchises = DimensionCache(Franchise)
+
+    def import_batch(self, records):
+        # The last record of a batch wins when an external_id repeats
+        records = {record['external_id']: record for record in map(parse_record, records)}
+        with transaction.atomic():
+            franchise_ids = self.franchises.resolve({r['franchise'] for r in records.values() if r['franchise']})
+            genre_ids = self.genres.resolve({name for r in records.values() for name in r['genres']})
+            existing = {
+                row[0]: row[1:]
+                for row in Film.objects.filter(external_id__in=records).values_list('external_id', 'id', *FILM_COLUMNS)
+            }
+
+            films, changed = [], []
+            # Films of a franchise list its films, so both the stored and the imported franchise change
+            touched_franchise_ids = {stored[-1] for stored in existing.values()}
+            for external_id, record in records.items():
+                values = (
+                    record['name'],
+                    record['synopsis'],
+                    record['release_date'],
+                    franchise_ids.get(record['franchise']),
+                )
+                film_id, *stored_values = existing.get(external_id, (None,))
+                touched_franchise_ids.add(values[-1])
+                film = Film(id=film_id, external_id=external_id, **dict(zip(FILM_COLUMNS, values)))
+                films.append(film)
+                # bulk_update builds a CASE per field and row, so leave unchanged films alone
+                if film_id is not None and tuple(stored_values) != values:
+                    changed.append(film)
+            new_films = [film for film in films if film.id is None]
+            Film.objects.bulk_create(new_films)
+            Film.objects.bulk_update(changed, FILM_FIELDS)
+            created = dict(
+                Film.objects.filter(external_id__in=[film.external_id for film in new_films])
+                .values_list('external_id', 'id')
+            )
+            for film in new_films:
+                film.id = created[film.external_id]
+
+            through = Film.genre.through
+            existing_ids = [film_id for film_id, *_ in existing.values()]
+            through.objects.filter(film_id__in=existing_ids).delete()
+            through.objects.bulk_create([
+                through(film_id=film.id, genre_id=genre_ids[name])
+                for film in films for name in set(records[film.external_id]['genres'])
+            ])
+
+            # Bulk writes skip model signals, so sync the search index, leaderboards and caches here.
+            # Only successful responses are cached, so new films have no detail entry to evict.
+            get_search_backend().index(films)
+            LeaderboardEntry.rebuild([film.id for film in films])
+            franchise_films = (
+                Film.objects.filter(franchise_id__in=touched_franchise_ids - {None}).values_list('id', flat=True)
+            )
+            invalidate_films([*existing_ids, *franchise_films])
+        return len(new_films), len(films) - len(new_films)
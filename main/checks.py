@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+@register()
+def check_replica_caches(app_configs, **kwargs):
+    """
+    With read replicas, a write pins its user to the primary and bumps the
+    response cache versions (see main.routers and main.api.cache). Both must
+    be seen by every process, or the user's next request may read stale data.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return []
+    errors = []
+    for setting, alias in (('DATABASE_PIN_CACHE', settings.DATABASE_PIN_CACHE), ('CACHES', 'default')):
+        if isinstance(caches[alias], PROCESS_LOCAL_CACHES):
+            errors.append(Error(
+                f'The {alias!r} cache of {setting} is local to each process, but DATABASE_REPLICAS is set.',
+                hint='Use a cache shared by the processes serving requests, e.g. Redis or Memcached.',
+                id='main.E001',
+            ))
+    return errors
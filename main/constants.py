@@ -24,4 +24,27 @@ FILM_LIST_TYPES = (
     (PLANNED_TYPE, 'planned'),
     (WATCHED_TYPE, 'watched'),
     (DROPPED_TYPE, 'dropped'),
-)
\ No newline at end of file
+)
+
+# Constants for the groups films are ranked in by leaderboards
+
+LEADERBOARD_GENRE = 'genre'
+LEADERBOARD_FRANCHISE = 'franchise'
+
+LEADERBOARD_GROUPS = (
+    (LEADERBOARD_GENRE, 'genre'),
+    (LEADERBOARD_FRANCHISE, 'franchise'),
+)
+
+
+# Constants for storing activity feed event verbs
+
+RATED_VERB = 1
+COMMENTED_VERB = 2
+LISTED_VERB = 3
+
+ACTIVITY_VERBS = (
+    (RATED_VERB, 'rated'),
+    (COMMENTED_VERB, 'commented'),
+    (LISTED_VERB, 'listed'),
+)
@@ -0,0 +1,294 @@
+"""
+Synthetic production-scale data, see the generate_dataset command.
+
+Users, films and films lists get explicit ids from contiguous ranges, so
+chunks of them and of the users' rates, list memberships and comments are
+generated by separate processes without coordinating. Every chunk draws from
+its own RNG seeded by (seed, kind, chunk offset), so the generated values only
+depend on the seed and the chunk size, not on the number of processes, the
+order chunks finish in or the ids already taken: the users, films and lists
+with their ids counted from the first free ones, and which user rated,
+listed or commented which film with what. The ids of rates, list memberships
+and comments follow the order chunks are inserted in, and comment dates are
+the time of the insert, so those differ between runs.
+
+Rows are bulk inserted, bypassing the per-row signals: the three films lists
+of every user are created here, and the rating aggregates, comment counts,
+search index and leaderboards are derived per film chunk, and the user stats
+per user chunk, once all rows exist.
+"""
+import bisect
+import itertools
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date, timedelta
+from functools import lru_cache
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max
+from faker import Faker
+
+from main.constants import DROPPED_TYPE, FILM_LIST_TYPES, PLANNED_TYPE, WATCHED_TYPE
+from main.models import Comment, CustomUser, Film, FilmsList, Franchise, Genre, LeaderboardEntry, Rate, UserStats
+from main.search import get_search_backend
+
+FIRST_RELEASE_DATE = date(1930, 1, 1)
+RELEASE_DATE_DAYS = 95 * 365
+# Share of a user's rated films they also listed as watched, and of extra planned and dropped films
+WATCHED_SHARE = 0.8
+PLANNED_SHARE = 0.3
+DROPPED_SHARE = 0.05
+FRANCHISE_SHARE = 0.2
+# Spread of the per-user activity (log-normal) and of the per-film quality
+ACTIVITY_SIGMA = 1.0
+QUALITY_MEAN, QUALITY_SIGMA = 3.4, 0.6
+
+# Serializes the workers' write transactions on SQLite, which has a single writer
+_write_lock = None
+
+
+def set_write_lock(lock):
+    global _write_lock
+    _write_lock = lock
+
+
+def write_transaction():
+    return _write_lock or nullcontext()
+
+
+def get_rng(seed, kind, offset):
+    return random.Random(f'{seed}:{kind}:{offset}')
+
+
+def get_faker(seed, kind, offset):
+    faker = Faker()
+    faker.seed_instance(f'{seed}:{kind}:{offset}')
+    return faker
+
+
+def get_chunks(first_id, count, chunk_size):
+    """(first_id, count) of consecutive id ranges of at most `chunk_size` ids."""
+    return [
+        (first_id + offset, min(chunk_size, count - offset))
+        for offset in range(0, count, chunk_size)
+    ]
+
+
+def get_next_id(model):
+    return (model.objects.aggregate(last_id=Max('id'))['last_id'] or 0) + 1
+
+
+def bulk_insert(model, objects, batch_size):
+    with write_transaction(), transaction.atomic():
+        model.objects.bulk_create(objects, batch_size=batch_size)
+    return len(objects)
+
+
+def get_activity_count(rng, mean):
+    """A log-normal count averaging `mean`: most users do little, a few do a lot."""
+    if mean <= 0:
+        return 0
+    mu = math.log(mean) - ACTIVITY_SIGMA ** 2 / 2
+    return int(rng.lognormvariate(mu, ACTIVITY_SIGMA) + 0.5)
+
+
+class FilmPopularity:
+    """
+    Zipf-like popularity of the films with ids [first_id, first_id + count):
+    the film of rank r is picked with weight 1 / r**skew, ranks being a
+    seeded shuffle of the ids. Each film also has a seeded quality its rates
+    center on.
+    """
+
+    def __init__(self, seed, first_id, count, skew):
+        rng = get_rng(seed, 'popularity', 0)
+        self.first_id = first_id
+        self.count = count
+        self.ranked_ids = list(range(first_id, first_id + count))
+        rng.shuffle(self.ranked_ids)
+        self.cumulative_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+        self.qualities = [rng.gauss(QUALITY_MEAN, QUALITY_SIGMA) for _ in range(count)]
+
+    def pick(self, rng):
+        rank = bisect.bisect(self.cumulative_weights, rng.random() * self.cumulative_weights[-1])
+        return self.ranked_ids[min(rank, self.count - 1)]
+
+    def pick_distinct(self, rng, count, exclude=()):
+        count = min(count, self.count - len(exclude))
+        if count > self.count // 4:
+            # Rejection sampling stalls when most films are needed; heavy users pick uniformly
+            candidates = [film_id for film_id in self.ranked_ids if film_id not in exclude]
+            return rng.sample(candidates, count)
+        picked = set()
+        while len(picked) < count:
+            film_id = self.pick(rng)
+            if film_id not in exclude:
+                picked.add(film_id)
+        return sorted(picked)
+
+    def rate(self, rng, film_id):
+        value = rng.gauss(self.qualities[film_id - self.first_id], 1.0)
+        return min(5, max(1, int(value + 0.5)))
+
+
+@lru_cache(maxsize=1)
+def get_film_popularity(seed, first_id, count, skew):
+    # Built once per worker process rather than pickled into every task
+    return FilmPopularity(seed, first_id, count, skew)
+
+
+def generate_genres(count, seed, batch_size=5000):
+    faker = get_faker(seed, 'genres', 0)
+    names = [f'{faker.word()}-{number}' for number in range(count)]
+    return bulk_insert(Genre, [Genre(name=name) for name in names], batch_size)
+
+
+def generate_franchises(count, seed, batch_size=5000):
+    faker = get_faker(seed, 'franchises', 0)
+    return bulk_insert(Franchise, [Franchise(name=faker.catch_phrase()[:200]) for _ in range(count)], batch_size)
+
+
+def generate_films(first_id, count, seed, first_film_id, genre_ids, franchise_ids, batch_size=5000):
+    """Films with ids [first_id, first_id + count), each in 1-3 genres, some in a franchise."""
+    offset = first_id - first_film_id
+    rng, faker = get_rng(seed, 'films', offset), get_faker(seed, 'films', offset)
+    films, film_genres = [], []
+    for film_id in range(first_id, first_id + count):
+        in_franchise = franchise_ids and rng.random() < FRANCHISE_SHARE
+        films.append(Film(
+            id=film_id,
+            name=' '.join(faker.words(rng.randint(1, 4))).title(),
+            synopsis=faker.paragraph(nb_sentences=3),
+            release_date=FIRST_RELEASE_DATE + timedelta(days=rng.randrange(RELEASE_DATE_DAYS)),
+            franchise_id=rng.choice(franchise_ids) if in_franchise else None,
+        ))
+        for genre_id in rng.sample(genre_ids, min(len(genre_ids), rng.randint(1, 3))):
+            film_genres.append(Film.genre.through(film_id=film_id, genre_id=genre_id))
+    bulk_insert(Film, films, batch_size)
+    bulk_insert(Film.genre.through, film_genres, batch_size)
+    return count
+
+
+def get_films_list_id(first_list_id, first_user_id, user_id, list_type):
+    return first_list_id + (user_id - first_user_id) * len(FILM_LIST_TYPES) + list_type - 1
+
+
+def generate_users(first_id, count, seed, first_user_id, first_list_id, password, batch_size=5000):
+    """
+    Users with ids [first_id, first_id + count) sharing the `password` hash,
+    and their three films lists, which create_list_post_save would have made.
+    """
+    offset = first_id - first_user_id
+    rng, faker = get_rng(seed, 'users', offset), get_faker(seed, 'users', offset)
+    users, films_lists = [], []
+    for user_id in range(first_id, first_id + count):
+        first_name, last_name = faker.first_name(), faker.last_name()
+        username = f'{first_name.lower()}{user_id}'
+        users.append(CustomUser(
+            id=user_id,
+            username=username,
+            email=f'{username}@example.org',
+            first_name=first_name,
+            last_name=last_name,
+            password=password,
+        ))
+        for list_type, _ in FILM_LIST_TYPES:
+            films_lists.append(FilmsList(
+                id=get_films_list_id(first_list_id, first_user_id, user_id, list_type),
+                user_id=user_id,
+                type=list_type,
+                private=rng.random() < 0.5,
+            ))
+    bulk_insert(CustomUser, users, batch_size)
+    bulk_insert(FilmsList, films_lists, batch_size)
+    return count
+
+
+def generate_activity(first_id, count, seed, first_user_id, first_list_id, films, rates_per_user, comments_per_user,
+                      batch_size=5000):
+    """
+    Rates, list memberships and comments of the users with ids [first_id, first_id + count),
+    picking films by the popularity of `films`, the (first_id, count, skew) of the films.
+    Returns the (rates, memberships, comments) counts.
+    """
+    popularity = get_film_popularity(seed, *films)
+    offset = first_id - first_user_id
+    rng, faker = get_rng(seed, 'activity', offset), get_faker(seed, 'activity', offset)
+    rates, memberships, comments = [], [], []
+    through = FilmsList.film.through
+    for user_id in range(first_id, first_id + count):
+        rated = popularity.pick_distinct(rng, get_activity_count(rng, rates_per_user))
+        for film_id in rated:
+            rates.append(Rate(user_id=user_id, film_id=film_id, value=popularity.rate(rng, film_id)))
+        watched = [film_id for film_id in rated if rng.random() < WATCHED_SHARE]
+        listed = set(watched)
+        planned = popularity.pick_distinct(rng, int(len(rated) * PLANNED_SHARE + 0.5), listed)
+        listed.update(planned)
+        dropped = popularity.pick_distinct(rng, int(len(rated) * DROPPED_SHARE + 0.5), listed)
+        for list_type, film_ids in ((WATCHED_TYPE, watched), (PLANNED_TYPE, planned), (DROPPED_TYPE, dropped)):
+            films_list_id = get_films_list_id(first_list_id, first_user_id, user_id, list_type)
+            memberships.extend(through(filmslist_id=films_list_id, film_id=film_id) for film_id in film_ids)
+        for _ in range(get_activity_count(rng, comments_per_user)):
+            comments.append(Comment(film_id=popularity.pick(rng), author_id=user_id, text=faker.sentence()))
+    return (
+        bulk_insert(Rate, rates, batch_size),
+        bulk_insert(through, memberships, batch_size),
+        bulk_insert(Comment, comments, batch_size),
+    )
+
+
+def derive_films(first_id, count):
+    """
+    Rating aggregates, comment counts, search index and leaderboard entries of
+    the films [first_id, first_id + count).
+    """
+    film_ids = list(range(first_id, first_id + count))
+    comment_counts = dict(
+        Comment.objects.filter(film_id__in=film_ids).order_by().values('film_id')
+        .annotate(total=Count('id')).values_list('film_id', 'total')
+    )
+    films = list(Film.objects.filter(id__in=film_ids).only('id', 'name', 'synopsis'))
+    with write_transaction(), transaction.atomic():
+        Film.recompute_ratings(film_ids)
+        Film.objects.bulk_update(
+            [Film(id=film_id, comment_count=comment_counts.get(film_id, 0)) for film_id in film_ids],
+            ['comment_count'],
+        )
+        get_search_backend().index(films)
+        LeaderboardEntry.rebuild(film_ids)
+    return count
+
+
+def derive_users(first_id, count):
+    """Stats of the users with ids in [first_id, first_id + count), skipping ids without a user."""
+    user_ids = list(CustomUser.objects.filter(id__gte=first_id, id__lt=first_id + count).values_list('id', flat=True))
+    with write_transaction():
+        UserStats.recompute(user_ids)
+    return len(user_ids)
+
+
+def run_chunks(func, chunks, args=(), processes=None):
+    """Run `func(first_id, count, *args)` for every chunk, across a process pool. Yields the results."""
+    if processes == 1:
+        for first_id, count in chunks:
+            yield func(first_id, count, *args)
+        return
+    # Forked workers must open their own database connections
+    connections.close_all()
+    lock = multiprocessing.Lock() if connection.vendor == 'sqlite' else None
+    with ProcessPoolExecutor(max_workers=processes, initializer=set_write_lock, initargs=(lock,)) as executor:
+        futures = [executor.submit(func, first_id, count, *args) for first_id, count in chunks]
+        for future in futures:
+            yield future.result()
+
+
+def reset_sequences():
+    """Move the id sequences past the explicit ids, on backends that have them."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [CustomUser, Film, FilmsList])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
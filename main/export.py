@@ -0,0 +1,132 @@
+"""
+Streaming export of a user's personal data (films lists, rates, comments) as JSONL.
+
+Every line is one JSON object tagged with a `record` key. Rows are read with
+`QuerySet.iterator()` and encoded one at a time, so memory stays constant
+however much history a user has. Output is optionally gzip-compressed on the fly.
+"""
+import gzip
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from main.models import Comment, CustomUser, FilmsList, Rate
+
+USER_FIELDS = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined']
+
+
+def iter_user_records(user_id, chunk_size=2000):
+    """Yield the export records of one user, one dict at a time."""
+    user = CustomUser.objects.filter(id=user_id).values(*USER_FIELDS).first()
+    if user is None:
+        return
+    yield {'record': 'user', **user}
+
+    films_lists = FilmsList.objects.filter(user_id=user_id).order_by('id').values('id', 'type', 'private')
+    for films_list in films_lists.iterator(chunk_size=chunk_size):
+        yield {'record': 'films_list', **films_list}
+
+    list_films = (
+        FilmsList.film.through.objects.filter(filmslist__user_id=user_id)
+        .order_by('filmslist_id', 'film_id').values_list('filmslist_id', 'film_id', 'film__name')
+    )
+    for films_list_id, film_id, film_name in list_films.iterator(chunk_size=chunk_size):
+        yield {'record': 'films_list_film', 'films_list_id': films_list_id, 'film_id': film_id, 'film_name': film_name}
+
+    rates = Rate.objects.filter(user_id=user_id).order_by('id').values('id', 'film_id', 'film__name', 'value')
+    for rate in rates.iterator(chunk_size=chunk_size):
+        yield {'record': 'rate', 'id': rate['id'], 'film_id': rate['film_id'], 'film_name': rate['film__name'],
+               'value': rate['value']}
+
+    comments = Comment.objects.filter(author_id=user_id).order_by('id').values(
+        'id', 'film_id', 'film__name', 'text', 'date'
+    )
+    for comment in comments.iterator(chunk_size=chunk_size):
+        yield {'record': 'comment', 'id': comment['id'], 'film_id': comment['film_id'],
+               'film_name': comment['film__name'], 'text': comment['text'], 'date': comment['date']}
+
+
+def iter_jsonl(records):
+    for record in records:
+        yield (json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip a stream of byte chunks without buffering the whole stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_user_export(user_id, compress=False, chunk_size=2000):
+    """Bytes of one user's JSONL export, gzipped when `compress` is set."""
+    chunks = iter_jsonl(iter_user_records(user_id, chunk_size))
+    return iter_gzip(chunks) if compress else chunks
+
+
+def open_export_file(path, compress=False):
+    return gzip.open(path, 'wb') if compress else open(path, 'wb')
+
+
+def get_export_extension(compress=False):
+    return '.jsonl.gz' if compress else '.jsonl'
+
+
+def export_users(user_ids, path, compress=False, chunk_size=2000):
+    """Write the exports of the given users one after another into a single file."""
+    with open_export_file(path, compress) as file:
+        for user_id in user_ids:
+            file.writelines(iter_jsonl(iter_user_records(user_id, chunk_size)))
+
+
+def export_shard(directory, index, first_id, last_id, compress=False, chunk_size=2000):
+    """Export the users with ids in [first_id, last_id] into the shard's own file."""
+    path = os.path.join(directory, f'users-{index:05d}{get_export_extension(compress)}')
+    user_ids = CustomUser.objects.filter(id__gte=first_id, id__lte=last_id).order_by('id').values_list('id', flat=True)
+    user_ids = list(user_ids)
+    export_users(user_ids, path, compress, chunk_size)
+    return path, len(user_ids)
+
+
+def get_user_shards(shard_size):
+    """(first_id, last_id) of consecutive runs of `shard_size` users, by id."""
+    first_id = last_id = None
+    count = 0
+    for user_id in CustomUser.objects.order_by('id').values_list('id', flat=True).iterator():
+        if first_id is None:
+            first_id = user_id
+        last_id = user_id
+        count += 1
+        if count == shard_size:
+            yield first_id, last_id
+            first_id, count = None, 0
+    if first_id is not None:
+        yield first_id, last_id
+
+
+def export_all_users(directory, shard_size=1000, processes=None, compress=False, chunk_size=2000):
+    """
+    Export every user into one file per shard of `shard_size` users, running the
+    shards across a process pool. Yields (path, users) as shards complete.
+    """
+    shards = list(get_user_shards(shard_size))
+    if processes == 1:
+        for index, (first_id, last_id) in enumerate(shards):
+            yield export_shard(directory, index, first_id, last_id, compress, chunk_size)
+        return
+    # Forked workers must open their own database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(export_shard, directory, index, first_id, last_id, compress, chunk_size)
+            for index, (first_id, last_id) in enumerate(shards)
+        ]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,114 @@
+"""
+Activity feeds of followed users, fanned out on write.
+
+Every rate, comment or list move (`record_event`) is copied into the FeedItem
+inbox of each of the actor's followers, so a feed page is an index range read
+of the reader's inbox. Accounts with more than
+`settings.FEED_FANOUT_MAX_FOLLOWERS` followers aren't fanned out: their events
+are kept with `fanned_out=False` and pulled by the feeds that follow them at
+read time, through a partial index holding only those events.
+
+List moves are only recorded into public lists, and a feed read leaves out
+the moves into lists made private since, so hiding a list hides its history.
+
+Inboxes keep about `settings.FEED_INBOX_LENGTH` events: UserStats.feed_length
+counts the items written, and an inbox grown past twice the length is trimmed
+back in one DELETE, so trimming costs O(1) amortized per fanned out item.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+from main.constants import LISTED_VERB
+from main.models import ActivityEvent, FeedItem, FilmsList, Follow, UserStats
+
+
+def record_event(actor_id, verb, film_id, value=None, comment_id=None):
+    """Save an event of `actor_id` and fan it out to the inboxes of their followers."""
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    # Reading one follower past the limit tells fan-out from pull mode without counting them all
+    follower_ids = list(Follow.objects.filter(followee_id=actor_id).values_list('follower_id', flat=True)[:limit + 1])
+    fanned_out = len(follower_ids) <= limit
+    event = ActivityEvent.objects.create(
+        actor_id=actor_id, verb=verb, film_id=film_id, value=value, comment_id=comment_id, fanned_out=fanned_out
+    )
+    if fanned_out and follower_ids:
+        add_to_inboxes([(follower_id, event.id) for follower_id in follower_ids])
+    return event
+
+
+def add_to_inboxes(items, batch_size=1000):
+    """Add the (user_id, event_id) items to the users' inboxes, trimming the inboxes grown too long."""
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, event_id=event_id) for user_id, event_id in items],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    added = defaultdict(int)
+    for user_id, _ in items:
+        added[user_id] += 1
+    users_by_added = defaultdict(list)
+    for user_id, count in added.items():
+        users_by_added[count].append(user_id)
+    for count, user_ids in users_by_added.items():
+        UserStats.objects.filter(user_id__in=user_ids).update(feed_length=F('feed_length') + count)
+    overflowing = UserStats.objects.filter(user_id__in=added, feed_length__gt=settings.FEED_INBOX_LENGTH * 2)
+    for user_id in overflowing.values_list('user_id', flat=True):
+        trim_inbox(user_id)
+
+
+def trim_inbox(user_id):
+    """Delete all but the newest `settings.FEED_INBOX_LENGTH` items of the user's inbox."""
+    length = settings.FEED_INBOX_LENGTH
+    inbox = FeedItem.objects.filter(user_id=user_id)
+    cutoff = inbox.order_by('-event_id').values('event_id')[length:length + 1]
+    inbox.filter(event_id__lte=Subquery(cutoff)).delete()
+    UserStats.objects.filter(user_id=user_id).update(feed_length=inbox.count())
+
+
+def follow(follower_id, followee_id):
+    """
+    Make `follower_id` follow `followee_id`, copying the followee's latest
+    fanned out events into the follower's inbox. Returns whether it's new.
+    """
+    _, created = Follow.objects.get_or_create(follower_id=follower_id, followee_id=followee_id)
+    if created:
+        events = ActivityEvent.objects.filter(actor_id=followee_id, fanned_out=True).order_by('-id')
+        event_ids = events.values_list('id', flat=True)[:settings.FEED_INBOX_LENGTH]
+        add_to_inboxes([(follower_id, event_id) for event_id in event_ids])
+    return created
+
+
+def unfollow(follower_id, followee_id):
+    """Stop `follower_id` following `followee_id` and drop the followee's events from the inbox."""
+    deleted, _ = Follow.objects.filter(follower_id=follower_id, followee_id=followee_id).delete()
+    if deleted:
+        removed, _ = FeedItem.objects.filter(user_id=follower_id, event__actor_id=followee_id).delete()
+        if removed:
+            UserStats.objects.filter(user_id=follower_id).update(feed_length=Greatest(F('feed_length') - removed, 0))
+    return bool(deleted)
+
+
+def get_private_lists(actor_field, type_field):
+    """The list of a LISTED_VERB event, given by the outer query's fields, if it's private now."""
+    return FilmsList.objects.filter(user_id=OuterRef(actor_field), type=OuterRef(type_field), private=True)
+
+
+def get_feed_event_ids(user_id, before_id, limit):
+    """
+    Ids of the newest `limit` events in the user's feed older than `before_id`:
+    `limit` ids from the inbox merged with `limit` pulled ones.
+    """
+    inbox = FeedItem.objects.filter(user_id=user_id).exclude(
+        Exists(get_private_lists('event__actor_id', 'event__value')), event__verb=LISTED_VERB
+    )
+    pulled = ActivityEvent.objects.filter(
+        fanned_out=False, actor_id__in=Follow.objects.filter(follower_id=user_id).values('followee_id')
+    ).exclude(Exists(get_private_lists('actor_id', 'value')), verb=LISTED_VERB)
+    if before_id is not None:
+        inbox, pulled = inbox.filter(event_id__lt=before_id), pulled.filter(id__lt=before_id)
+    event_ids = set(inbox.order_by('-event_id').values_list('event_id', flat=True)[:limit])
+    event_ids.update(pulled.order_by('-id').values_list('id', flat=True)[:limit])
+    return sorted(event_ids, reverse=True)[:limit]
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from main.dataset import derive_users, get_chunks, run_chunks
+from main.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the stats of every user (list counts, rating aggregates and watched films per genre) '
+        'from their lists and rates, in chunks of user ids across a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help='Worker processes, defaults to the number of CPUs.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='User ids rebuilt per task.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ids = CustomUser.objects.aggregate(first_id=Min('id'), last_id=Max('id'))
+        chunks = []
+        if ids['first_id'] is not None:
+            chunks = get_chunks(ids['first_id'], ids['last_id'] - ids['first_id'] + 1, options['chunk_size'])
+        users = sum(run_chunks(derive_users, chunks, (), options['processes']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the stats of {users} user(s) in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,153 @@
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from main.models import CustomUser, Film
+
+HOST = 'localhost'
+
+
+def wsgi_request(application, url):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    started = time.perf_counter()
+    result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in result:
+            pass
+    finally:
+        result.close()
+    return time.perf_counter() - started, int(statuses[0].split()[0])
+
+
+async def asgi_request(application, url):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', HOST.encode())],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return time.perf_counter() - started, statuses[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the throughput of the sync read views under WSGI with the sync and async views under ASGI, '
+        'driving the applications in process at a given concurrency. To measure real servers instead, run '
+        '`gunicorn iwatched.wsgi --threads N` and `uvicorn iwatched.asgi:application` against the same URLs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once.')
+        parser.add_argument('--wsgi-threads', type=int, default=16, help='Threads of the simulated WSGI server.')
+
+    def handle(self, *args, **options):
+        film = Film.objects.order_by('id').only('id').first()
+        user = CustomUser.objects.order_by('id').only('id').first()
+        if film is None or user is None:
+            raise CommandError('Benchmarking needs at least one film and one user in the database.')
+        endpoints = [
+            ('films list', 'films', 'async_films', {}),
+            ('film detail', 'film', 'async_film', {'film_id': film.id}),
+            ('profile', 'profile', 'async_profile', {'user_id': user.id}),
+        ]
+        wsgi_application, asgi_application = get_wsgi_application(), get_asgi_application()
+        self.stdout.write(
+            f'{options["requests"]} requests per run, concurrency {options["concurrency"]}, '
+            f'{options["wsgi_threads"]} WSGI threads.'
+        )
+        for label, sync_name, async_name, kwargs in endpoints:
+            sync_url, async_url = reverse(sync_name, kwargs=kwargs), reverse(async_name, kwargs=kwargs)
+            runs = [
+                ('WSGI sync view', self.run_wsgi(wsgi_application, sync_url, options)),
+                ('ASGI sync view', self.run_asgi(asgi_application, sync_url, options)),
+                ('ASGI async view', self.run_asgi(asgi_application, async_url, options)),
+            ]
+            for mode, (elapsed, latencies, errors) in runs:
+                self.report(f'{label}, {mode}', elapsed, latencies, errors)
+
+    @staticmethod
+    def run_wsgi(application, url, options):
+        wsgi_request(application, url)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(options['wsgi_threads'], options['concurrency'])) as executor:
+            results = list(executor.map(lambda _: wsgi_request(application, url), range(options['requests'])))
+        return time.perf_counter() - started, *Command.split_results(results)
+
+    @staticmethod
+    def run_asgi(application, url, options):
+        async def run():
+            await asgi_request(application, url)
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def limited():
+                async with semaphore:
+                    return await asgi_request(application, url)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(limited() for _ in range(options['requests'])))
+            return time.perf_counter() - started, results
+
+        elapsed, results = asyncio.run(run())
+        return elapsed, *Command.split_results(results)
+
+    @staticmethod
+    def split_results(results):
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(status >= 400 for _, status in results)
+        return latencies, errors
+
+    def report(self, label, elapsed, latencies, errors):
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{label:<32} {len(latencies) / elapsed:8.0f} req/s  '
+            f'p50 {quantiles[49] * 1000:7.1f} ms  p95 {quantiles[94] * 1000:7.1f} ms  '
+            f'p99 {quantiles[98] * 1000:7.1f} ms  errors {errors}'
+        )
@@ -0,0 +1,93 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from main.benchmarks import (
+    DATASETS,
+    BenchmarkError,
+    check_coverage,
+    compare_results,
+    get_cases,
+    run_benchmarks,
+    seed_dataset,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and measure the latency percentiles, query count and peak memory '
+        'of every route of main.urls and main.api.urls. Results are written as JSON; with --baseline, any '
+        'regression against a previous run fails the command.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted(DATASETS), default='small', help='Dataset size preset.')
+        for size in DATASETS['small']:
+            parser.add_argument(f'--{size.replace("_", "-")}', type=int, help=f'Override the preset number of {size}.')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per endpoint.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the dataset.')
+        parser.add_argument('--warm-cache', action='store_true', help='Keep the response cache between requests.')
+        parser.add_argument('--only', nargs='+', help='Benchmark only the endpoints of these routes.')
+        parser.add_argument('--output', help='Write the results JSON here instead of to stdout.')
+        parser.add_argument('--baseline', help='Results JSON of a previous run to compare against.')
+        parser.add_argument('--latency-tolerance', type=float, default=0.5, help='Allowed p50 slowdown (0.5 = 50%%).')
+        parser.add_argument(
+            '--tail-latency-tolerance', type=float, help='Allowed p95 slowdown; p95 is only compared when given.'
+        )
+        parser.add_argument('--memory-tolerance', type=float, default=0.5, help='Allowed peak memory growth.')
+
+    def handle(self, *args, **options):
+        sizes = {size: options[size] or count for size, count in DATASETS[options['dataset']].items()}
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            started = time.perf_counter()
+            data = seed_dataset(sizes, seed=options['seed'])
+            self.stderr.write(f'Seeded {sizes} in {time.perf_counter() - started:.1f}s.')
+            cases = get_cases(data)
+            check_coverage(cases)
+            if options['only']:
+                cases = [case for case in cases if case.route in options['only']]
+            endpoints = run_benchmarks(data, cases, options['requests'], options['warm_cache'])
+        except BenchmarkError as error:
+            raise CommandError(error)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        results = {
+            'dataset': sizes,
+            'requests': options['requests'],
+            'warm_cache': options['warm_cache'],
+            'endpoints': endpoints,
+        }
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+            try:
+                regressions = compare_results(
+                    results,
+                    baseline,
+                    latency_tolerance=options['latency_tolerance'],
+                    tail_latency_tolerance=options['tail_latency_tolerance'],
+                    memory_tolerance=options['memory_tolerance'],
+                )
+            except BenchmarkError as error:
+                raise CommandError(error)
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}.'))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from main.benchmarks import DATASETS, benchmark_recommendations, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and measure the latency and query count of computing the recommendations '
+        'of the benchmark user (see main.recommendations), who rated films of the dataset and listed others.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=sorted(DATASETS), default='small', help='Dataset size preset.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the dataset.')
+        parser.add_argument('--calls', type=int, default=50, help='Timed recommendation computations.')
+        parser.add_argument('--limit', type=int, default=20, help='Films recommended per computation.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            started = time.perf_counter()
+            data = seed_dataset(DATASETS[options['dataset']], seed=options['seed'])
+            self.stderr.write(f'Seeded the {options["dataset"]} dataset in {time.perf_counter() - started:.1f}s.')
+            result = benchmark_recommendations(data.user, options['calls'], options['limit'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(
+            f'{result["films"]} films in {result["queries"]} queries, mean {result["mean_ms"]:.3f}ms, '
+            f'p50 {result["p50_ms"]:.3f}ms, p95 {result["p95_ms"]:.3f}ms'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Measured {options["calls"]} recommendation computations.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main.benchmarks import benchmark_throttle
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the cost of one sliding-window throttle check (see main.api.throttling) with the counters in '
+        'process memory and, with --shared-cache, in that cache alias.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checks', type=int, default=100000, help='Throttle checks per counter.')
+        parser.add_argument('--clients', type=int, default=1000, help='Distinct users or IPs the checks cycle over.')
+        parser.add_argument('--shared-cache', help='Also measure the counters kept in this cache alias.')
+
+    def handle(self, *args, **options):
+        results = benchmark_throttle(options['checks'], options['clients'], options['shared_cache'])
+        for name, micros in results.items():
+            self.stdout.write(f'{name}: {micros:.3f}us per check')
+        self.stdout.write(self.style.SUCCESS(f'Measured {options["checks"]} throttle checks per counter.'))
@@ -0,0 +1,36 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.recommendations import compute_neighbours, load_ratings, save_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Compute the top-K similar films of every film from rates (needs numpy and scipy).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help='Neighbours kept per film.')
+        parser.add_argument('--chunk-size', type=int, default=512, help='Films multiplied per block.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Neighbour rows per INSERT.')
+        parser.add_argument('--min-score', type=float, default=0.0, help='Drop neighbours scoring at or below this.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users, films, values = load_ratings()
+        loaded = time.perf_counter()
+        neighbours = compute_neighbours(
+            users, films, values,
+            top_k=options['top_k'],
+            chunk_size=options['chunk_size'],
+            min_score=options['min_score'],
+        )
+        with transaction.atomic():
+            saved = save_neighbours(neighbours, batch_size=options['batch_size'])
+        finished = time.perf_counter()
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {saved} neighbours from {len(values)} rates in {finished - started:.1f}s '
+            f'(loading {loaded - started:.1f}s, peak RSS {peak_memory:.0f} MiB).'
+        ))
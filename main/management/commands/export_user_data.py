@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.export import export_all_users, export_users, get_export_extension
+
+
+class Command(BaseCommand):
+    help = (
+        'Export users\' films lists, rates and comments as JSONL. With user ids every user gets its own file, '
+        'without them all users are exported into one file per shard across a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='Users to export, all users when omitted.')
+        parser.add_argument('--output', required=True, help='Directory the export files are written to.')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the export files.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip.')
+        parser.add_argument('--shard-size', type=int, default=1000, help='Users per file when exporting all users.')
+        parser.add_argument('--processes', type=int, help='Worker processes, defaults to the number of CPUs.')
+
+    def handle(self, *args, **options):
+        directory, compress, chunk_size = options['output'], options['gzip'], options['chunk_size']
+        os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        if options['user_ids']:
+            for user_id in options['user_ids']:
+                path = os.path.join(directory, f'user-{user_id}{get_export_extension(compress)}')
+                export_users([user_id], path, compress, chunk_size)
+            self.stdout.write(self.style.SUCCESS(f'Exported {len(options["user_ids"])} user(s) to {directory}.'))
+            return
+
+        files = users = 0
+        for path, shard_users in export_all_users(
+            directory, options['shard_size'], options['processes'], compress, chunk_size
+        ):
+            files += 1
+            users += shard_users
+            self.stdout.write(f'{path}: {shard_users} user(s).')
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {users} user(s) into {files} file(s) in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,97 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from main.api.cache import invalidate_films
+from main.dataset import (
+    derive_films,
+    derive_users,
+    generate_activity,
+    generate_films,
+    generate_franchises,
+    generate_genres,
+    generate_users,
+    get_chunks,
+    get_next_id,
+    reset_sequences,
+    run_chunks,
+)
+from main.models import CustomUser, Film, FilmsList, Franchise, Genre
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, films, genres, franchises, rates, list memberships and comments '
+        'with skewed film popularity and user activity, bulk inserted by a process pool. The values are the same '
+        'for the same --seed and --chunk-size, but not the ids of rates and comments or comment dates. '
+        'Run compute_similar_films afterwards for recommendations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help='Number of users.')
+        parser.add_argument('--films', type=int, default=100000, help='Number of films.')
+        parser.add_argument('--genres', type=int, default=30, help='Number of genres.')
+        parser.add_argument('--franchises', type=int, default=2000, help='Number of franchises.')
+        parser.add_argument('--rates', type=int, default=1000000, help='Approximate number of rates.')
+        parser.add_argument('--comments', type=int, default=200000, help='Approximate number of comments.')
+        parser.add_argument('--popularity-skew', type=float, default=1.0, help='Zipf exponent of film popularity.')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+        parser.add_argument('--processes', type=int, help='Worker processes, defaults to the number of CPUs.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Users or films generated per task.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+
+    def handle(self, *args, **options):
+        if options['films'] < 1 and (options['rates'] or options['comments']):
+            raise CommandError('Rates and comments need at least one film.')
+        seed, processes, batch_size = options['seed'], options['processes'], options['batch_size']
+        started = time.perf_counter()
+
+        first_genre_id, first_franchise_id = get_next_id(Genre), get_next_id(Franchise)
+        generate_genres(options['genres'], seed, batch_size)
+        generate_franchises(options['franchises'], seed, batch_size)
+        genre_ids = list(Genre.objects.filter(id__gte=first_genre_id).order_by('id').values_list('id', flat=True))
+        franchise_ids = list(
+            Franchise.objects.filter(id__gte=first_franchise_id).order_by('id').values_list('id', flat=True)
+        )
+
+        first_film_id, first_user_id, first_list_id = get_next_id(Film), get_next_id(CustomUser), get_next_id(FilmsList)
+        film_chunks = get_chunks(first_film_id, options['films'], options['chunk_size'])
+        user_chunks = get_chunks(first_user_id, options['users'], options['chunk_size'])
+        films = sum(run_chunks(
+            generate_films, film_chunks, (seed, first_film_id, genre_ids, franchise_ids, batch_size), processes
+        ))
+        self.report('films', films, started)
+        password = make_password(options['password'])
+        users = sum(run_chunks(
+            generate_users, user_chunks, (seed, first_user_id, first_list_id, password, batch_size), processes
+        ))
+        self.report('users with their films lists', users, started)
+        reset_sequences()
+
+        users_count = max(options['users'], 1)
+        activity_args = (
+            seed, first_user_id, first_list_id, (first_film_id, options['films'], options['popularity_skew']),
+            options['rates'] / users_count, options['comments'] / users_count, batch_size,
+        )
+        rates = memberships = comments = 0
+        for counts in run_chunks(generate_activity, user_chunks, activity_args, processes):
+            rates, memberships, comments = rates + counts[0], memberships + counts[1], comments + counts[2]
+        self.report('rates', rates, started)
+
+        derived = sum(run_chunks(derive_films, film_chunks, (), processes))
+        self.report('films with ratings, comment counts, search and leaderboard entries', derived, started)
+        derived = sum(run_chunks(derive_users, user_chunks, (), processes))
+        self.report('users with stats', derived, started)
+        # Bulk inserts send no signals, so evict the cached catalogue here
+        invalidate_films([])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {users} users, {films} films, {options["genres"]} genres, {options["franchises"]} '
+            f'franchises, {rates} rates, {memberships} list memberships and {comments} comments '
+            f'in {elapsed:.1f}s.'
+        ))
+
+    def report(self, label, count, started):
+        self.stdout.write(f'{count} {label} after {time.perf_counter() - started:.1f}s.')
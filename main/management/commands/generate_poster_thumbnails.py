@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.api.cache import invalidate_films
+from main.models import Film
+from main.posters import generate_many_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate the thumbnails of existing film posters across a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help='Worker processes, defaults to the number of CPUs.')
+        parser.add_argument('--chunk-size', type=int, default=16, help='Posters handed to a worker at a time.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Films updated per query.')
+        parser.add_argument('--force', action='store_true', help='Also process films that already have thumbnails.')
+
+    def handle(self, *args, **options):
+        films = Film.objects.exclude(poster='').exclude(poster__isnull=True)
+        if not options['force']:
+            films = films.filter(poster_hash='')
+        posters = list(films.order_by('id').values_list('id', 'poster'))
+        started = time.perf_counter()
+        done = failed = 0
+        batch = []
+        results = generate_many_thumbnails(posters, options['processes'], options['chunk_size'])
+        for film_id, poster_hash, error in results:
+            if error is not None:
+                failed += 1
+                self.stderr.write(f'Film {film_id}: {error}')
+                continue
+            batch.append(Film(id=film_id, poster_hash=poster_hash))
+            if len(batch) == options['batch_size']:
+                self.save(batch)
+                done += len(batch)
+                batch = []
+        self.save(batch)
+        done += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated thumbnails of {done} poster(s), {failed} failed, in {elapsed:.1f}s '
+            f'({done / max(elapsed, 1e-9):.1f} posters/sec).'
+        ))
+
+    @staticmethod
+    def save(films):
+        Film.objects.bulk_update(films, ['poster_hash'])
+        invalidate_films([film.id for film in films])
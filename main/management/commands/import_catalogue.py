@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.catalogue import CatalogueImportError, CatalogueImporter, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream a CSV or JSONL catalogue dump into films, genres and franchises, upserting films by '
+        'external_id. Progress is checkpointed after every committed batch so an interrupted import '
+        'can be resumed with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .csv or .jsonl catalogue dump.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records committed per transaction.')
+        parser.add_argument('--checkpoint', help='Checkpoint file, defaults to <path>.checkpoint.')
+        parser.add_argument('--resume', action='store_true', help='Continue after the last checkpointed batch.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        offset, done = 0, 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as file:
+                checkpoint = json.load(file)
+            offset, done = checkpoint['offset'], checkpoint['records']
+            self.stdout.write(f'Resuming after {done} record(s) at byte {offset}.')
+
+        importer = CatalogueImporter()
+        started = time.perf_counter()
+        created = updated = 0
+        batch = []
+        try:
+            for record, end_offset in read_records(path, offset):
+                batch.append(record)
+                if len(batch) == batch_size:
+                    created, updated = self.commit(importer, batch, created, updated)
+                    done += len(batch)
+                    self.save_checkpoint(checkpoint_path, end_offset, done)
+                    self.report(done, created + updated, started)
+                    batch = []
+            if batch:
+                created, updated = self.commit(importer, batch, created, updated)
+                done += len(batch)
+        except (CatalogueImportError, ValueError) as error:
+            raise CommandError(f'Import stopped after {done} record(s): {error}')
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created + updated} record(s): {created} created, {updated} updated '
+            f'in {elapsed:.1f}s ({(created + updated) / max(elapsed, 1e-9):.0f} rows/sec).'
+        ))
+
+    @staticmethod
+    def commit(importer, batch, created, updated):
+        batch_created, batch_updated = importer.import_batch(batch)
+        return created + batch_created, updated + batch_updated
+
+    @staticmethod
+    def save_checkpoint(path, offset, records):
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump({'offset': offset, 'records': records}, file)
+        os.replace(temporary_path, path)
+
+    def report(self, done, imported, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{done} record(s) done, {imported / max(elapsed, 1e-9):.0f} rows/sec.')
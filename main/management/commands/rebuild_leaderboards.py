@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Film, LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-genre and per-franchise film leaderboards from films, rates and films lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of films rebuilt per transaction.')
+        parser.add_argument('film_ids', nargs='*', type=int, help='Only rebuild the entries of these films.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        film_ids = Film.objects.order_by('id').values_list('id', flat=True)
+        if options['film_ids']:
+            film_ids = film_ids.filter(id__in=options['film_ids'])
+        else:
+            # Entries of films deleted without signals would otherwise survive
+            with transaction.atomic():
+                LeaderboardEntry.objects.exclude(film_id__in=Film.objects.values('id')).delete()
+        processed = 0
+        chunk = []
+        for film_id in film_ids.iterator(chunk_size=chunk_size):
+            chunk.append(film_id)
+            if len(chunk) == chunk_size:
+                processed += self.rebuild(chunk)
+                chunk = []
+        if chunk:
+            processed += self.rebuild(chunk)
+        entries = LeaderboardEntry.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {entries} leaderboard entries of {processed} film(s).'))
+
+    @staticmethod
+    def rebuild(film_ids):
+        with transaction.atomic():
+            LeaderboardEntry.rebuild(film_ids)
+        return len(film_ids)
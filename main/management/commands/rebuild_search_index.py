@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Film
+from main.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the film full-text search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of films indexed per transaction.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        backend = get_search_backend()
+        films = Film.objects.order_by('id').only('id', 'name', 'synopsis')
+        indexed = 0
+        with transaction.atomic():
+            backend.clear()
+        chunk = []
+        for film in films.iterator(chunk_size=chunk_size):
+            chunk.append(film)
+            if len(chunk) == chunk_size:
+                indexed += self.index(backend, chunk)
+                chunk = []
+        if chunk:
+            indexed += self.index(backend, chunk)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} film(s).'))
+
+    @staticmethod
+    def index(backend, films):
+        with transaction.atomic():
+            backend.index(films)
+        return len(films)
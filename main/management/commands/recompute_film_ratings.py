@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.api.cache import invalidate_films
+from main.models import Film
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating aggregates of films from their rates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of films repaired per transaction.')
+        parser.add_argument('film_ids', nargs='*', type=int, help='Only repair these films.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        film_ids = Film.objects.order_by('id').values_list('id', flat=True)
+        if options['film_ids']:
+            film_ids = film_ids.filter(id__in=options['film_ids'])
+        processed = 0
+        chunk = []
+        for film_id in film_ids.iterator(chunk_size=chunk_size):
+            chunk.append(film_id)
+            if len(chunk) == chunk_size:
+                processed += self.recompute(chunk)
+                chunk = []
+        if chunk:
+            processed += self.recompute(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings for {processed} film(s).'))
+
+    @staticmethod
+    def recompute(film_ids):
+        with transaction.atomic():
+            Film.recompute_ratings(film_ids)
+            # Bulk updates skip the signals evicting cached responses
+            invalidate_films(film_ids)
+        return len(film_ids)
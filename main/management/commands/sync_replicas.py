@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary database into the SQLite files standing in for its read replicas '
+        '(settings.DATABASE_REPLICAS), emulating replication for local testing. Run it again to catch up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', help='Replica aliases to sync, defaults to all of them.')
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or settings.DATABASE_REPLICAS
+        unknown = set(replicas) - set(settings.DATABASE_REPLICAS)
+        if unknown:
+            raise CommandError(f'Not replicas: {", ".join(sorted(unknown))}.')
+        aliases = [DEFAULT_DB_ALIAS, *replicas]
+        vendors = {connections[alias].vendor for alias in aliases}
+        if vendors != {'sqlite'}:
+            raise CommandError('Only SQLite databases can be synced.')
+        started = time.perf_counter()
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        for alias in replicas:
+            # Django's connection to the replica would hold the file open while it's replaced
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'Synced {alias}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced {len(replicas)} replica(s) in {time.perf_counter() - started:.1f}s.'
+        ))
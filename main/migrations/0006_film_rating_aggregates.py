@@ -0,0 +1,75 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+from main.constants import VALUES_CHOICES
+
+
+def fill_film_ratings(apps, schema_editor):
+    Film = apps.get_model("main", "Film")
+    Rate = apps.get_model("main", "Rate")
+    films = {}
+    rows = Rate.objects.order_by().values('film_id', 'value').annotate(total=models.Count('id'))
+    for row in rows:
+        film = films.setdefault(row['film_id'], Film(id=row['film_id']))
+        setattr(film, f"rating_count_{row['value']}", row['total'])
+        film.rating_sum += row['value'] * row['total']
+        film.rating_count += row['total']
+        film.rating_avg = film.rating_sum / film.rating_count
+    fields = ['rating_sum', 'rating_count', 'rating_avg'] + [f'rating_count_{value}' for value, _ in VALUES_CHOICES]
+    Film.objects.bulk_update(films.values(), fields, batch_size=1000)
+
+
+def delete_film_ratings(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_alter_filmslist_film'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='rating_avg',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_count_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_film_ratings, delete_film_ratings),
+    ]
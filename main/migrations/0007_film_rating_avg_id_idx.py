@@ -0,0 +1,22 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_film_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='film',
+            name='rating_avg',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['rating_avg', 'id'], name='film_rating_avg_id_idx'),
+        ),
+    ]
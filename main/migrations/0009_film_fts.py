@@ -0,0 +1,34 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:40
+
+from django.db import migrations
+
+
+def create_film_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Film = apps.get_model("main", "Film")
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS main_film_fts USING fts5("
+        "name, synopsis, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO main_film_fts (rowid, name, synopsis) VALUES (%s, %s, %s)',
+            Film.objects.values_list('id', 'name', 'synopsis').iterator(),
+        )
+
+
+def delete_film_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS main_film_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_alter_genre_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_film_fts, delete_film_fts),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_film_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarFilm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_films', to='main.film')),
+                ('similar_film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='main.film')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='similarfilm',
+            index=models.Index(fields=['film', '-score'], name='similar_film_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarfilm',
+            unique_together={('film', 'similar_film')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_similarfilm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
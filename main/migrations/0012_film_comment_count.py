@@ -0,0 +1,35 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+def fill_film_comment_counts(apps, schema_editor):
+    Film = apps.get_model("main", "Film")
+    Comment = apps.get_model("main", "Comment")
+    rows = Comment.objects.order_by().values('film_id').annotate(total=models.Count('id'))
+    films = [Film(id=row['film_id'], comment_count=row['total']) for row in rows]
+    Film.objects.bulk_update(films, ['comment_count'], batch_size=1000)
+
+
+def delete_film_comment_counts(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_film_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['film', 'date', 'id'], name='comment_film_date_idx'),
+        ),
+        migrations.RunPython(fill_film_comment_counts, delete_film_comment_counts),
+    ]
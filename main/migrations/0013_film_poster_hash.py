@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_film_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='poster_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
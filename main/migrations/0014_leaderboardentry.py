@@ -0,0 +1,42 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_film_poster_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(choices=[('genre', 'genre'), ('franchise', 'franchise')], max_length=10)),
+                ('group_id', models.PositiveBigIntegerField()),
+                ('weighted_rating', models.FloatField()),
+                ('watched_count', models.PositiveIntegerField(default=0)),
+                ('planned_count', models.PositiveIntegerField(default=0)),
+                ('film', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='main.film')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['group', 'group_id', '-weighted_rating', 'id'], name='leaderboard_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['group', 'group_id', '-watched_count', 'id'], name='leaderboard_watched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['group', 'group_id', '-planned_count', 'id'], name='leaderboard_planned_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaderboardentry',
+            unique_together={('group', 'group_id', 'film')},
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.10 on 2026-10-18 12:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('planned_count', models.PositiveIntegerField(default=0)),
+                ('watched_count', models.PositiveIntegerField(default=0)),
+                ('dropped_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_avg', models.FloatField(blank=True, null=True)),
+                ('rating_count_1', models.PositiveIntegerField(default=0)),
+                ('rating_count_2', models.PositiveIntegerField(default=0)),
+                ('rating_count_3', models.PositiveIntegerField(default=0)),
+                ('rating_count_4', models.PositiveIntegerField(default=0)),
+                ('rating_count_5', models.PositiveIntegerField(default=0)),
+                ('genre_counts', models.JSONField(default=dict)),
+            ],
+            bases=(main.models.RatingAggregatesMixin, models.Model),
+        ),
+    ]
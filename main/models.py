@@ -1,7 +1,22 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, NullIf
 
-from main.constants import VALUES_CHOICES, FILM_LIST_TYPES
+from main.constants import (
+    ACTIVITY_VERBS,
+    DROPPED_TYPE,
+    FILM_LIST_TYPES,
+    LEADERBOARD_FRANCHISE,
+    LEADERBOARD_GENRE,
+    LEADERBOARD_GROUPS,
+    PLANNED_TYPE,
+    VALUES_CHOICES,
+    WATCHED_TYPE,
+)
+
+RATING_HISTOGRAM_FIELDS = {value: f'rating_count_{value}' for value, _ in VALUES_CHOICES}
+RATING_FIELDS = ['rating_sum', 'rating_count', 'rating_avg', *RATING_HISTOGRAM_FIELDS.values()]
 
 
 class Franchise(models.Model):
@@ -12,26 +27,126 @@ class Franchise(models.Model):
 
 
 class Genre(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
 
     def __str__(self):
         return self.name
 
 
-class Film(models.Model):
+class RatingAggregatesMixin:
+    """
+    Denormalized aggregates of a set of rates: `rating_sum`, `rating_count`,
+    `rating_avg` and one `rating_count_<value>` field per rate value.
+    """
+
+    @property
+    def rating_histogram(self):
+        return {value: getattr(self, field) for value, field in RATING_HISTOGRAM_FIELDS.items()}
+
+    def set_rating_histogram(self, histogram):
+        for value, field in RATING_HISTOGRAM_FIELDS.items():
+            setattr(self, field, histogram.get(value, 0))
+        self.rating_count = sum(histogram.values())
+        self.rating_sum = sum(value * count for value, count in histogram.items())
+        self.rating_avg = self.rating_sum / self.rating_count if self.rating_count else None
+
+    @staticmethod
+    def get_rate_change_updates(old_value=None, new_value=None):
+        """UPDATE expressions shifting the aggregates by one rate change."""
+        sum_delta = (new_value or 0) - (old_value or 0)
+        count_delta = (new_value is not None) - (old_value is not None)
+        updates = {
+            'rating_sum': models.F('rating_sum') + sum_delta,
+            'rating_count': models.F('rating_count') + count_delta,
+            'rating_avg': (
+                (models.F('rating_sum') + sum_delta) * 1.0
+                / NullIf(models.F('rating_count') + count_delta, models.Value(0))
+            ),
+        }
+        if old_value is not None:
+            field = RATING_HISTOGRAM_FIELDS[old_value]
+            updates[field] = models.F(field) - 1
+        if new_value is not None:
+            field = RATING_HISTOGRAM_FIELDS[new_value]
+            updates[field] = updates.get(field, models.F(field)) + 1
+        return updates
+
+
+class Film(RatingAggregatesMixin, models.Model):
     name = models.CharField(max_length=200)
     synopsis = models.TextField()
     genre = models.ManyToManyField(Genre, blank=True, related_name='films')
     poster = models.ImageField(null=True, blank=True)
+    # Content hash of the poster its thumbnails are named after, see main.posters
+    poster_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     release_date = models.DateField(null=True, blank=True)
     franchise = models.ForeignKey(Franchise, null=True, blank=True, on_delete=models.SET_NULL, related_name='films')
+    # Key of the film in external catalogue dumps, used by import_catalogue to upsert
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    # Denormalized rating aggregates, kept in sync with Rate rows by main.signals
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(null=True, blank=True, editable=False)
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
+    # Maintained by main.signals on Comment create/delete
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination over ordering=film_rating seeks on (rating_avg, id)
+            models.Index(fields=['rating_avg', 'id'], name='film_rating_avg_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name} (object ID {self.id})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored franchise so signals can invalidate its films too
+        instance._stored_franchise_id = instance.__dict__.get('franchise_id')
+        # and the stored poster so they only regenerate thumbnails for a new one
+        instance._stored_poster = instance.__dict__.get('poster')
+        return instance
+
     @property
     def rating(self):
-        return self.rates.all().aggregate(models.Avg('value'))['value__avg']
+        return self.rating_avg
+
+    @classmethod
+    def apply_rate_change(cls, film_id, old_value=None, new_value=None):
+        """
+        Shift the rating aggregates of a film by one rate change in a single UPDATE.
+        `old_value` is None for a new rate, `new_value` is None for a deleted one.
+        """
+        cls.objects.filter(id=film_id).update(**cls.get_rate_change_updates(old_value, new_value))
+
+    @classmethod
+    def apply_comment_change(cls, film_id, delta):
+        cls.objects.filter(id=film_id).update(comment_count=models.F('comment_count') + delta)
+
+    @classmethod
+    def recompute_ratings(cls, film_ids):
+        """Rebuild the rating aggregates of the given films from their Rate rows."""
+        histograms = {film_id: {} for film_id in film_ids}
+        rows = (
+            Rate.objects.filter(film_id__in=histograms).order_by()
+            .values('film_id', 'value').annotate(total=models.Count('id'))
+            .values_list('film_id', 'value', 'total')
+        )
+        for film_id, value, total in rows:
+            histograms[film_id][value] = total
+        films = []
+        for film_id, histogram in histograms.items():
+            film = cls(id=film_id)
+            film.set_rating_histogram(histogram)
+            films.append(film)
+        cls.objects.bulk_update(films, RATING_FIELDS)
+        LeaderboardEntry.refresh_ratings(film_ids)
 
 
 class CustomUser(AbstractUser):
@@ -40,6 +155,14 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f'{self.email}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored credentials so signals can invalidate cached tokens on change
+        instance._stored_password = instance.__dict__.get('password')
+        instance._stored_is_active = instance.__dict__.get('is_active')
+        return instance
+
 
 class FilmsList(models.Model):
     type = models.IntegerField(choices=FILM_LIST_TYPES)
@@ -53,6 +176,34 @@ class FilmsList(models.Model):
     def __str__(self):
         return f'Films list by - {self.user}. Type: {self.type}'
 
+    @classmethod
+    def move_films(cls, user_id, film_types):
+        """
+        Put every film of `film_types` (film id -> list type) into the user's
+        list of that type and out of their other lists, in one transaction:
+        a row lock on the user's lists, one DELETE and one INSERT on the through table.
+        The user's stats are shifted by the films' previous and new list types.
+        Returns the ids of the films that weren't in their new list already.
+        """
+        through = cls.film.through
+        with transaction.atomic():
+            # Concurrent moves for the same user queue here, so a film never ends up in two lists
+            list_ids = dict(cls.objects.select_for_update().filter(user_id=user_id).values_list('type', 'id'))
+            memberships = through.objects.filter(filmslist__user_id=user_id, film_id__in=film_types)
+            previous_types = list(memberships.values_list('film_id', 'filmslist__type'))
+            memberships.delete()
+            through.objects.bulk_create([
+                through(filmslist_id=list_ids[list_type], film_id=film_id)
+                for film_id, list_type in film_types.items()
+            ])
+            LeaderboardEntry.refresh_counts(film_types)
+            UserStats.apply_list_changes(user_id, [
+                *((film_id, list_type, -1) for film_id, list_type in previous_types),
+                *((film_id, list_type, 1) for film_id, list_type in film_types.items()),
+            ])
+        previous = dict(previous_types)
+        return [film_id for film_id, list_type in film_types.items() if previous.get(film_id) != list_type]
+
 
 class Comment(models.Model):
     film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='comments')
@@ -60,6 +211,12 @@ class Comment(models.Model):
     text = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A film's comments are paginated newest first, keyset on (date, id)
+            models.Index(fields=['film', 'date', 'id'], name='comment_film_date_idx'),
+        ]
+
     def __str__(self):
         return f'Comment object ID {self.id}'
 
@@ -74,3 +231,300 @@ class Rate(models.Model):
 
     def __str__(self):
         return f'{self.value} star(s) rate by {self.user} for {self.film}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored value so signals can apply the delta on update
+        instance._stored_value = instance.__dict__.get('value')
+        return instance
+
+
+class SimilarFilm(models.Model):
+    """Precomputed item-item neighbour of a film, see main.recommendations."""
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='similar_films')
+    similar_film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ['film', 'similar_film']
+        indexes = [
+            models.Index(fields=['film', '-score'], name='similar_film_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.similar_film_id} similar to {self.film_id} ({self.score:.3f})'
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A film's scores in the leaderboards of one of its genres or of its franchise.
+
+    Every board is an index on (group, group_id, score, id), so a page of a
+    leaderboard is a range scan whatever the size of the group. Entries are
+    kept in sync by main.signals and the bulk writers, and rebuilt by the
+    rebuild_leaderboards command.
+    """
+    # Public board names and the score field they rank by, best first
+    boards = {
+        'top-rated': 'weighted_rating',
+        'most-watched': 'watched_count',
+        'most-planned': 'planned_count',
+    }
+    counted_list_types = {WATCHED_TYPE: 'watched_count', PLANNED_TYPE: 'planned_count'}
+
+    group = models.CharField(max_length=10, choices=LEADERBOARD_GROUPS)
+    group_id = models.PositiveBigIntegerField()
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    weighted_rating = models.FloatField()
+    watched_count = models.PositiveIntegerField(default=0)
+    planned_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['group', 'group_id', 'film']
+        indexes = [
+            models.Index(fields=['group', 'group_id', '-weighted_rating', 'id'], name='leaderboard_rating_idx'),
+            models.Index(fields=['group', 'group_id', '-watched_count', 'id'], name='leaderboard_watched_idx'),
+            models.Index(fields=['group', 'group_id', '-planned_count', 'id'], name='leaderboard_planned_idx'),
+        ]
+
+    def __str__(self):
+        return f'Film {self.film_id} in {self.group} {self.group_id} leaderboards'
+
+    @staticmethod
+    def get_weighted_rating(rating_sum, rating_count):
+        """
+        Bayesian average: the film's rates plus LEADERBOARD_PRIOR_VOTES votes of
+        LEADERBOARD_PRIOR_RATING, so a film needs many rates to rank on them alone.
+        """
+        prior_votes = settings.LEADERBOARD_PRIOR_VOTES
+        return (rating_sum + settings.LEADERBOARD_PRIOR_RATING * prior_votes) * 1.0 / (rating_count + prior_votes)
+
+    @classmethod
+    def get_list_counts(cls, film_ids):
+        """{film_id: {'watched_count': n, 'planned_count': n}} of the given films, missing films counting 0."""
+        counts = {film_id: dict.fromkeys(cls.counted_list_types.values(), 0) for film_id in film_ids}
+        rows = (
+            FilmsList.film.through.objects.filter(film_id__in=counts, filmslist__type__in=cls.counted_list_types)
+            .order_by().values('film_id', 'filmslist__type').annotate(total=models.Count('id'))
+            .values_list('film_id', 'filmslist__type', 'total')
+        )
+        for film_id, list_type, total in rows:
+            counts[film_id][cls.counted_list_types[list_type]] = total
+        return counts
+
+    @classmethod
+    def rebuild(cls, film_ids):
+        """Recreate the entries of the given films from their genres, franchise, rating aggregates and lists."""
+        film_ids = list(film_ids)
+        films = Film.objects.filter(id__in=film_ids).values_list('id', 'franchise_id', 'rating_sum', 'rating_count')
+        groups = {film_id: [] for film_id in film_ids}
+        for film_id, genre_id in Film.genre.through.objects.filter(film_id__in=film_ids).values_list(
+            'film_id', 'genre_id'
+        ):
+            groups[film_id].append((LEADERBOARD_GENRE, genre_id))
+        counts = cls.get_list_counts(film_ids)
+        entries = []
+        for film_id, franchise_id, rating_sum, rating_count in films:
+            film_groups = groups[film_id] + ([(LEADERBOARD_FRANCHISE, franchise_id)] if franchise_id else [])
+            weighted_rating = cls.get_weighted_rating(rating_sum, rating_count)
+            entries.extend(
+                cls(group=group, group_id=group_id, film_id=film_id, weighted_rating=weighted_rating, **counts[film_id])
+                for group, group_id in film_groups
+            )
+        with transaction.atomic():
+            cls.objects.filter(film_id__in=film_ids).delete()
+            cls.objects.bulk_create(entries)
+
+    @classmethod
+    def refresh_ratings(cls, film_ids):
+        """Copy the films' rating aggregates into their entries, in one UPDATE."""
+        ratings = Film.objects.filter(id=models.OuterRef('film_id')).values(
+            weighted_rating=cls.get_weighted_rating(models.F('rating_sum'), models.F('rating_count'))
+        )
+        cls.objects.filter(film_id__in=film_ids).update(weighted_rating=models.Subquery(ratings))
+
+    @classmethod
+    def refresh_counts(cls, film_ids):
+        """Recount the watched and planned lists of the given films into their entries, in one UPDATE."""
+        updates = {}
+        for list_type, field in cls.counted_list_types.items():
+            memberships = (
+                FilmsList.film.through.objects.filter(film_id=models.OuterRef('film_id'), filmslist__type=list_type)
+                .order_by().values('film_id').annotate(total=models.Count('id')).values('total')
+            )
+            updates[field] = Coalesce(models.Subquery(memberships), 0)
+        cls.objects.filter(film_id__in=film_ids).update(**updates)
+
+
+class UserStats(RatingAggregatesMixin, models.Model):
+    """
+    A user's statistics read by the profile stats endpoint: films per list
+    type, the rating aggregates of their rates and `genre_counts`, the number
+    of watched films per genre id. Kept in sync with rates and lists by
+    main.signals and FilmsList.move_films, and rebuilt by the backfill_user_stats
+    command, which also picks up film genre edits and film deletions.
+    """
+    list_count_fields = {PLANNED_TYPE: 'planned_count', WATCHED_TYPE: 'watched_count', DROPPED_TYPE: 'dropped_count'}
+
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    planned_count = models.PositiveIntegerField(default=0)
+    watched_count = models.PositiveIntegerField(default=0)
+    dropped_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(null=True, blank=True)
+    rating_count_1 = models.PositiveIntegerField(default=0)
+    rating_count_2 = models.PositiveIntegerField(default=0)
+    rating_count_3 = models.PositiveIntegerField(default=0)
+    rating_count_4 = models.PositiveIntegerField(default=0)
+    rating_count_5 = models.PositiveIntegerField(default=0)
+    genre_counts = models.JSONField(default=dict)
+    # Maintained by main.signals on Follow create/delete
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Approximate number of the user's FeedItem rows, see main.feed
+    feed_length = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'Stats of user {self.user_id}'
+
+    @classmethod
+    def apply_rate_change(cls, user_id, old_value=None, new_value=None):
+        """Shift the rating aggregates of a user by one rate change in a single UPDATE, like Film.apply_rate_change."""
+        cls.objects.filter(user_id=user_id).update(**cls.get_rate_change_updates(old_value, new_value))
+
+    @classmethod
+    def apply_list_changes(cls, user_id, changes):
+        """
+        Shift the list counts and genre counts of a user by (film_id, list_type, delta) changes.
+        Only the genre counts need the row read, under a row lock, for watched films.
+        """
+        type_deltas, watched_deltas = {}, {}
+        for film_id, list_type, delta in changes:
+            type_deltas[list_type] = type_deltas.get(list_type, 0) + delta
+            if list_type == WATCHED_TYPE:
+                watched_deltas[film_id] = watched_deltas.get(film_id, 0) + delta
+        updates = {
+            cls.list_count_fields[list_type]: models.F(cls.list_count_fields[list_type]) + delta
+            for list_type, delta in type_deltas.items() if delta
+        }
+        watched_deltas = {film_id: delta for film_id, delta in watched_deltas.items() if delta}
+        if not watched_deltas:
+            if updates:
+                cls.objects.filter(user_id=user_id).update(**updates)
+            return
+        with transaction.atomic(savepoint=False):
+            genre_counts = cls.objects.select_for_update().filter(user_id=user_id).values_list(
+                'genre_counts', flat=True
+            ).first()
+            if genre_counts is None:
+                return
+            film_genres = Film.genre.through.objects.filter(film_id__in=watched_deltas).values_list(
+                'film_id', 'genre_id'
+            )
+            for film_id, genre_id in film_genres:
+                count = genre_counts.get(str(genre_id), 0) + watched_deltas[film_id]
+                if count > 0:
+                    genre_counts[str(genre_id)] = count
+                else:
+                    genre_counts.pop(str(genre_id), None)
+            cls.objects.filter(user_id=user_id).update(genre_counts=genre_counts, **updates)
+
+    @classmethod
+    def recompute(cls, user_ids):
+        """Rebuild the stats of the given users from their lists and rates."""
+        stats = {user_id: cls(user_id=user_id) for user_id in user_ids}
+        list_counts = (
+            FilmsList.film.through.objects.filter(filmslist__user_id__in=stats).order_by()
+            .values('filmslist__user_id', 'filmslist__type').annotate(total=models.Count('id'))
+            .values_list('filmslist__user_id', 'filmslist__type', 'total')
+        )
+        for user_id, list_type, total in list_counts:
+            setattr(stats[user_id], cls.list_count_fields[list_type], total)
+        histograms = {user_id: {} for user_id in stats}
+        rates = (
+            Rate.objects.filter(user_id__in=stats).order_by().values('user_id', 'value')
+            .annotate(total=models.Count('id')).values_list('user_id', 'value', 'total')
+        )
+        for user_id, value, total in rates:
+            histograms[user_id][value] = total
+        genre_counts = (
+            Film.genre.through.objects.filter(
+                film__films_lists__user_id__in=stats, film__films_lists__type=WATCHED_TYPE
+            ).order_by().values('film__films_lists__user_id', 'genre_id').annotate(total=models.Count('id'))
+            .values_list('film__films_lists__user_id', 'genre_id', 'total')
+        )
+        for user_id, genre_id, total in genre_counts:
+            stats[user_id].genre_counts[str(genre_id)] = total
+        counts = (
+            ('follower_count', Follow.objects.filter(followee_id__in=stats), 'followee_id'),
+            ('following_count', Follow.objects.filter(follower_id__in=stats), 'follower_id'),
+            ('feed_length', FeedItem.objects.filter(user_id__in=stats), 'user_id'),
+        )
+        for field, queryset, user_field in counts:
+            totals = queryset.order_by().values(user_field).annotate(total=models.Count('id'))
+            for user_id, total in totals.values_list(user_field, 'total'):
+                setattr(stats[user_id], field, total)
+        for user_id, user_stats in stats.items():
+            user_stats.set_rating_histogram(histograms[user_id])
+        with transaction.atomic():
+            cls.objects.filter(user_id__in=stats).delete()
+            cls.objects.bulk_create(stats.values())
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='followers')
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['follower', 'followee']
+        indexes = [
+            # Fan-out reads the followers of an actor
+            models.Index(fields=['followee', 'follower'], name='follow_followee_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.follower_id} follows {self.followee_id}'
+
+
+class ActivityEvent(models.Model):
+    """
+    A rate, comment or list move shown in the feeds of the actor's followers,
+    see main.feed. `value` is the rate value or the list type.
+    """
+    actor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='activity_events')
+    verb = models.PositiveSmallIntegerField(choices=ACTIVITY_VERBS)
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='activity_events')
+    value = models.IntegerField(null=True, blank=True)
+    comment = models.ForeignKey(
+        Comment, null=True, blank=True, on_delete=models.CASCADE, related_name='activity_events'
+    )
+    # False for events of accounts with too many followers, which feeds pull at read time
+    fanned_out = models.BooleanField(default=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['actor', '-id'], name='activity_actor_idx'),
+            models.Index(
+                fields=['-id', 'actor'], condition=models.Q(fanned_out=False), name='activity_pulled_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.actor_id} {self.get_verb_display()} film {self.film_id}'
+
+
+class FeedItem(models.Model):
+    """An event fanned out to the feed inbox of one of the actor's followers."""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='feed_items')
+    event = models.ForeignKey(ActivityEvent, on_delete=models.CASCADE, related_name='feed_items')
+
+    class Meta:
+        # Also serves the newest-first inbox pages, read backwards
+        unique_together = ['user', 'event']
+
+    def __str__(self):
+        return f'Event {self.event_id} in the feed of {self.user_id}'
@@ -0,0 +1,114 @@
+"""
+Poster thumbnails in the sizes of `settings.POSTER_THUMBNAIL_SIZES`.
+
+Thumbnails are named after a hash of the poster's content and of the
+thumbnail settings, so a new poster (or new sizes) gets new URLs and the
+files themselves never change: they can be served with far-future cache
+headers. Films store the hash in `poster_hash`, empty until generated.
+"""
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+THUMBNAIL_DIRECTORY = 'thumbnails'
+IMAGE_ERRORS = (OSError, Image.DecompressionBombError)
+
+logger = logging.getLogger(__name__)
+
+
+def get_thumbnail_extension():
+    return settings.POSTER_THUMBNAIL_FORMAT.lower()
+
+
+def get_poster_hash(data):
+    spec = f'{sorted(settings.POSTER_THUMBNAIL_SIZES.values())}:{settings.POSTER_THUMBNAIL_FORMAT}:' \
+           f'{settings.POSTER_THUMBNAIL_QUALITY}'
+    return hashlib.sha256(spec.encode('utf-8') + data).hexdigest()[:20]
+
+
+def get_thumbnail_name(poster_hash, size_name):
+    width, height = settings.POSTER_THUMBNAIL_SIZES[size_name]
+    return f'{THUMBNAIL_DIRECTORY}/{poster_hash}-{width}x{height}.{get_thumbnail_extension()}'
+
+
+def get_thumbnail_urls(poster_hash, storage=default_storage):
+    if not poster_hash:
+        return None
+    return {
+        size_name: storage.url(get_thumbnail_name(poster_hash, size_name))
+        for size_name in settings.POSTER_THUMBNAIL_SIZES
+    }
+
+
+def render_thumbnail(image, size):
+    """Encode `image` shrunk to fit within `size`, keeping its aspect ratio and never upscaling."""
+    thumbnail = image.copy()
+    thumbnail.thumbnail(size, Image.Resampling.LANCZOS)
+    output = BytesIO()
+    thumbnail.save(output, settings.POSTER_THUMBNAIL_FORMAT, quality=settings.POSTER_THUMBNAIL_QUALITY, method=4)
+    return output.getvalue()
+
+
+def generate_thumbnails(poster_name, storage=default_storage):
+    """Write the thumbnails of a stored poster that don't exist yet and return the poster hash."""
+    with storage.open(poster_name, 'rb') as file:
+        data = file.read()
+    poster_hash = get_poster_hash(data)
+    names = {size_name: get_thumbnail_name(poster_hash, size_name) for size_name in settings.POSTER_THUMBNAIL_SIZES}
+    missing = {size_name: name for size_name, name in names.items() if not storage.exists(name)}
+    if not missing:
+        return poster_hash
+
+    image = Image.open(BytesIO(data))
+    # Let JPEG decode straight at a reduced scale, the largest thumbnail only needs that much
+    image.draft('RGB', max(settings.POSTER_THUMBNAIL_SIZES.values()))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    for size_name, name in missing.items():
+        content = ContentFile(render_thumbnail(image, settings.POSTER_THUMBNAIL_SIZES[size_name]))
+        saved_name = storage.save(name, content)
+        if saved_name != name:
+            # Another worker wrote the same content first, keep its file
+            storage.delete(saved_name)
+    return poster_hash
+
+
+def generate_film_thumbnails(film):
+    """Generate the thumbnails of a film's poster and store the hash, or clear it when there is no poster."""
+    poster_hash = ''
+    if film.poster:
+        try:
+            poster_hash = generate_thumbnails(film.poster.name)
+        except IMAGE_ERRORS as error:
+            logger.warning('Could not generate thumbnails of film %s poster %s: %s', film.id, film.poster.name, error)
+    if poster_hash != film.poster_hash:
+        type(film).objects.filter(id=film.id).update(poster_hash=poster_hash)
+        film.poster_hash = poster_hash
+
+
+def _generate_thumbnails(item):
+    film_id, poster_name = item
+    try:
+        return film_id, generate_thumbnails(poster_name), None
+    except IMAGE_ERRORS as error:
+        return film_id, None, str(error)
+
+
+def generate_many_thumbnails(posters, processes=None, chunk_size=16):
+    """
+    Generate the thumbnails of many (film_id, poster_name) pairs across a process
+    pool. Workers only touch storage, not the database. Yields
+    (film_id, poster_hash, error) in input order.
+    """
+    if processes == 1:
+        yield from map(_generate_thumbnails, posters)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield from executor.map(_generate_thumbnails, posters, chunksize=chunk_size)
@@ -0,0 +1,275 @@
+"""
+Per-request timing, see RequestProfilingMiddleware.
+
+Every request gets a RequestProfile in a context variable: the middleware
+times it, a database execute wrapper records each query, and serializers add
+their time through `timed('serialize')` and events such as cache hits through
+`count()`. Context variables follow the request
+into sync_to_async threads, so the async views' pooled queries are recorded
+too (see `record_queries`).
+
+Under ASGI the middleware stays on the event loop and records the queries of
+the async views only; cProfile and stack sampling, which follow one thread,
+are left to sync requests.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current_profile = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    duplicates_reported = 5
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.queries = []
+        self.timings = defaultdict(float)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, duration):
+        with self._lock:
+            self.queries.append((sql, duration))
+
+    def add_timing(self, name, duration):
+        with self._lock:
+            self.timings[name] += duration
+
+    def add_count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def query_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def get_duplicate_queries(self):
+        """SQL run more than once in the request, with their counts: the signature of N+1 lookups."""
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common(self.duplicates_reported) if count > 1]
+
+    def get_duplicate_count(self):
+        return sum(count - 1 for count in Counter(sql for sql, _ in self.queries).values())
+
+    def server_timing(self):
+        queries, duplicates = len(self.queries), self.get_duplicate_count()
+        metrics = [
+            f'total;dur={self.elapsed * 1000:.1f}',
+            f'db;dur={self.query_time * 1000:.1f};desc="{queries} queries ({duplicates} duplicate)"',
+        ]
+        metrics.extend(f'{name};dur={duration * 1000:.1f}' for name, duration in sorted(self.timings.items()))
+        metrics.extend(f'{name};desc="{count}"' for name, count in sorted(self.counts.items()))
+        return ', '.join(metrics)
+
+    def as_dict(self, request, response):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(self.elapsed * 1000, 3),
+            'db_ms': round(self.query_time * 1000, 3),
+            'queries': len(self.queries),
+            'duplicate_queries': self.get_duplicate_count(),
+            'top_duplicates': [{'sql': sql, 'count': count} for sql, count in self.get_duplicate_queries()],
+            **{f'{name}_ms': round(duration * 1000, 3) for name, duration in sorted(self.timings.items())},
+            **dict(sorted(self.counts.items())),
+        }
+
+
+def get_current_profile():
+    return _current_profile.get()
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timing."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_timing(name, time.perf_counter() - started)
+
+
+def count(name):
+    """Count an event of the current request, e.g. a cache hit, so logs and Server-Timing show its rate."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_count(name)
+
+
+class QueryRecorder:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.profile.add_query(sql, time.perf_counter() - started)
+
+
+def record_queries():
+    """Record the queries of this thread's connections, replicas included, into the current request's profile."""
+    stack = ExitStack()
+    profile = _current_profile.get()
+    if profile is not None:
+        recorder = QueryRecorder(profile)
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class StackSampler:
+    """
+    One daemon thread sampling the stacks of the threads serving requests
+    every `interval` seconds, so a request that turns out slow has its
+    samples at hand without having run under cProfile.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self.samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='request-stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self.samples.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self.samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self.collapse(frame)] += 1
+
+    @staticmethod
+    def collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+_stack_samplers = {}
+
+
+def get_stack_sampler(interval):
+    if interval not in _stack_samplers:
+        _stack_samplers[interval] = StackSampler(interval)
+    return _stack_samplers[interval]
+
+
+def get_profile_path(request, elapsed, extension):
+    directory = settings.REQUEST_PROFILING_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{slug}-{elapsed * 1000:.0f}ms-{os.getpid()}'
+    return os.path.join(directory, f'{name}{extension}')
+
+
+class RequestProfilingMiddleware:
+    """
+    Time every request: wall time, SQL query count and time with duplicate
+    queries, and the timings recorded with `timed()`. They are logged as JSON
+    by `main.profiling` and, with `settings.REQUEST_PROFILING_HEADER`, sent
+    back in a Server-Timing header.
+
+    A `settings.REQUEST_PROFILING_SAMPLE_RATE` share of the requests runs
+    under cProfile (a `.prof` file), and with
+    `settings.REQUEST_PROFILING_SLOW_MS` every request's stack is sampled and
+    requests slower than that are saved in folded format (a `.folded` file,
+    for flamegraph.pl or speedscope), both in
+    `settings.REQUEST_PROFILING_DIRECTORY`.
+    """
+
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        profiler = sampler = None
+        if random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        elif settings.REQUEST_PROFILING_SLOW_MS is not None:
+            sampler = get_stack_sampler(settings.REQUEST_PROFILING_STACK_INTERVAL_MS / 1000)
+            sampler.start(threading.get_ident())
+        try:
+            with record_queries():
+                if profiler is not None:
+                    response = profiler.runcall(self.get_response, request)
+                else:
+                    response = self.get_response(request)
+        finally:
+            profile.finish()
+            _current_profile.reset(token)
+            samples = sampler.stop(threading.get_ident()) if sampler is not None else None
+
+        if profiler is not None:
+            profiler.dump_stats(get_profile_path(request, profile.elapsed, '.prof'))
+        if samples and profile.elapsed * 1000 >= settings.REQUEST_PROFILING_SLOW_MS:
+            with open(get_profile_path(request, profile.elapsed, '.folded'), 'w') as file:
+                file.writelines(f'{stack} {count}\n' for stack, count in samples.items())
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.finish()
+            _current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    @staticmethod
+    def report(request, response, profile):
+        if settings.REQUEST_PROFILING_HEADER:
+            response['Server-Timing'] = profile.server_timing()
+        logger.info(json.dumps(profile.as_dict(request, response)))
+        return response
@@ -0,0 +1,111 @@
+"""
+Item-item collaborative filtering over Rate rows.
+
+Needs numpy and scipy, which are only imported by the functions computing
+the neighbour table; the API reads the precomputed SimilarFilm rows.
+"""
+from array import array
+from collections import defaultdict
+
+from main.models import Film, FilmsList, Rate, SimilarFilm
+
+
+def load_ratings(chunk_size=10000):
+    """Stream (user_id, film_id, value) of every rate into three compact arrays."""
+    users, films, values = array('q'), array('q'), array('b')
+    rows = Rate.objects.order_by().values_list('user_id', 'film_id', 'value')
+    for user_id, film_id, value in rows.iterator(chunk_size=chunk_size):
+        users.append(user_id)
+        films.append(film_id)
+        values.append(value)
+    return users, films, values
+
+
+def compute_neighbours(users, films, values, top_k=20, chunk_size=512, min_score=0.0):
+    """
+    Top-K most similar films per film by mean-centered (adjusted) cosine similarity.
+
+    Builds a sparse user x film matrix, subtracts each user's mean rating,
+    L2-normalizes the film columns and multiplies them in blocks of
+    `chunk_size` films, so memory is bounded by one sparse block product.
+    Yields (film_id, similar_film_id, score) triples.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    user_ids, user_index = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    film_ids, film_index = np.unique(np.frombuffer(films, dtype=np.int64), return_inverse=True)
+    ratings = np.frombuffer(values, dtype=np.int8).astype(np.float32)
+    if not len(ratings):
+        return
+
+    user_sums = np.bincount(user_index, weights=ratings, minlength=len(user_ids))
+    user_counts = np.bincount(user_index, minlength=len(user_ids))
+    centered = ratings - (user_sums / user_counts)[user_index].astype(np.float32)
+
+    matrix = sparse.csc_matrix((centered, (user_index, film_index)), shape=(len(user_ids), len(film_ids)))
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = (matrix @ sparse.diags(1.0 / norms).astype(np.float32)).tocsc()
+    transposed = matrix.T.tocsr()
+
+    for start in range(0, len(film_ids), chunk_size):
+        block = (transposed[start:start + chunk_size] @ matrix).tocsr()
+        for row in range(block.shape[0]):
+            row_start, row_end = block.indptr[row], block.indptr[row + 1]
+            scores = block.data[row_start:row_end]
+            columns = block.indices[row_start:row_end]
+            keep = (scores > min_score) & (columns != start + row)
+            scores, columns = scores[keep], columns[keep]
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                scores, columns = scores[best], columns[best]
+            film_id = int(film_ids[start + row])
+            for column, score in zip(columns.tolist(), scores.tolist()):
+                yield film_id, int(film_ids[column]), float(score)
+
+
+def save_neighbours(neighbours, batch_size=5000):
+    """Replace the SimilarFilm table with the given (film_id, similar_film_id, score) triples."""
+    SimilarFilm.objects.all().delete()
+    batch = []
+    saved = 0
+    for film_id, similar_film_id, score in neighbours:
+        batch.append(SimilarFilm(film_id=film_id, similar_film_id=similar_film_id, score=score))
+        if len(batch) == batch_size:
+            SimilarFilm.objects.bulk_create(batch)
+            saved += len(batch)
+            batch = []
+    SimilarFilm.objects.bulk_create(batch)
+    return saved + len(batch)
+
+
+def get_similar_films(film_id):
+    return Film.objects.filter(similar_to__film_id=film_id).order_by('-similar_to__score', 'id')
+
+
+def get_recommended_film_ids(user, limit):
+    """
+    Films scored by the similarity to the films the user rated, weighted by how
+    far each rate is from the user's mean, leaving out rated and listed films.
+    """
+    rates = dict(Rate.objects.filter(user=user).values_list('film_id', 'value'))
+    if not rates:
+        return []
+    mean = sum(rates.values()) / len(rates)
+    rated_films = Rate.objects.filter(user=user).values('film_id')
+    listed_films = FilmsList.film.through.objects.filter(filmslist__user=user).values('film_id')
+    # Subqueries rather than the rated ids as parameters, which SQLite caps per statement
+    neighbours = (
+        SimilarFilm.objects.filter(film_id__in=rated_films)
+        .exclude(similar_film_id__in=listed_films)
+        .exclude(similar_film_id__in=rated_films)
+        .values_list('film_id', 'similar_film_id', 'score')
+    )
+    scores = defaultdict(float)
+    for film_id, similar_film_id, score in neighbours:
+        # A rate equal to the mean still counts a little, so single-rate users get results
+        scores[similar_film_id] += score * ((rates[film_id] - mean) or 0.1)
+    ranked = sorted((item for item in scores.items() if item[1] > 0), key=lambda item: (-item[1], item[0]))
+    return [film_id for film_id, _ in ranked[:limit]]
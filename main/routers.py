@@ -0,0 +1,165 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the `default` (primary) database. Reads go to a replica
+of `settings.DATABASE_REPLICAS` only inside a request routed by
+`main.api.routing.ReplicaReadMixin`, and only until the request writes, so
+everything else (management commands, signals, write requests) reads the
+primary.
+
+DatabaseRoutingMiddleware keeps the routing state of the current request and
+pins users who wrote to the primary for `settings.DATABASE_REPLICA_PIN_SECONDS`,
+so they read their own writes despite replication lag. `ReplicaPool` checks the
+replicas with a `SELECT 1` at most every `settings.DATABASE_REPLICA_HEALTH_INTERVAL`
+seconds and skips those that failed.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PINNED_KEY = 'db:pinned:{}'
+
+_current_routing = ContextVar('database_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+
+
+def get_routing_state():
+    return _current_routing.get()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current_routing.get()
+        if state is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current_routing.get()
+        if state is not None:
+            # Later reads of the request must see this write
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication, see the sync_replicas command
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPool:
+    """The replicas that answered their last health check, checked again every `interval` seconds."""
+
+    def __init__(self):
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checked.get(alias)
+        if checked is not None and now - checked[0] < settings.DATABASE_REPLICA_HEALTH_INTERVAL:
+            return checked[1]
+        healthy = self.check(alias)
+        with self._lock:
+            self._checked[alias] = (now, healthy)
+        return healthy
+
+    @staticmethod
+    def check(alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        except DatabaseError:
+            connections[alias].close()
+            return False
+        return True
+
+    def mark_unhealthy(self, alias):
+        with self._lock:
+            self._checked[alias] = (time.monotonic(), False)
+
+    def choose(self):
+        """A random healthy replica, or None when none is."""
+        replicas = list(settings.DATABASE_REPLICAS)
+        random.shuffle(replicas)
+        return next((alias for alias in replicas if self.is_healthy(alias)), None)
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+def get_pin_cache():
+    return caches[settings.DATABASE_PIN_CACHE]
+
+
+def pin_to_primary(user_id):
+    get_pin_cache().set(PINNED_KEY.format(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return bool(get_pin_cache().get(PINNED_KEY.format(user_id)))
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Give every request its routing state, and pin users who wrote to the
+    primary. Async-capable, so it doesn't move the async views off the event loop.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        if state.wrote:
+            self.pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_routing.reset(token)
+        if state.wrote:
+            # The user may be a lazy object still to be loaded
+            await sync_to_async(self.pin_writer)(request)
+        return response
+
+    @staticmethod
+    def pin_writer(request):
+        # DRF sets the user it authenticated on the underlying request
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and settings.DATABASE_REPLICAS:
+            pin_to_primary(user.id)
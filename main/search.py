@@ -0,0 +1,113 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_search_terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+class BaseSearchBackend(ABC):
+    """
+    Film full-text search backend.
+
+    `search()` narrows a Film queryset to the films matching the query and
+    annotates them with `search_rank`, lower ranks being better matches. The
+    index is fed through `index()`/`remove()`, called from main.signals on
+    Film save/delete and by the `rebuild_search_index` command.
+    """
+
+    def index(self, films):
+        pass
+
+    def remove(self, film_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def search(self, queryset, query):
+        pass
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Index-less fallback matching terms with LIKE, for databases without a full-text engine."""
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(synopsis__icontains=term))
+        return queryset.annotate(search_rank=Case(
+            When(name__icontains=terms[0], then=Value(0.0)),
+            default=Value(1.0),
+            output_field=FloatField(),
+        ))
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    SQLite FTS5 index over film names and synopses, keyed by film id (the FTS rowid).
+
+    Every query term is matched as a prefix and results are ranked with BM25,
+    name matches weighing `name_weight` times synopsis matches.
+    """
+    table = 'main_film_fts'
+    name_weight = 10.0
+    synopsis_weight = 1.0
+
+    def index(self, films):
+        rows = [(film.id, film.name, film.synopsis) for film in films]
+        if not rows:
+            return
+        self.remove([row[0] for row in rows])
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, name, synopsis) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, film_ids, chunk_size=500):
+        film_ids = list(film_ids)
+        with connection.cursor() as cursor:
+            # One statement per chunk, staying under SQLite's bound parameter limit
+            for start in range(0, len(film_ids), chunk_size):
+                chunk = film_ids[start:start + chunk_size]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', chunk)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    @staticmethod
+    def build_match_expression(terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset.none()
+        film_table = queryset.model._meta.db_table
+        expression = self.build_match_expression(terms)
+        # FTS5 seeks the rowid in the term doclists, so ranking a match costs an index lookup, not a table scan
+        rank = RawSQL(
+            f'SELECT bm25({self.table}, {self.name_weight}, {self.synopsis_weight}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "{film_table}"."id"',
+            [expression],
+            output_field=FloatField(),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [expression])
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(settings.FILM_SEARCH_BACKEND)()
@@ -1,8 +1,26 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.db.models import F
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
 
-from main.constants import FILM_LIST_TYPES
-from main.models import CustomUser, FilmsList
+from main.api.authentication import invalidate_tokens
+from main.api.cache import invalidate_films
+from main.constants import FILM_LIST_TYPES, LEADERBOARD_FRANCHISE, LEADERBOARD_GENRE
+from main.models import (
+    CustomUser,
+    FilmsList,
+    Film,
+    Rate,
+    Comment,
+    Genre,
+    Franchise,
+    Follow,
+    LeaderboardEntry,
+    UserStats,
+    RATING_FIELDS,
+)
+from main.posters import generate_film_thumbnails
+from main.search import get_search_backend
 
 
 @receiver(post_save, sender=CustomUser)
@@ -10,3 +28,226 @@ def create_list_post_save(sender, instance, created, **kwargs):
     if created:
         for list_type in FILM_LIST_TYPES:
             FilmsList.objects.create(type=list_type[0], user=instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def create_stats_post_save(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.create(user=instance)
+
+
+# Queryset updates send no post_save: a bulk deactivation or password reset has to call
+# invalidate_tokens() with the tokens of its users, or they stay authenticated until their tokens expire
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not {'password', 'is_active'} & set(update_fields)):
+        return
+    stored = (getattr(instance, '_stored_password', None), getattr(instance, '_stored_is_active', None))
+    if stored != (instance.password, instance.is_active):
+        # Unknown stored values (an instance not loaded from the database) invalidate too
+        invalidate_tokens(Token.objects.filter(user_id=instance.id).values_list('key', flat=True))
+    instance._stored_password = instance.password
+    instance._stored_is_active = instance.is_active
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_post_delete(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+def refresh_cached_film_rating(rate):
+    if Rate.film.is_cached(rate):
+        try:
+            rate.film.refresh_from_db(fields=RATING_FIELDS)
+        except Film.DoesNotExist:
+            pass
+
+
+@receiver(post_save, sender=Rate)
+def update_ratings_post_save(sender, instance, created, **kwargs):
+    if created:
+        Film.apply_rate_change(instance.film_id, new_value=instance.value)
+        UserStats.apply_rate_change(instance.user_id, new_value=instance.value)
+        LeaderboardEntry.refresh_ratings([instance.film_id])
+    elif not hasattr(instance, '_stored_value'):
+        # The previous value is unknown, so the delta can't be applied
+        Film.recompute_ratings([instance.film_id])
+        UserStats.recompute([instance.user_id])
+    elif instance._stored_value != instance.value:
+        Film.apply_rate_change(instance.film_id, old_value=instance._stored_value, new_value=instance.value)
+        UserStats.apply_rate_change(instance.user_id, old_value=instance._stored_value, new_value=instance.value)
+        LeaderboardEntry.refresh_ratings([instance.film_id])
+    else:
+        return
+    instance._stored_value = instance.value
+    refresh_cached_film_rating(instance)
+
+
+@receiver(post_delete, sender=Rate)
+def update_ratings_post_delete(sender, instance, **kwargs):
+    old_value = getattr(instance, '_stored_value', instance.value)
+    Film.apply_rate_change(instance.film_id, old_value=old_value)
+    UserStats.apply_rate_change(instance.user_id, old_value=old_value)
+    LeaderboardEntry.refresh_ratings([instance.film_id])
+    refresh_cached_film_rating(instance)
+
+
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+def invalidate_rated_film_cache(sender, instance, **kwargs):
+    invalidate_films([instance.film_id])
+
+
+def refresh_cached_film_comment_count(comment):
+    if Comment.film.is_cached(comment):
+        try:
+            comment.film.refresh_from_db(fields=['comment_count'])
+        except Film.DoesNotExist:
+            pass
+
+
+@receiver(post_save, sender=Comment)
+def update_film_comment_count_post_save(sender, instance, created, **kwargs):
+    if created:
+        Film.apply_comment_change(instance.film_id, 1)
+        refresh_cached_film_comment_count(instance)
+    # Film details show the latest comments, so edits evict them too, but lists only show the count
+    invalidate_films([instance.film_id], catalogue=created)
+
+
+@receiver(post_delete, sender=Comment)
+def update_film_comment_count_post_delete(sender, instance, **kwargs):
+    Film.apply_comment_change(instance.film_id, -1)
+    refresh_cached_film_comment_count(instance)
+    invalidate_films([instance.film_id])
+
+
+# Connected before invalidate_film_cache, so cached responses are evicted after the new poster_hash is stored
+@receiver(post_save, sender=Film)
+def generate_poster_thumbnails_post_save(sender, instance, **kwargs):
+    poster_name = instance.poster.name or None
+    if poster_name != (getattr(instance, '_stored_poster', None) or None) or (poster_name and not instance.poster_hash):
+        generate_film_thumbnails(instance)
+    instance._stored_poster = poster_name
+
+
+# Also connected before invalidate_film_cache, which moves `_stored_franchise_id` to the new franchise
+@receiver(post_save, sender=Film)
+def rebuild_film_leaderboards_post_save(sender, instance, created, **kwargs):
+    if instance.franchise_id != getattr(instance, '_stored_franchise_id', None):
+        LeaderboardEntry.rebuild([instance.id])
+
+
+@receiver(post_save, sender=Film)
+@receiver(post_delete, sender=Film)
+def invalidate_film_cache(sender, instance, **kwargs):
+    # Films of the same franchise list this one in their `franchise_films`
+    franchise_ids = {instance.franchise_id, getattr(instance, '_stored_franchise_id', None)} - {None}
+    franchise_films = Film.objects.filter(franchise_id__in=franchise_ids).values_list('id', flat=True)
+    invalidate_films([instance.id, *(franchise_films if franchise_ids else [])])
+    instance._stored_franchise_id = instance.franchise_id
+
+
+@receiver(m2m_changed, sender=Film.genre.through)
+def invalidate_film_genres_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        invalidate_films(pk_set if reverse else [instance.id])
+    elif action == 'pre_clear':
+        invalidate_films(instance.films.values_list('id', flat=True) if reverse else [instance.id])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Franchise)
+@receiver(pre_delete, sender=Franchise)
+def invalidate_films_group_cache(sender, instance, **kwargs):
+    invalidate_films(instance.films.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Film)
+def index_film_post_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'synopsis'} & set(update_fields):
+        get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Film)
+def unindex_film_post_delete(sender, instance, **kwargs):
+    get_search_backend().remove([instance.id])
+
+
+@receiver(m2m_changed, sender=Film.genre.through)
+def rebuild_film_genres_leaderboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        LeaderboardEntry.rebuild(pk_set if reverse else [instance.id])
+    elif action == 'pre_clear':
+        instance._cleared_film_ids = list(instance.films.values_list('id', flat=True)) if reverse else [instance.id]
+    elif action == 'post_clear':
+        LeaderboardEntry.rebuild(instance._cleared_film_ids)
+
+
+@receiver(m2m_changed, sender=FilmsList.film.through)
+def refresh_listed_films_leaderboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and instance.type not in LeaderboardEntry.counted_list_types:
+        return
+    if action in ('post_add', 'post_remove'):
+        LeaderboardEntry.refresh_counts([instance.id] if reverse else pk_set)
+    elif action == 'pre_clear':
+        instance._cleared_film_ids = [instance.id] if reverse else list(instance.film.values_list('id', flat=True))
+    elif action == 'post_clear':
+        LeaderboardEntry.refresh_counts(instance._cleared_film_ids)
+
+
+@receiver(m2m_changed, sender=FilmsList.film.through)
+def update_user_stats_list_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # A film added to or removed from lists: recount their users
+        if action in ('post_add', 'post_remove'):
+            UserStats.recompute(set(FilmsList.objects.filter(id__in=pk_set).values_list('user_id', flat=True)))
+        elif action == 'pre_clear':
+            instance._stats_user_ids = set(instance.films_lists.values_list('user_id', flat=True))
+        elif action == 'post_clear':
+            UserStats.recompute(instance._stats_user_ids)
+        return
+    if action == 'post_add':
+        UserStats.apply_list_changes(instance.user_id, [(film_id, instance.type, 1) for film_id in pk_set])
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() signals every given film, listed or not
+        films = instance.film.filter(id__in=pk_set) if action == 'pre_remove' else instance.film.all()
+        instance._stats_film_ids = list(films.values_list('id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        changes = [(film_id, instance.type, -1) for film_id in instance._stats_film_ids]
+        UserStats.apply_list_changes(instance.user_id, changes)
+
+
+# Lists are deleted with their user, which removes their films without m2m_changed
+@receiver(pre_delete, sender=FilmsList)
+def collect_films_list_films_pre_delete(sender, instance, **kwargs):
+    if instance.type in LeaderboardEntry.counted_list_types:
+        instance._deleted_film_ids = list(instance.film.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=FilmsList)
+def refresh_films_list_leaderboards_post_delete(sender, instance, **kwargs):
+    if getattr(instance, '_deleted_film_ids', None):
+        LeaderboardEntry.refresh_counts(instance._deleted_film_ids)
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Franchise)
+def delete_group_leaderboards_post_delete(sender, instance, **kwargs):
+    group = LEADERBOARD_GENRE if sender is Genre else LEADERBOARD_FRANCHISE
+    LeaderboardEntry.objects.filter(group=group, group_id=instance.id).delete()
+
+
+@receiver(post_save, sender=Follow)
+def update_follow_counts_post_save(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.filter(user_id=instance.follower_id).update(following_count=F('following_count') + 1)
+        UserStats.objects.filter(user_id=instance.followee_id).update(follower_count=F('follower_count') + 1)
+
+
+# Also sent for the follows deleted with either user
+@receiver(post_delete, sender=Follow)
+def update_follow_counts_post_delete(sender, instance, **kwargs):
+    UserStats.objects.filter(user_id=instance.follower_id).update(following_count=F('following_count') - 1)
+    UserStats.objects.filter(user_id=instance.followee_id).update(follower_count=F('follower_count') - 1)
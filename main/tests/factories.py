@@ -2,7 +2,7 @@ import factory
 from faker import Factory
 
 from main.constants import ONE, FIVE
-from main.models import Film, CustomUser, Rate, Genre, Comment
+from main.models import Film, CustomUser, Rate, Genre, Comment, Franchise
 
 faker = Factory.create()
 
@@ -14,6 +14,13 @@ class GenreFactory(factory.django.DjangoModelFactory):
     name = factory.Faker('word')
 
 
+class FranchiseFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Franchise
+
+    name = factory.Faker('word')
+
+
 class FilmFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Film
@@ -30,7 +37,7 @@ class CustomUserFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = CustomUser
 
-    username = factory.Faker('first_name')
+    username = factory.Sequence(lambda n: f'{faker.first_name()}{n}')
     email = factory.LazyAttribute(lambda o: '%s@example.org' % o.username.lower())
     password = factory.Faker('password')
 
@@ -39,6 +46,8 @@ class RateFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = Rate
 
+    user = factory.SubFactory(CustomUserFactory)
+    film = factory.SubFactory(FilmFactory)
     value = factory.Faker('random_int', min=ONE, max=FIVE)
 
 
@@ -1,17 +1,55 @@
+import gzip
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
 from collections import OrderedDict
+from io import StringIO
 
 import factory
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TransactionTestCase, override_settings
 from django.urls import reverse
 from faker import Faker
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
-from main.api.serializers import FilmDetailSerializer
-from main.constants import FIVE, TWO
-from main.models import Rate
+from main.api.authentication import (
+    get_revoked_key,
+    get_token_cache_stats,
+    invalidate_tokens,
+    reset_token_cache_stats,
+    token_cache,
+)
+from main.api.cache import get_cache_stats, reset_cache_stats
+from main.api.fieldsets import SparseFieldsetMixin
+from main.api.pagination import KeysetPagination
+from main.api.serializers import (
+    CommentCreateSerializer,
+    FilmDetailSerializer,
+    FilmsListsBatchSerializer,
+    RateSerializer,
+    RegisterSerializer,
+    UserFilmsListUpdateSerializer,
+)
+from main.api.throttling import LocalWindowCounter, get_wait, reset_throttles
+from main.constants import FIVE, PLANNED_TYPE, TWO, WATCHED_TYPE
+from main.feed import follow
+from main.routers import DatabaseRoutingMiddleware, get_routing_state, is_pinned_to_primary, replica_pool
+from main.models import CustomUser, FeedItem, Film, Follow, Rate, UserStats
+from main.profiling import RequestProfile, StackSampler
 from main.tests.factories import (
+    CommentFactory,
     FilmFactory,
+    FranchiseFactory,
     GenreFactory,
     CustomUserFactory,
     RateFactory,
@@ -34,7 +72,7 @@ class FilmsListAPITestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, expected_data)
+        self.assertEqual(response.data['results'], expected_data)
 
     def test_get_filter_genre(self):
         self.film_1.genre.add(GenreFactory(name=self.genre_name))
@@ -44,7 +82,59 @@ class FilmsListAPITestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, expected_data)
+        self.assertEqual(response.data['results'], expected_data)
+
+    def test_get_filter_all_genres(self):
+        action, drama = GenreFactory(name='action'), GenreFactory(name='drama')
+        self.film_1.genre.add(action, drama)
+        self.film_2.genre.add(action)
+        url = reverse('films') + '?genre=action,drama'
+        expected_data = FilmDetailSerializer([self.film_1, ], many=True).data
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], expected_data)
+
+    def test_get_filter_any_genre(self):
+        self.film_1.genre.add(GenreFactory(name='action'))
+        self.film_2.genre.add(GenreFactory(name='drama'))
+        FilmFactory().genre.add(GenreFactory(name='comedy'))
+        url = reverse('films') + '?genre=action,drama,unknown&match=any'
+        expected_data = FilmDetailSerializer([self.film_1, self.film_2], many=True).data
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], expected_data)
+
+    def test_get_filter_all_genres_with_unknown_genre(self):
+        self.film_1.genre.add(GenreFactory(name='action'))
+        url = reverse('films') + '?genre=action,unknown'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_get_filter_genre_invalid_match(self):
+        url = reverse('films') + '?genre=action&match=some'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_filter_genres_query_count_is_constant(self):
+        genres = [GenreFactory(name=f'genre-{index}') for index in range(10)]
+        self.film_1.genre.add(*genres)
+        for count in (1, 10):
+            url = reverse('films') + '?genre=' + ','.join(genre.name for genre in genres[:count])
+
+            # genre ids, films page, genres
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+
+            self.assertEqual([film['id'] for film in response.data['results']], [self.film_1.id])
 
     def test_get_films_order_by_rating(self):
         RateFactory(user=self.user, film=self.film_1, value=FIVE)
@@ -55,11 +145,79 @@ class FilmsListAPITestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, expected_data)
+        self.assertEqual(response.data['results'], expected_data)
+
+    def test_get_paginated_by_cursor(self):
+        films = [self.film_1, self.film_2] + FilmFactory.create_batch(3)
+        url = reverse('films') + '?page_size=2'
+
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([film['id'] for film in response.data['results']])
+            url = response.data['next']
+
+        self.assertEqual(pages, [[films[0].id, films[1].id], [films[2].id, films[3].id], [films[4].id]])
+        self.assertNotIn('total', response.data)
+
+    def test_get_paginated_previous_cursor(self):
+        FilmFactory.create_batch(3)
+        first_page = self.client.get(reverse('films') + '?page_size=2').data
+        second_page = self.client.get(first_page['next']).data
+
+        response = self.client.get(second_page['previous'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], first_page['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_get_paginated_order_by_rating_with_ties_and_unrated(self):
+        film_3 = FilmFactory()
+        film_4 = FilmFactory()
+        RateFactory(user=self.user, film=self.film_2, value=FIVE)
+        RateFactory(user=self.user, film=film_3, value=TWO)
+        RateFactory(user=self.user, film=film_4, value=FIVE)
+        url = reverse('films') + '?ordering=-film_rating&page_size=1'
+
+        film_ids = []
+        while url:
+            response = self.client.get(url)
+            film_ids.extend(film['id'] for film in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(film_ids, [film_4.id, self.film_2.id, film_3.id, self.film_1.id])
+
+    def test_get_paginated_with_total(self):
+        url = reverse('films') + '?with_total=1'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 2)
+
+    def test_get_invalid_cursor(self):
+        url = reverse('films') + '?cursor=invalid'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_cursor_with_wrong_typed_values(self):
+        urls = [
+            reverse('films') + '?cursor=' + KeysetPagination.build_cursor(['first']),
+            reverse('films') + '?ordering=-film_rating&cursor=' + KeysetPagination.build_cursor([{'rating': 5}, 1]),
+        ]
+
+        for url in urls:
+            response = self.client.get(url)
+
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
 class CommentCreateAPITestCase(APITestCase):
     def setUp(self):
+        reset_throttles()
         self.film = FilmFactory()
         self.user = CustomUserFactory()
         self.comment = 'test text'
@@ -102,6 +260,7 @@ class CommentCreateAPITestCase(APITestCase):
 
 class CreateUpdateRateAPITestCase(APITestCase):
     def setUp(self):
+        reset_throttles()
         self.film = FilmFactory()
         self.user = CustomUserFactory()
         self.token = Token.objects.create(user=self.user)
@@ -158,6 +317,9 @@ class CreateUpdateRateAPITestCase(APITestCase):
         self.assertEqual(response.data, expected_data)
         existing_rate.refresh_from_db()
         self.assertEqual(existing_rate.value, self.new_value)
+        self.film.refresh_from_db()
+        self.assertEqual(self.film.rating, self.new_value)
+        self.assertEqual(self.film.rating_count, 1)
 
     def test_update_film_rate_logged_in_user_invalid_data(self):
         existing_rate = RateFactory(user=self.user, film=self.film, value=self.value)
@@ -302,6 +464,95 @@ class AddFilmToListAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertTrue(self.film in self.user_1.films_lists.first().film.all())
 
+    def test_post_add_film_to_list_not_found(self):
+        url = reverse('add_to_list', kwargs={'film_id': self.film.id, 'films_list_id': 999999999})
+
+        response = self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_film_from_list_query_count(self):
+        films_list = self.user_1.films_lists.first()
+        films_list.film.add(self.film)
+        url = reverse('add_to_list', kwargs={'film_id': self.film.id, 'films_list_id': films_list.id})
+        self.client.get(reverse('films'), HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        # films list, film, membership check, listed films check, delete, then recount the film's leaderboard
+        # lists and shift the user's stats
+        with self.assertNumQueries(7):
+            response = self.client.delete(url, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_post_move_film_query_count(self):
+        films_list = self.user_1.films_lists.get(type=WATCHED_TYPE)
+        self.user_1.films_lists.get(type=PLANNED_TYPE).film.add(self.film)
+        url = reverse('add_to_list', kwargs={'film_id': self.film.id, 'films_list_id': films_list.id})
+        self.client.get(reverse('films'), HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        # films list, film, then in a savepoint: lock user's lists, previous memberships, delete them, insert
+        # the membership, recount the film's leaderboard lists, lock the user's stats, film genres, update stats
+        with self.assertNumQueries(12):
+            response = self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.film.films_lists.all()), [films_list])
+
+
+class FilmsListsBatchAPITestCase(APITestCase):
+    def setUp(self):
+        self.films = FilmFactory.create_batch(3)
+        self.user_1 = CustomUserFactory()
+        self.user_2 = CustomUserFactory()
+        self.token_1 = Token.objects.create(user=self.user_1)
+        self.token_2 = Token.objects.create(user=self.user_2)
+        self.url = reverse('films_lists_batch', kwargs={'user_id': self.user_1.id})
+
+    def test_post_move_films(self):
+        planned = self.user_1.films_lists.get(type=PLANNED_TYPE)
+        watched = self.user_1.films_lists.get(type=WATCHED_TYPE)
+        planned.film.add(self.films[0], self.films[1])
+        self.user_2.films_lists.get(type=PLANNED_TYPE).film.add(self.films[0])
+        payload_data = {'watched': [self.films[0].id, self.films[2].id], 'planned': [self.films[1].id]}
+
+        response = self.client.post(
+            self.url, payload_data, format='json', HTTP_AUTHORIZATION='Token {}'.format(self.token_1)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(planned.film.order_by('id')), [self.films[1]])
+        self.assertEqual(list(watched.film.order_by('id')), [self.films[0], self.films[2]])
+        self.assertEqual(list(self.user_2.films_lists.get(type=PLANNED_TYPE).film.all()), [self.films[0]])
+
+    def test_post_film_in_two_lists(self):
+        payload_data = {'watched': [self.films[0].id], 'dropped': [self.films[0].id]}
+
+        response = self.client.post(
+            self.url, payload_data, format='json', HTTP_AUTHORIZATION='Token {}'.format(self.token_1)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_post_unknown_film(self):
+        payload_data = {'watched': [self.films[0].id, 999999999]}
+
+        response = self.client.post(
+            self.url, payload_data, format='json', HTTP_AUTHORIZATION='Token {}'.format(self.token_1)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.user_1.films_lists.get(type=WATCHED_TYPE).film.exists())
+
+    def test_post_with_another_user(self):
+        payload_data = {'watched': [self.films[0].id]}
+
+        response = self.client.post(
+            self.url, payload_data, format='json', HTTP_AUTHORIZATION='Token {}'.format(self.token_2)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(self.user_1.films_lists.get(type=WATCHED_TYPE).film.exists())
+
 
 class UserFilmsListsPrivateStatusAPITestCase(APITestCase):
     def setUp(self):
@@ -360,6 +611,26 @@ class UserFilmsListsPrivateStatusAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertEqual(self.user_1.films_lists.first().private, True)
 
+    def test_patch_user_films_list_private_status_update_not_found(self):
+        url = reverse('private', kwargs={'user_id': self.user_1.id, 'films_list_id': 999999999})
+
+        response = self.client.patch(url, self.payload_data, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patch_user_films_list_private_status_update_query_count(self):
+        url = reverse('private', kwargs={
+            'user_id': self.user_1.id,
+            'films_list_id': self.user_1.films_lists.first().id,
+        })
+        self.client.get(reverse('films'), HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        # films list, update
+        with self.assertNumQueries(2):
+            response = self.client.patch(url, self.payload_data, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 
 class UserProfileFilmsListsAPITestCase(APITestCase):
     def setUp(self):
@@ -383,7 +654,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.first().type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.first().private)
+                        ('private', self.user_1.films_lists.first().private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 ),
                 OrderedDict(
@@ -392,7 +665,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.get(id=2).type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.get(id=2).private)
+                        ('private', self.user_1.films_lists.get(id=2).private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 ),
                 OrderedDict(
@@ -401,7 +676,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.get(id=3).type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.get(id=3).private)
+                        ('private', self.user_1.films_lists.get(id=3).private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 )
             ]
@@ -464,7 +741,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.first().type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.first().private)
+                        ('private', self.user_1.films_lists.first().private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 ),
                 OrderedDict(
@@ -473,7 +752,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.get(id=2).type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.get(id=2).private)
+                        ('private', self.user_1.films_lists.get(id=2).private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 ),
                 OrderedDict(
@@ -482,7 +763,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.get(id=3).type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.get(id=3).private)
+                        ('private', self.user_1.films_lists.get(id=3).private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 )
             ]
@@ -511,7 +794,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.first().type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.first().private)
+                        ('private', self.user_1.films_lists.first().private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 )
             ]
@@ -541,7 +826,9 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
                         ('type', self.user_1.films_lists.first().type),
                         ('user', self.user_1.id),
                         ('film', []),
-                        ('private', self.user_1.films_lists.first().private)
+                        ('private', self.user_1.films_lists.first().private),
+                        ('films_count', 0),
+                        ('films_next', None)
                     ]
                 )
             ]
@@ -551,3 +838,1295 @@ class UserProfileFilmsListsAPITestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, expected_data)
+
+    def test_get_user_films_list_first_page_and_next(self):
+        films_list = self.user_1.films_lists.first()
+        films = FilmFactory.create_batch(3)
+        films_list.film.add(*films)
+        url = reverse('profile', kwargs={'user_id': self.user_1.id}) + '?films_limit=2'
+        self.client.force_login(self.user_1)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+        profile_list = response.data['films_lists'][0]
+        next_response = self.client.get(profile_list['films_next'], HTTP_AUTHORIZATION='Token {}'.format(self.token_1))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([film['id'] for film in profile_list['film']], [films[0].id, films[1].id])
+        self.assertEqual(profile_list['films_count'], 3)
+        self.assertEqual(next_response.status_code, status.HTTP_200_OK)
+        self.assertEqual([film['id'] for film in next_response.data['results']], [films[2].id])
+        self.assertIsNone(next_response.data['next'])
+
+    def test_get_user_private_films_list_films_with_another_user(self):
+        url = reverse('films_list_films', kwargs={
+            'user_id': self.user_1.id,
+            'films_list_id': self.user_1.films_lists.first().id,
+        })
+        self.client.force_login(self.user_2)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token_2))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_user_films_lists_summary(self):
+        films_list = self.user_1.films_lists.first()
+        films_list.private = False
+        films_list.save()
+        film = FilmFactory()
+        films_list.film.add(film)
+        url = reverse('profile', kwargs={'user_id': self.user_1.id}) + '?summary=1'
+        expected_films_lists = [
+            {
+                'id': films_list.id,
+                'type': films_list.type,
+                'film': [{'id': film.id, 'name': film.name}],
+                'private': False,
+                'films_count': 1,
+            },
+        ]
+
+        # user, films lists, films names
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['films_lists'], expected_films_lists)
+
+
+class FilmQueryCountAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUserFactory()
+        self.genres = GenreFactory.create_batch(2)
+        self.franchise = FranchiseFactory()
+
+    def create_films(self, count):
+        films = FilmFactory.create_batch(count, franchise=self.franchise)
+        for film in films:
+            film.genre.add(*self.genres)
+            RateFactory(user=self.user, film=film)
+        return films
+
+    def test_films_list_query_count_is_constant(self):
+        for page_size in (1, 10):
+            self.create_films(page_size)
+            url = reverse('films') + f'?page_size={page_size}&ordering=-film_rating'
+
+            # films page, genres, franchise films
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_film_detail_query_count(self):
+        film = self.create_films(5)[0]
+        url = reverse('film', kwargs={'film_id': film.id})
+
+        # film, genres, franchise films and latest comments
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['franchise_films']), 5)
+        self.assertEqual(len(response.data['genre']), 2)
+
+    def test_profile_query_count_is_constant(self):
+        films_list = self.user.films_lists.first()
+        films_list.private = False
+        films_list.save()
+        url = reverse('profile', kwargs={'user_id': self.user.id})
+        for count in (1, 10):
+            films_list.film.add(*self.create_films(count))
+
+            # user, films lists, films, genres, franchise films
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+
+            self.assertEqual(len(response.data['films_lists'][0]['film']), films_list.film.count())
+
+
+class FilmsCacheAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.film_1 = FilmFactory()
+        self.film_2 = FilmFactory()
+        self.user = CustomUserFactory()
+
+    def test_get_films_list_served_from_cache(self):
+        url = reverse('films')
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_get_films_list_query_params_keyed_separately(self):
+        self.client.get(reverse('films') + '?page_size=1')
+
+        response = self.client.get(reverse('films') + '?page_size=2')
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_rate_evicts_only_rated_film(self):
+        url_1 = reverse('film', kwargs={'film_id': self.film_1.id})
+        url_2 = reverse('film', kwargs={'film_id': self.film_2.id})
+        self.client.get(url_1)
+        self.client.get(url_2)
+
+        RateFactory(user=self.user, film=self.film_1, value=FIVE)
+        response_1 = self.client.get(url_1)
+        response_2 = self.client.get(url_2)
+
+        self.assertEqual(response_1['X-Cache'], 'MISS')
+        self.assertEqual(response_1.data['rating'], FIVE)
+        self.assertEqual(response_2['X-Cache'], 'HIT')
+
+    def test_comment_edit_evicts_only_commented_film_detail(self):
+        comment = CommentFactory(film=self.film_1)
+        detail_url = reverse('film', kwargs={'film_id': self.film_1.id})
+        list_url = reverse('films')
+        self.client.get(detail_url)
+        self.client.get(list_url)
+
+        comment.text = 'edited'
+        comment.save()
+        detail_response = self.client.get(detail_url)
+        list_response = self.client.get(list_url)
+
+        self.assertEqual(detail_response['X-Cache'], 'MISS')
+        self.assertEqual(detail_response.data['latest_comments'][0]['text'], 'edited')
+        self.assertEqual(list_response['X-Cache'], 'HIT')
+
+    def test_genre_change_evicts_film_and_list(self):
+        genre = GenreFactory(name='action')
+        detail_url = reverse('film', kwargs={'film_id': self.film_1.id})
+        list_url = reverse('films') + '?genre=action'
+        self.client.get(detail_url)
+        self.client.get(list_url)
+
+        self.film_1.genre.add(genre)
+        detail_response = self.client.get(detail_url)
+        list_response = self.client.get(list_url)
+
+        self.assertEqual(detail_response['X-Cache'], 'MISS')
+        self.assertEqual(detail_response.data['genre'], [OrderedDict([('name', 'action')])])
+        self.assertEqual([film['id'] for film in list_response.data['results']], [self.film_1.id])
+
+    def test_genre_rename_evicts_films_of_genre(self):
+        genre = GenreFactory(name='action')
+        self.film_1.genre.add(genre)
+        url = reverse('film', kwargs={'film_id': self.film_1.id})
+        self.client.get(url)
+
+        genre.name = 'drama'
+        genre.save()
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['genre'], [OrderedDict([('name', 'drama')])])
+
+    def test_franchise_film_rename_evicts_franchise_films(self):
+        franchise = FranchiseFactory()
+        self.film_1.franchise = franchise
+        self.film_1.save()
+        self.film_2.franchise = franchise
+        self.film_2.save()
+        url = reverse('film', kwargs={'film_id': self.film_1.id})
+        self.client.get(url)
+
+        self.film_2.name = 'renamed'
+        self.film_2.save()
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['franchise_films'][self.film_2.id], 'renamed')
+
+    def test_recompute_film_ratings_evicts_films(self):
+        RateFactory(film=self.film_1, value=FIVE)
+        Film.objects.filter(id=self.film_1.id).update(rating_sum=0, rating_count=0, rating_avg=None, rating_count_5=0)
+        url = reverse('film', kwargs={'film_id': self.film_1.id})
+        self.client.get(url)
+
+        call_command('recompute_film_ratings', stdout=StringIO())
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['rating'], FIVE)
+
+    def test_catalogue_import_evicts_franchise_films(self):
+        franchise = FranchiseFactory(name='Alien')
+        self.film_1.franchise = franchise
+        self.film_1.save()
+        url = reverse('film', kwargs={'film_id': self.film_1.id})
+        self.client.get(url)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalogue.jsonl')
+            with open(path, 'w') as file:
+                file.write(json.dumps({'external_id': 'aliens', 'name': 'Aliens', 'franchise': 'Alien'}) + '\n')
+
+            call_command('import_catalogue', path, stdout=StringIO())
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['franchise_films'][Film.objects.get(external_id='aliens').id], 'Aliens')
+
+
+class SparseFieldsetAPITestCase(APITestCase):
+    def setUp(self):
+        self.franchise = FranchiseFactory()
+        self.genre = GenreFactory()
+        self.film = FilmFactory(franchise=self.franchise)
+        self.film.genre.add(self.genre)
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+
+    def test_get_films_selected_fields_only(self):
+        url = reverse('films') + '?fields=id,name,rating'
+
+        with self.assertNumQueries(1) as context:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'id': self.film.id, 'name': self.film.name, 'rating': None}])
+        self.assertNotIn('synopsis', context.captured_queries[0]['sql'])
+
+    def test_get_film_unexpanded_relations_as_ids(self):
+        url = reverse('film', kwargs={'film_id': self.film.id}) + '?fields=id,franchise,genre'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.data, {'id': self.film.id, 'franchise': self.franchise.id, 'genre': [self.genre.id]})
+
+    def test_get_film_expanded_relations(self):
+        url = reverse('film', kwargs={'film_id': self.film.id}) + '?fields=franchise,genre.name&expand=franchise'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.data, {
+            'genre': [{'name': self.genre.name}],
+            'franchise': {'name': self.franchise.name},
+        })
+
+    def test_get_profile_nested_fields(self):
+        films_list = self.user.films_lists.first()
+        films_list.private = False
+        films_list.save()
+        films_list.film.add(self.film)
+        url = reverse('profile', kwargs={'user_id': self.user.id})
+        url += '?fields=email,films_lists.id,films_lists.film.name'
+
+        # user, films lists, films
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+
+        self.assertEqual(response.data, {
+            'email': self.user.email,
+            'films_lists': [{'id': films_list.id, 'film': [{'name': self.film.name}]}],
+        })
+
+    def test_post_ignores_fields_param(self):
+        url = reverse('rate', kwargs={'film_id': self.film.id}) + '?fields=value'
+
+        response = self.client.post(url, {'value': FIVE}, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'user': self.user.id, 'film': self.film.id, 'value': FIVE})
+
+    def test_post_comment_ignores_fields_param(self):
+        url = reverse('comment', kwargs={'film_id': self.film.id}) + '?fields=text'
+
+        response = self.client.post(url, {'text': 'Great'}, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'film': self.film.id, 'author': self.user.id, 'text': 'Great'})
+
+    def test_write_serializers_are_not_sparse(self):
+        for serializer_class in (CommentCreateSerializer, RateSerializer, RegisterSerializer,
+                                 UserFilmsListUpdateSerializer, FilmsListsBatchSerializer):
+            with self.subTest(serializer_class.__name__):
+                self.assertFalse(issubclass(serializer_class, SparseFieldsetMixin))
+
+
+class FilmSearchAPITestCase(APITestCase):
+    def setUp(self):
+        self.film_1 = FilmFactory(name='Galaxy Quest', synopsis='A comedy about actors.')
+        self.film_2 = FilmFactory(name='Actors', synopsis='Drama about the galaxy of stars.')
+        self.film_3 = FilmFactory(name='Other', synopsis='Nothing related.')
+
+    def test_search_ranks_name_matches_first(self):
+        url = reverse('film_search') + '?q=galaxy'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([film['id'] for film in response.data['results']], [self.film_1.id, self.film_2.id])
+
+    def test_search_prefix_match(self):
+        url = reverse('film_search') + '?q=gal que'
+
+        response = self.client.get(url)
+
+        self.assertEqual([film['id'] for film in response.data['results']], [self.film_1.id])
+
+    def test_search_with_genre_and_franchise_filters(self):
+        franchise = FranchiseFactory()
+        self.film_2.franchise = franchise
+        self.film_2.save()
+        self.film_2.genre.add(GenreFactory(name='drama'))
+        self.film_1.genre.add(GenreFactory(name='comedy'))
+
+        genre_response = self.client.get(reverse('film_search') + '?q=galaxy&genre=drama')
+        franchise_response = self.client.get(reverse('film_search') + f'?q=galaxy&franchise={franchise.id}')
+
+        self.assertEqual([film['id'] for film in genre_response.data['results']], [self.film_2.id])
+        self.assertEqual([film['id'] for film in franchise_response.data['results']], [self.film_2.id])
+
+    def test_search_paginated(self):
+        url = reverse('film_search') + '?q=galaxy&page_size=1'
+
+        first_page = self.client.get(url).data
+        second_page = self.client.get(first_page['next']).data
+
+        self.assertEqual([film['id'] for film in first_page['results']], [self.film_1.id])
+        self.assertEqual([film['id'] for film in second_page['results']], [self.film_2.id])
+        self.assertIsNone(second_page['next'])
+
+    def test_search_without_query(self):
+        response = self.client.get(reverse('film_search'))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecommendationsAPITestCase(APITestCase):
+    def setUp(self):
+        self.films = FilmFactory.create_batch(4)
+        self.users = CustomUserFactory.create_batch(4)
+        self.token = Token.objects.create(user=self.users[0])
+        # films 0 and 1 are liked and disliked together, film 2 the other way round
+        for user, values in zip(self.users, [(5, 5, 1, None), (4, 5, 2, 5), (1, 2, 5, 1), (2, 1, 4, 2)]):
+            for film, value in zip(self.films, values):
+                if value is not None:
+                    RateFactory(user=user, film=film, value=value)
+        call_command('compute_similar_films', top_k=2, stdout=StringIO())
+
+    def test_get_similar_films(self):
+        url = reverse('similar', kwargs={'film_id': self.films[0].id})
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['id'], self.films[1].id)
+        self.assertNotIn(self.films[0].id, [film['id'] for film in response.data])
+        self.assertNotIn(self.films[2].id, [film['id'] for film in response.data])
+
+    def test_get_similar_films_not_found(self):
+        url = reverse('similar', kwargs={'film_id': 999999999})
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_recommendations_exclude_listed_films(self):
+        user = self.users[0]
+        url = reverse('recommendations', kwargs={'user_id': user.id})
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        user.films_lists.first().film.add(self.films[3])
+        cache.clear()
+        listed_response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([film['id'] for film in response.data], [self.films[3].id])
+        self.assertEqual(listed_response.data, [])
+
+    def test_get_recommendations_with_another_user(self):
+        url = reverse('recommendations', kwargs={'user_id': self.users[1].id})
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ProfileExportAPITestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.film = FilmFactory()
+        self.user.films_lists.first().film.add(self.film)
+        RateFactory(user=self.user, film=self.film, value=FIVE)
+        CommentFactory(author=self.user, film=self.film)
+        self.url = reverse('export', kwargs={'user_id': self.user.id})
+
+    def test_get_export_streams_jsonl(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(records[0]['record'], 'user')
+        self.assertEqual(records[0]['id'], self.user.id)
+        self.assertEqual(len([record for record in records if record['record'] == 'films_list']), 3)
+        self.assertIn(
+            {'record': 'films_list_film', 'films_list_id': self.user.films_lists.first().id,
+             'film_id': self.film.id, 'film_name': self.film.name},
+            records,
+        )
+        self.assertEqual([record['value'] for record in records if record['record'] == 'rate'], [FIVE])
+        self.assertEqual(len([record for record in records if record['record'] == 'comment']), 1)
+
+    def test_get_export_gzip(self):
+        response = self.client.get(self.url + '?gzip=1', HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(json.loads(lines[0])['id'], self.user.id)
+
+    def test_get_export_with_another_user(self):
+        url = reverse('export', kwargs={'user_id': CustomUserFactory().id})
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FilmCommentsAPITestCase(APITestCase):
+    def setUp(self):
+        self.film = FilmFactory()
+        self.user = CustomUserFactory()
+        self.comments = [CommentFactory(film=self.film, author=self.user) for _ in range(7)]
+        CommentFactory(film=FilmFactory())
+
+    def test_get_film_comments_newest_first(self):
+        url = reverse('film_comments', kwargs={'film_id': self.film.id}) + '?page_size=4'
+
+        response = self.client.get(url)
+        next_response = self.client.get(response.data['next'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected_ids = [comment.id for comment in reversed(self.comments)]
+        self.assertEqual([comment['id'] for comment in response.data['results']], expected_ids[:4])
+        self.assertEqual([comment['id'] for comment in next_response.data['results']], expected_ids[4:])
+        self.assertIsNone(next_response.data['next'])
+        self.assertEqual(response.data['results'][0]['author'], {'id': self.user.id, 'username': self.user.username})
+
+    def test_get_film_comments_not_found(self):
+        url = reverse('film_comments', kwargs={'film_id': 999999999})
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_film_with_comment_count_and_latest_comments(self):
+        url = reverse('film', kwargs={'film_id': self.film.id}) + '?comments_limit=2'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['comment_count'], 7)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['latest_comments']],
+            [self.comments[-1].id, self.comments[-2].id],
+        )
+
+    def test_new_comment_evicts_film_detail(self):
+        url = reverse('film', kwargs={'film_id': self.film.id})
+
+        self.client.get(url)
+        self.client.post(reverse('comment', kwargs={'film_id': self.film.id}), data={'text': fake.sentence()})
+        response = self.client.get(url)
+
+        self.assertEqual(response.data['comment_count'], 8)
+        self.assertEqual(response.data['latest_comments'][0]['author'], None)
+
+
+class FilmPosterThumbnailsAPITestCase(APITestCase):
+    def test_get_film_poster_thumbnail_urls(self):
+        film = FilmFactory()
+        Film.objects.filter(id=film.id).update(poster='poster.jpg', poster_hash='abc')
+        url = reverse('film', kwargs={'film_id': film.id})
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data['poster_thumbnails']['small'],
+            'http://testserver/media/thumbnails/abc-160x240.webp',
+        )
+
+    def test_get_film_without_poster_thumbnails(self):
+        url = reverse('film', kwargs={'film_id': FilmFactory().id})
+
+        response = self.client.get(url)
+
+        self.assertIsNone(response.data['poster_thumbnails'])
+
+
+# The test database is only visible to the test's own connection, so run the
+# database work on the calling thread instead of the async views' thread pool
+@override_settings(ASYNC_DATABASE_THREADS=None)
+class AsyncReadAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.films = FilmFactory.create_batch(3)
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.user.films_lists.first().film.add(self.films[0])
+
+    def test_get_async_films_list_matches_sync(self):
+        sync_response = self.client.get(reverse('films') + '?page_size=2')
+        async_response = self.client.get(reverse('async_films') + '?page_size=2')
+
+        self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(async_response.json()['results'], json.loads(json.dumps(sync_response.data['results'])))
+        self.assertIn('/api/async/films/', async_response.json()['next'])
+
+    def test_get_async_film_detail_served_from_cache(self):
+        url = reverse('async_film', kwargs={'film_id': self.films[0].id})
+
+        miss = self.client.get(url)
+        with self.assertNumQueries(0):
+            hit = self.client.get(url)
+
+        self.assertEqual(miss['X-Cache'], 'MISS')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.json(), miss.json())
+
+    def test_get_async_film_detail_not_found(self):
+        response = self.client.get(reverse('async_film', kwargs={'film_id': 999999999}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_async_profile_private_lists_for_owner_only(self):
+        url = reverse('async_profile', kwargs={'user_id': self.user.id})
+
+        owner_response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        anonymous_response = self.client.get(url)
+
+        self.assertEqual(len(owner_response.json()['films_lists']), 3)
+        self.assertEqual(anonymous_response.json()['films_lists'], [])
+
+    def test_patch_async_profile_not_allowed(self):
+        url = reverse('async_profile', kwargs={'user_id': self.user.id})
+
+        response = self.client.patch(url, data={'first_name': 'name'}, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_routing_middleware_stays_async(self):
+        async def get_response(request):
+            return HttpResponse(status=200 if get_routing_state() is not None else 500)
+
+        middleware = DatabaseRoutingMiddleware(get_response)
+        response = await middleware(RequestFactory().get('/'))
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(DEBUG=True, REQUEST_PROFILING_HEADER=True)
+    async def test_async_views_are_not_adapted_to_sync(self):
+        url = reverse('async_film', kwargs={'film_id': self.films[0].id})
+
+        # Django logs every sync-only middleware or view it adapts to the async chain
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('"0 queries', response['Server-Timing'])
+
+
+class TokenAuthenticationCacheAPITestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        reset_token_cache_stats()
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse('films')
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        self.client.get(self.url)
+
+    def test_get_authenticated_from_cache(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_token_cache_stats(), {'hits': 1, 'shared_hits': 0, 'misses': 1, 'hit_rate': 0.5})
+
+    @override_settings(API_TOKEN_SHARED_CACHE='default')
+    def test_get_authenticated_from_shared_cache(self):
+        token_cache.clear()
+        self.client.get(self.url)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_token_cache_stats()['shared_hits'], 1)
+
+    @override_settings(API_TOKEN_SHARED_CACHE='default')
+    def test_logout_invalidates_token(self):
+        response = self.client.post(reverse('logout'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_hit_profiled(self):
+        with self.assertLogs('main.profiling', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['token_cache_hits'], 1)
+        self.assertIn('token_cache_hits;desc="1"', response['Server-Timing'])
+
+    def test_password_change_invalidates_token(self):
+        self.user.set_password(fake.password())
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+        self.assertEqual(get_token_cache_stats()['misses'], 2)
+
+    def test_deactivation_invalidates_token(self):
+        user = CustomUser.objects.get(id=self.user.id)
+        user.is_active = False
+        user.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bulk_deactivation_with_invalidate_tokens(self):
+        users = CustomUser.objects.filter(id=self.user.id)
+        users.update(is_active=False)
+        invalidate_tokens(Token.objects.filter(user__in=users).values_list('key', flat=True))
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(API_TOKEN_SHARED_CACHE='default')
+    def test_token_revoked_by_another_process_is_dropped(self):
+        self.client.get(self.url)
+        CustomUser.objects.filter(id=self.user.id).update(is_active=False)
+        # What invalidate_tokens() leaves in the shared cache when another process runs it
+        cache.set(get_revoked_key(self.token.key), time.time())
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_last_login_update_keeps_token(self):
+        user = CustomUser.objects.get(id=self.user.id)
+        user.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
+class RequestProfilingAPITestCase(APITestCase):
+    def setUp(self):
+        self.film = FilmFactory()
+        self.url = reverse('film', kwargs={'film_id': self.film.id})
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+
+        metrics = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(metrics), {'total', 'db', 'serialize', 'response_cache_misses'})
+        self.assertIn('desc="3 queries (0 duplicate)"', metrics['db'])
+
+    @override_settings(REQUEST_PROFILING_HEADER=False)
+    def test_request_logged_without_header(self):
+        with self.assertLogs('main.profiling', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        entry = json.loads(logs.records[-1].getMessage())
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(entry['path'], self.url)
+        self.assertEqual(entry['status'], status.HTTP_200_OK)
+        self.assertEqual(entry['queries'], 3)
+        self.assertIn('serialize_ms', entry)
+
+    def test_response_cache_hits_profiled(self):
+        self.client.get(self.url)
+
+        with self.assertLogs('main.profiling', 'INFO') as logs:
+            response = self.client.get(self.url)
+
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['response_cache_hits'], 1)
+        self.assertIn('response_cache_hits;desc="1"', response['Server-Timing'])
+
+    def test_request_log_has_a_handler(self):
+        self.assertTrue(logging.getLogger('main.profiling').handlers)
+
+    def test_duplicate_queries_flagged(self):
+        profile = RequestProfile()
+        for sql in ('SELECT a', 'SELECT b', 'SELECT a', 'SELECT a'):
+            profile.add_query(sql, 0.001)
+
+        self.assertEqual(profile.get_duplicate_count(), 2)
+        self.assertEqual(profile.get_duplicate_queries(), [('SELECT a', 3)])
+
+    def test_sampled_request_profile_written(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(REQUEST_PROFILING_SAMPLE_RATE=1.0, REQUEST_PROFILING_DIRECTORY=directory):
+                self.client.get(self.url)
+
+            [name] = os.listdir(directory)
+            stats = pstats.Stats(os.path.join(directory, name))
+
+        self.assertTrue(name.endswith('.prof'))
+        self.assertIn(f'GET-api-films-{self.film.id}', name)
+        self.assertTrue(stats.total_calls)
+
+    def test_stack_sampler_collects_folded_stacks(self):
+        sampler = StackSampler(0.001)
+        sampler.start(threading.get_ident())
+        time.sleep(0.05)
+        samples = sampler.stop(threading.get_ident())
+
+        self.assertTrue(samples)
+        self.assertTrue(all('test_stack_sampler_collects_folded_stacks' in stack for stack in samples))
+
+
+class LeaderboardAPITestCase(APITestCase):
+    def setUp(self):
+        self.genre = GenreFactory()
+        self.franchise = FranchiseFactory()
+        self.films = FilmFactory.create_batch(3, franchise=self.franchise)
+        for film in self.films:
+            film.genre.add(self.genre)
+        self.url = reverse('genre_leaderboard', kwargs={'group_id': self.genre.id, 'board': 'top-rated'})
+
+    def test_top_rated_needs_many_rates(self):
+        single, popular, unrated = self.films
+        RateFactory(film=single, value=FIVE)
+        for _ in range(20):
+            RateFactory(film=popular, value=4)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [entry['film']['id'] for entry in response.data['results']], [popular.id, single.id, unrated.id]
+        )
+        self.assertAlmostEqual(response.data['results'][0]['score'], (30 + 80) / 30)
+
+    def test_most_watched_follows_list_changes(self):
+        user = CustomUserFactory()
+        token = Token.objects.create(user=user)
+        watched = user.films_lists.get(type=WATCHED_TYPE)
+        url = reverse('franchise_leaderboard', kwargs={'group_id': self.franchise.id, 'board': 'most-watched'})
+
+        self.client.post(
+            reverse('add_to_list', kwargs={'film_id': self.films[2].id, 'films_list_id': watched.id}),
+            HTTP_AUTHORIZATION='Token {}'.format(token),
+        )
+        response = self.client.get(url + '?fields=film,score')
+
+        self.assertEqual(response.data['results'][0], {'film': self.films[2].id, 'score': 1})
+
+    def test_leaderboard_pages(self):
+        first_page = self.client.get(self.url + '?page_size=2')
+        second_page = self.client.get(first_page.data['next'])
+
+        film_ids = [entry['film']['id'] for page in (first_page, second_page) for entry in page.data['results']]
+        self.assertEqual(sorted(film_ids), sorted(film.id for film in self.films))
+        self.assertIsNone(second_page.data['next'])
+
+    def test_leaderboard_query_count_is_constant(self):
+        for count in (1, 10):
+            FilmFactory.create_batch(count, franchise=self.franchise)
+            for film in Film.objects.filter(genre=None):
+                film.genre.add(self.genre)
+
+            # genre, entries page, films, genres, franchise films
+            with self.assertNumQueries(5):
+                response = self.client.get(self.url + '?page_size=50')
+
+            self.assertEqual(len(response.data['results']), Film.objects.count())
+
+    def test_leaderboard_not_found(self):
+        unknown_board = reverse('genre_leaderboard', kwargs={'group_id': self.genre.id, 'board': 'worst'})
+        unknown_genre = reverse('genre_leaderboard', kwargs={'group_id': 999999999, 'board': 'top-rated'})
+
+        self.assertEqual(self.client.get(unknown_board).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(unknown_genre).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProfileStatsAPITestCase(APITestCase):
+    def setUp(self):
+        self.genres = GenreFactory.create_batch(3)
+        self.films = FilmFactory.create_batch(3)
+        for film, genres in zip(self.films, (self.genres, self.genres[1:], self.genres[1:])):
+            film.genre.add(*genres)
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.user.films_lists.get(type=WATCHED_TYPE).film.add(*self.films)
+        RateFactory(user=self.user, film=self.films[0], value=FIVE)
+        self.url = reverse('profile_stats', kwargs={'user_id': self.user.id})
+
+    def test_get_stats(self):
+        response = self.client.get(self.url + '?top_genres=2', HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['watched_count'], 3)
+        self.assertEqual(response.data['rating_avg'], FIVE)
+        self.assertEqual(response.data['rating_histogram'][str(FIVE)], 1)
+        self.assertEqual(response.data['top_genres'], [
+            {'id': self.genres[1].id, 'name': self.genres[1].name, 'watched_count': 3},
+            {'id': self.genres[2].id, 'name': self.genres[2].name, 'watched_count': 3},
+        ])
+
+    def test_get_stats_query_count(self):
+        self.client.get(reverse('films'), HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        # stats row, top genre names
+        with self.assertNumQueries(2):
+            self.client.get(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        with self.assertNumQueries(1):
+            self.client.get(self.url + '?fields=watched_count', HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+    def test_get_stats_of_user_without_stats_row(self):
+        UserStats.objects.all().delete()
+
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.data['watched_count'], 3)
+
+    def test_get_stats_of_another_user(self):
+        other_user = CustomUserFactory()
+        url = reverse('profile_stats', kwargs={'user_id': other_user.id})
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FeedAPITestCase(APITestCase):
+    def setUp(self):
+        reset_throttles()
+        self.films = FilmFactory.create_batch(3)
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.followee = CustomUserFactory()
+        self.followee_token = Token.objects.create(user=self.followee)
+        follow(self.user.id, self.followee.id)
+        self.url = reverse('feed')
+
+    def get_feed(self, url=None):
+        return self.client.get(url or self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+    def act(self, film, token=None):
+        headers = {'HTTP_AUTHORIZATION': 'Token {}'.format(token or self.followee_token)}
+        self.client.post(reverse('rate', kwargs={'film_id': film.id}), {'value': FIVE}, **headers)
+        self.client.post(reverse('comment', kwargs={'film_id': film.id}), {'text': 'Great'}, **headers)
+
+    def test_feed_shows_followed_activity_newest_first(self):
+        watched = self.followee.films_lists.get(type=WATCHED_TYPE)
+        watched.private = False
+        watched.save()
+        self.act(self.films[0])
+        self.client.post(
+            reverse('add_to_list', kwargs={'film_id': self.films[1].id, 'films_list_id': watched.id}),
+            HTTP_AUTHORIZATION='Token {}'.format(self.followee_token),
+        )
+
+        response = self.get_feed()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([event['verb'] for event in response.data['results']], ['listed', 'commented', 'rated'])
+        self.assertEqual(response.data['results'][0]['value'], WATCHED_TYPE)
+        self.assertEqual(response.data['results'][1]['comment'], 'Great')
+        self.assertEqual(response.data['results'][2]['value'], FIVE)
+        self.assertEqual(
+            response.data['results'][2]['actor'], {'id': self.followee.id, 'username': self.followee.username}
+        )
+        self.assertEqual(response.data['results'][2]['film'], {'id': self.films[0].id, 'name': self.films[0].name})
+
+    def test_feed_skips_unfollowed_users_and_private_lists(self):
+        other = CustomUserFactory()
+        self.act(self.films[0], Token.objects.create(user=other))
+        planned = self.followee.films_lists.get(type=PLANNED_TYPE)
+        planned.private = True
+        planned.save()
+        self.client.post(
+            reverse('add_to_list', kwargs={'film_id': self.films[1].id, 'films_list_id': planned.id}),
+            HTTP_AUTHORIZATION='Token {}'.format(self.followee_token),
+        )
+
+        self.assertEqual(self.get_feed().data['results'], [])
+
+    def test_feed_skips_repeated_adds(self):
+        watched = self.followee.films_lists.get(type=WATCHED_TYPE)
+        watched.private = False
+        watched.save()
+        url = reverse('add_to_list', kwargs={'film_id': self.films[1].id, 'films_list_id': watched.id})
+        for _ in range(3):
+            self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.followee_token))
+
+        self.assertEqual([event['verb'] for event in self.get_feed().data['results']], ['listed'])
+
+    def test_feed_skips_moves_into_lists_made_private(self):
+        watched = self.followee.films_lists.get(type=WATCHED_TYPE)
+        watched.private = False
+        watched.save()
+        self.client.post(
+            reverse('add_to_list', kwargs={'film_id': self.films[1].id, 'films_list_id': watched.id}),
+            HTTP_AUTHORIZATION='Token {}'.format(self.followee_token),
+        )
+
+        watched.private = True
+        watched.save()
+
+        self.assertEqual(self.get_feed().data['results'], [])
+
+    def test_feed_pagination(self):
+        for film in self.films:
+            self.act(film)
+
+        first = self.get_feed(self.url + '?page_size=4')
+        second = self.get_feed(first.data['next'])
+
+        self.assertIsNone(first.data['previous'])
+        self.assertEqual(len(first.data['results']), 4)
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertIsNone(second.data['next'])
+        ids = [event['id'] for event in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_feed_query_count(self):
+        for film in self.films:
+            self.act(film)
+        self.get_feed()
+
+        # inbox ids, pulled ids, events
+        with self.assertNumQueries(3):
+            self.get_feed(self.url + '?page_size=2')
+        with self.assertNumQueries(3):
+            self.get_feed(self.url + '?page_size=5')
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_feed_pulls_events_of_accounts_with_many_followers(self):
+        other = CustomUserFactory()
+        follow(self.user.id, other.id)
+        self.act(self.films[0])
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=1):
+            # The user is other's only follower, so this one is fanned out
+            self.act(self.films[1], Token.objects.create(user=other))
+
+        response = self.get_feed(self.url + '?page_size=3')
+        rest = self.get_feed(response.data['next'])
+
+        self.assertFalse(FeedItem.objects.filter(event__actor=self.followee).exists())
+        self.assertEqual(
+            [(event['actor']['id'], event['verb']) for event in response.data['results'] + rest.data['results']],
+            [
+                (other.id, 'commented'), (other.id, 'rated'),
+                (self.followee.id, 'commented'), (self.followee.id, 'rated'),
+            ],
+        )
+
+    @override_settings(FEED_INBOX_LENGTH=2)
+    def test_inbox_is_trimmed(self):
+        for film in self.films:
+            self.act(film)
+
+        # Trimmed back to 2 items by the 5th one, then the 6th was added
+        inbox = FeedItem.objects.filter(user=self.user).order_by('-event_id')
+        self.assertEqual(inbox.count(), 3)
+        self.assertEqual(UserStats.objects.get(user=self.user).feed_length, 3)
+        self.assertEqual(
+            [event['id'] for event in self.get_feed().data['results']],
+            list(inbox.values_list('event_id', flat=True)),
+        )
+        self.assertEqual(inbox.first().event.comment.text, 'Great')
+
+    def test_anonymous_feed(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalid_cursor(self):
+        response = self.get_feed(self.url + '?cursor=invalid')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FollowAPITestCase(APITestCase):
+    def setUp(self):
+        reset_throttles()
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.followee = CustomUserFactory()
+        self.url = reverse('follow', kwargs={'user_id': self.user.id, 'followee_id': self.followee.id})
+
+    def test_follow(self):
+        RateFactory(user=self.followee)
+        self.client.post(
+            reverse('rate', kwargs={'film_id': FilmFactory().id}), {'value': FIVE},
+            HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=self.followee)),
+        )
+
+        response = self.client.post(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        repeated = self.client.post(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(repeated.status_code, status.HTTP_200_OK)
+        self.assertTrue(Follow.objects.filter(follower=self.user, followee=self.followee).exists())
+        # The followee's past events are copied into the new follower's inbox
+        self.assertEqual(FeedItem.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.followee).follower_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.user).following_count, 1)
+
+    def test_unfollow(self):
+        follow(self.user.id, self.followee.id)
+        self.client.post(
+            reverse('rate', kwargs={'film_id': FilmFactory().id}), {'value': FIVE},
+            HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=self.followee)),
+        )
+
+        response = self.client.delete(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+        repeated = self.client.delete(self.url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(repeated.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.following_count, stats.feed_length), (0, 0))
+
+    def test_follow_self(self):
+        url = reverse('follow', kwargs={'user_id': self.user.id, 'followee_id': self.user.id})
+
+        response = self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_follow_missing_user(self):
+        url = reverse('follow', kwargs={'user_id': self.user.id, 'followee_id': self.followee.id + 100})
+
+        response = self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_follow_as_another_user(self):
+        url = reverse('follow', kwargs={'user_id': self.followee.id, 'followee_id': self.user.id})
+
+        response = self.client.post(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(API_THROTTLE_RATES={'comment': {'user': '3/min', 'anon': '2/min'}, 'rate': {'user': '2/h'}})
+class ThrottlingAPITestCase(APITestCase):
+    def setUp(self):
+        reset_throttles()
+        self.film = FilmFactory()
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+        self.comment_url = reverse('comment', kwargs={'film_id': self.film.id})
+
+    def test_anonymous_comments_are_throttled_per_ip(self):
+        statuses = [
+            self.client.post(self.comment_url, {'text': 'Spam'}, REMOTE_ADDR='10.0.0.1').status_code for _ in range(3)
+        ]
+        other_ip = self.client.post(self.comment_url, {'text': 'Spam'}, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(
+            statuses, [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS]
+        )
+        self.assertEqual(other_ip.status_code, status.HTTP_201_CREATED)
+
+    def test_rejection_has_retry_after_and_no_queries(self):
+        headers = {'HTTP_AUTHORIZATION': 'Token {}'.format(self.token)}
+        url = reverse('rate', kwargs={'film_id': self.film.id})
+        self.client.post(url, {'value': FIVE}, **headers)
+        self.client.post(url, {'value': TWO}, **headers)
+
+        # The token is cached by now, so a rejection touches no database
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'value': FIVE}, **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # 2 rates fill the '2/h' window: the next fits once it became the previous window and half of it slid out
+        self.assertTrue(1800 <= int(response['Retry-After']) <= 5400)
+        self.assertEqual(Rate.objects.get(user=self.user).value, TWO)
+
+    def test_forwarded_for_header_does_not_reset_the_limit(self):
+        statuses = [
+            self.client.post(
+                self.comment_url, {'text': 'Spam'}, REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{number}'
+            ).status_code
+            for number in range(3)
+        ]
+
+        self.assertEqual(statuses[-1], status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_users_are_throttled_separately_from_their_ip(self):
+        headers = {'HTTP_AUTHORIZATION': 'Token {}'.format(self.token)}
+        for _ in range(2):
+            self.client.post(self.comment_url, {'text': 'Spam'})
+
+        response = self.client.post(self.comment_url, {'text': 'Signed'}, **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_sliding_window(self):
+        counter = LocalWindowCounter(max_keys=10)
+
+        self.assertIsNone(counter.hit('key', 2, 60, 30))
+        self.assertIsNone(counter.hit('key', 2, 60, 40))
+        # Full: the next request fits once half of this window slid out of the sliding one, at 90
+        self.assertEqual(counter.hit('key', 2, 60, 50), 40)
+        self.assertIsNotNone(counter.hit('key', 2, 60, 65))
+        self.assertIsNone(counter.hit('key', 2, 60, 111))
+
+    def test_get_wait(self):
+        self.assertIsNone(get_wait(current=0, previous=9, limit=10, period=60, elapsed=0))
+        self.assertAlmostEqual(get_wait(current=0, previous=10, limit=10, period=60, elapsed=0), 6)
+        self.assertAlmostEqual(get_wait(current=10, previous=0, limit=10, period=60, elapsed=30), 36)
+
+    @override_settings(
+        API_THROTTLE_SHARED_CACHE='default',
+        API_THROTTLE_RATES={'comment': {'anon': '1/min'}},
+    )
+    def test_shared_counters(self):
+        cache.clear()
+        first = self.client.post(self.comment_url, {'text': 'Spam'})
+        reset_throttles()
+
+        second = self.client.post(self.comment_url, {'text': 'Spam'})
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_a'])
+class ReplicaRoutingAPITestCase(TransactionTestCase):
+    """Routing against SQLite files standing in for replicas, filled from the primary by sync_replicas."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.add_replica('replica_a', os.path.join(self.directory.name, 'replica_a.sqlite3'))
+        replica_pool.reset()
+        cache.clear()
+        self.film = FilmFactory()
+        self.user = CustomUserFactory()
+        self.token = Token.objects.create(user=self.user)
+
+    def tearDown(self):
+        for alias in ('replica_a', 'replica_b'):
+            if alias in connections.settings:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+        self.directory.cleanup()
+
+    def add_replica(self, alias, name):
+        connections.settings[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+
+    def sync(self):
+        call_command('sync_replicas', stdout=StringIO())
+
+    def test_safe_requests_read_a_replica(self):
+        self.sync()
+        new_film = FilmFactory()
+
+        films = self.client.get(reverse('films'))
+        new_film_response = self.client.get(reverse('film', kwargs={'film_id': new_film.id}))
+
+        # The replica lags behind the primary until the next sync
+        self.assertEqual([film['id'] for film in films.data['results']], [self.film.id])
+        self.assertEqual(new_film_response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_profile_reads_a_replica(self):
+        self.sync()
+        CustomUser.objects.filter(id=self.user.id).update(first_name='Renamed')
+
+        response = self.client.get(
+            reverse('profile', kwargs={'user_id': self.user.id}), HTTP_AUTHORIZATION='Token {}'.format(self.token)
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['first_name'], self.user.first_name)
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        self.sync()
+        new_film = FilmFactory()
+        url = reverse('film', kwargs={'film_id': new_film.id})
+
+        self.client.post(
+            reverse('rate', kwargs={'film_id': self.film.id}), {'value': FIVE},
+            HTTP_AUTHORIZATION='Token {}'.format(self.token),
+        )
+        anonymous = self.client.get(url)
+        pinned = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertTrue(is_pinned_to_primary(self.user.id))
+        self.assertEqual(pinned.status_code, status.HTTP_200_OK)
+        self.assertEqual(anonymous.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_replica_reads_are_not_cached(self):
+        self.sync()
+        url = reverse('film', kwargs={'film_id': self.film.id})
+
+        self.client.post(
+            reverse('rate', kwargs={'film_id': self.film.id}), {'value': FIVE},
+            HTTP_AUTHORIZATION='Token {}'.format(self.token),
+        )
+        anonymous = self.client.get(url)
+        pinned = self.client.get(url, HTTP_AUTHORIZATION='Token {}'.format(self.token))
+
+        self.assertIsNone(anonymous.data['rating'])
+        self.assertEqual(pinned['X-Cache'], 'MISS')
+        self.assertEqual(pinned.data['rating'], FIVE)
+
+    @override_settings(REQUEST_PROFILING_HEADER=True)
+    def test_replica_queries_are_profiled(self):
+        self.sync()
+
+        response = self.client.get(reverse('film', kwargs={'film_id': self.film.id}))
+
+        self.assertNotIn('"0 queries', response['Server-Timing'])
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        self.client.post(
+            reverse('rate', kwargs={'film_id': self.film.id}), {'value': FIVE},
+            HTTP_AUTHORIZATION='Token {}'.format(self.token),
+        )
+
+        self.assertFalse(is_pinned_to_primary(self.user.id))
+
+    @override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'])
+    def test_unreachable_replica_is_skipped(self):
+        self.add_replica('replica_b', os.path.join(self.directory.name, 'missing', 'replica_b.sqlite3'))
+        call_command('sync_replicas', 'replica_a', stdout=StringIO())
+
+        for _ in range(5):
+            response = self.client.get(reverse('film', kwargs={'film_id': self.film.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(replica_pool.is_healthy('replica_b'))
+
+    def test_failing_replica_falls_back_to_the_primary(self):
+        # Never synced: the replica answers the health check but has no tables
+        response = self.client.get(reverse('film', kwargs={'film_id': self.film.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(replica_pool.is_healthy('replica_a'))
+
+    def test_requests_without_the_mixin_read_the_primary(self):
+        self.sync()
+        new_film = FilmFactory()
+
+        response = self.client.get(reverse('film_comments', kwargs={'film_id': new_film.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
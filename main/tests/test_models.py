@@ -0,0 +1,670 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+
+from main.benchmarks import (
+    DATASETS,
+    benchmark_recommendations,
+    check_coverage,
+    compare_results,
+    get_cases,
+    run_benchmarks,
+    seed_dataset,
+)
+from main.checks import check_replica_caches
+from main.constants import (
+    DROPPED_TYPE,
+    FIVE,
+    FOUR,
+    LEADERBOARD_FRANCHISE,
+    LEADERBOARD_GENRE,
+    PLANNED_TYPE,
+    RATED_VERB,
+    TWO,
+    WATCHED_TYPE,
+)
+from main.feed import follow, record_event
+from main.models import Comment, CustomUser, Film, FilmsList, Genre, LeaderboardEntry, Rate, UserStats
+from main.posters import get_thumbnail_name
+from main.search import BaseSearchBackend, get_search_backend
+from main.views import serve_poster_thumbnail
+from main.tests.factories import (
+    CommentFactory,
+    CustomUserFactory,
+    FilmFactory,
+    FranchiseFactory,
+    GenreFactory,
+    RateFactory,
+)
+
+
+class FilmRatingAggregatesTestCase(TestCase):
+    def setUp(self):
+        self.film = FilmFactory()
+
+    def test_rate_create_updates_aggregates(self):
+        RateFactory(film=self.film, value=FIVE)
+        RateFactory(film=self.film, value=TWO)
+
+        self.film.refresh_from_db()
+
+        self.assertEqual(self.film.rating_sum, FIVE + TWO)
+        self.assertEqual(self.film.rating_count, 2)
+        self.assertEqual(self.film.rating, (FIVE + TWO) / 2)
+        self.assertEqual(self.film.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+    def test_rate_update_moves_histogram_bucket(self):
+        rate = RateFactory(film=self.film, value=FIVE)
+        rate = type(rate).objects.get(id=rate.id)
+        rate.value = FOUR
+        rate.save()
+
+        self.film.refresh_from_db()
+
+        self.assertEqual(self.film.rating_count, 1)
+        self.assertEqual(self.film.rating, FOUR)
+        self.assertEqual(self.film.rating_count_5, 0)
+        self.assertEqual(self.film.rating_count_4, 1)
+
+    def test_rate_delete_updates_aggregates(self):
+        rate = RateFactory(film=self.film, value=FIVE)
+        RateFactory(film=self.film, value=TWO)
+
+        rate.delete()
+        self.film.refresh_from_db()
+
+        self.assertEqual(self.film.rating_count, 1)
+        self.assertEqual(self.film.rating, TWO)
+        self.assertEqual(self.film.rating_count_5, 0)
+
+    def test_last_rate_delete_resets_rating(self):
+        RateFactory(film=self.film, value=FIVE).delete()
+
+        self.film.refresh_from_db()
+
+        self.assertEqual(self.film.rating_count, 0)
+        self.assertIsNone(self.film.rating)
+
+    def test_recompute_film_ratings_command(self):
+        RateFactory(film=self.film, value=FIVE)
+        RateFactory(film=self.film, value=FOUR)
+        Film.objects.filter(id=self.film.id).update(rating_sum=0, rating_count=0, rating_avg=None, rating_count_5=0)
+
+        call_command('recompute_film_ratings', chunk_size=1, stdout=StringIO())
+        self.film.refresh_from_db()
+
+        self.assertEqual(self.film.rating_count, 2)
+        self.assertEqual(self.film.rating, (FIVE + FOUR) / 2)
+        self.assertEqual(self.film.rating_count_5, 1)
+
+
+class FilmCommentCountTestCase(TestCase):
+    def setUp(self):
+        self.film = FilmFactory()
+
+    def test_comment_create_and_delete_update_count(self):
+        comments = [CommentFactory(film=self.film) for _ in range(3)]
+        comments[0].delete()
+
+        self.film.refresh_from_db()
+        self.assertEqual(self.film.comment_count, 2)
+
+
+class FilmSearchIndexTestCase(TestCase):
+    def search_ids(self, query):
+        return list(get_search_backend().search(Film.objects.all(), query).values_list('id', flat=True))
+
+    def test_film_rename_reindexes(self):
+        film = FilmFactory(name='Solaris')
+
+        film.name = 'Stalker'
+        film.save()
+
+        self.assertEqual(self.search_ids('solaris'), [])
+        self.assertEqual(self.search_ids('stalker'), [film.id])
+
+    def test_film_delete_unindexes(self):
+        film = FilmFactory(name='Solaris')
+
+        film.delete()
+
+        self.assertEqual(self.search_ids('solaris'), [])
+
+    def test_rebuild_search_index_command(self):
+        film = FilmFactory(name='Solaris')
+        get_search_backend().clear()
+
+        call_command('rebuild_search_index', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self.search_ids('solaris'), [film.id])
+
+    def test_backend_without_search_fails_when_built(self):
+        class IndexOnlyBackend(BaseSearchBackend):
+            def index(self, films):
+                pass
+
+        with self.assertRaises(TypeError):
+            IndexOnlyBackend()
+
+
+class LeaderboardEntryTestCase(TestCase):
+    def setUp(self):
+        self.genre = GenreFactory()
+        self.franchise = FranchiseFactory()
+        self.film = FilmFactory(franchise=self.franchise)
+        self.film.genre.add(self.genre)
+        self.user = CustomUserFactory()
+
+    def get_entries(self):
+        return dict(
+            ((group, group_id), (weighted_rating, watched, planned))
+            for group, group_id, weighted_rating, watched, planned in LeaderboardEntry.objects.filter(
+                film=self.film
+            ).values_list('group', 'group_id', 'weighted_rating', 'watched_count', 'planned_count')
+        )
+
+    def test_film_groups_create_entries(self):
+        self.assertEqual(self.get_entries(), {
+            (LEADERBOARD_GENRE, self.genre.id): (3.0, 0, 0),
+            (LEADERBOARD_FRANCHISE, self.franchise.id): (3.0, 0, 0),
+        })
+
+    def test_genre_and_franchise_changes_move_entries(self):
+        other_genre = GenreFactory()
+        self.film.genre.set([other_genre])
+        self.film.franchise = None
+        self.film.save()
+
+        self.assertEqual(set(self.get_entries()), {(LEADERBOARD_GENRE, other_genre.id)})
+
+        other_genre.films.clear()
+
+        self.assertEqual(self.get_entries(), {})
+
+    @override_settings(LEADERBOARD_PRIOR_RATING=3.0, LEADERBOARD_PRIOR_VOTES=10)
+    def test_rates_update_weighted_rating(self):
+        rate = RateFactory(film=self.film, value=FIVE)
+        RateFactory(film=self.film, value=FOUR)
+        rate = Rate.objects.get(id=rate.id)
+        rate.value = TWO
+        rate.save()
+
+        self.assertAlmostEqual(self.get_entries()[LEADERBOARD_GENRE, self.genre.id][0], (30 + TWO + FOUR) / 12)
+
+        rate.delete()
+
+        self.assertAlmostEqual(self.get_entries()[LEADERBOARD_GENRE, self.genre.id][0], (30 + FOUR) / 11)
+
+    def test_list_changes_update_counts(self):
+        watched = self.user.films_lists.get(type=WATCHED_TYPE)
+        watched.film.add(self.film)
+        self.assertEqual(self.get_entries()[LEADERBOARD_GENRE, self.genre.id][1:], (1, 0))
+
+        FilmsList.move_films(self.user.id, {self.film.id: PLANNED_TYPE})
+        self.assertEqual(self.get_entries()[LEADERBOARD_GENRE, self.genre.id][1:], (0, 1))
+
+        self.user.delete()
+        self.assertEqual(self.get_entries()[LEADERBOARD_GENRE, self.genre.id][1:], (0, 0))
+
+    def test_group_delete_removes_entries(self):
+        self.genre.delete()
+        self.franchise.delete()
+
+        self.assertEqual(self.get_entries(), {})
+
+    def test_rebuild_leaderboards_command(self):
+        RateFactory(film=self.film, value=FIVE)
+        self.user.films_lists.get(type=WATCHED_TYPE).film.add(self.film)
+        expected = self.get_entries()
+        LeaderboardEntry.objects.all().delete()
+
+        call_command('rebuild_leaderboards', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self.get_entries(), expected)
+
+
+class UserStatsTestCase(TestCase):
+    def setUp(self):
+        self.genres = GenreFactory.create_batch(2)
+        self.films = FilmFactory.create_batch(3)
+        self.films[0].genre.add(*self.genres)
+        self.films[1].genre.add(self.genres[0])
+        self.user = CustomUserFactory()
+        self.lists = {films_list.type: films_list for films_list in self.user.films_lists.all()}
+
+    def get_stats(self):
+        stats = UserStats.objects.get(user=self.user)
+        return {
+            'lists': (stats.planned_count, stats.watched_count, stats.dropped_count),
+            'rating': (stats.rating_count, stats.rating_sum, stats.rating_avg, stats.rating_histogram),
+            'genre_counts': stats.genre_counts,
+        }
+
+    def assert_stats_match_recompute(self):
+        stats = self.get_stats()
+        UserStats.recompute([self.user.id])
+        self.assertEqual(stats, self.get_stats())
+
+    def test_new_user_has_empty_stats(self):
+        self.assertEqual(self.get_stats(), {
+            'lists': (0, 0, 0),
+            'rating': (0, 0, None, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}),
+            'genre_counts': {},
+        })
+
+    def test_list_changes_update_stats(self):
+        self.lists[WATCHED_TYPE].film.add(self.films[0], self.films[1])
+        self.lists[PLANNED_TYPE].film.add(self.films[2])
+
+        stats = self.get_stats()
+        self.assertEqual(stats['lists'], (1, 2, 0))
+        self.assertEqual(stats['genre_counts'], {str(self.genres[0].id): 2, str(self.genres[1].id): 1})
+
+        self.lists[WATCHED_TYPE].film.remove(self.films[0], self.films[2])
+        self.lists[PLANNED_TYPE].film.clear()
+
+        stats = self.get_stats()
+        self.assertEqual(stats['lists'], (0, 1, 0))
+        self.assertEqual(stats['genre_counts'], {str(self.genres[0].id): 1})
+        self.assert_stats_match_recompute()
+
+    def test_move_films_updates_stats(self):
+        self.lists[WATCHED_TYPE].film.add(self.films[0])
+
+        FilmsList.move_films(self.user.id, {self.films[0].id: DROPPED_TYPE, self.films[1].id: WATCHED_TYPE})
+
+        stats = self.get_stats()
+        self.assertEqual(stats['lists'], (0, 1, 1))
+        self.assertEqual(stats['genre_counts'], {str(self.genres[0].id): 1})
+        self.assert_stats_match_recompute()
+
+    def test_reverse_list_changes_update_stats(self):
+        self.films[0].films_lists.add(self.lists[WATCHED_TYPE])
+
+        self.assertEqual(self.get_stats()['lists'], (0, 1, 0))
+
+        self.films[0].films_lists.clear()
+
+        self.assertEqual(self.get_stats()['lists'], (0, 0, 0))
+
+    def test_rates_update_stats(self):
+        rate = RateFactory(user=self.user, film=self.films[0], value=FIVE)
+        RateFactory(user=self.user, film=self.films[1], value=FOUR)
+        rate = Rate.objects.get(id=rate.id)
+        rate.value = TWO
+        rate.save()
+
+        self.assertEqual(self.get_stats()['rating'], (2, 6, 3.0, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0}))
+
+        rate.delete()
+
+        self.assertEqual(self.get_stats()['rating'], (1, 4, 4.0, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+
+    def test_backfill_user_stats_command(self):
+        self.lists[WATCHED_TYPE].film.add(self.films[0])
+        RateFactory(user=self.user, film=self.films[0], value=FIVE)
+        expected = self.get_stats()
+        UserStats.objects.all().delete()
+        out = StringIO()
+
+        call_command('backfill_user_stats', processes=1, chunk_size=1, stdout=out)
+
+        self.assertEqual(self.get_stats(), expected)
+        self.assertIn('Rebuilt the stats of 1 user(s)', out.getvalue())
+
+    def test_follows_update_stats(self):
+        other = CustomUserFactory()
+        follow(self.user.id, other.id)
+        follow(other.id, self.user.id)
+        record_event(other.id, RATED_VERB, self.films[0].id, value=FIVE)
+        counts = ('follower_count', 'following_count', 'feed_length')
+        expected = UserStats.objects.filter(user=self.user).values_list(*counts).get()
+
+        UserStats.recompute([self.user.id])
+
+        self.assertEqual(expected, (1, 1, 1))
+        self.assertEqual(UserStats.objects.filter(user=self.user).values_list(*counts).get(), expected)
+
+        other.delete()
+
+        self.assertEqual(UserStats.objects.filter(user=self.user).values_list(*counts[:2]).get(), (0, 0))
+
+
+class ImportCatalogueCommandTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def write_jsonl(self, records):
+        return self.write('catalogue.jsonl', ''.join(json.dumps(record) + '\n' for record in records))
+
+    def test_import_jsonl_creates_films_genres_and_franchises(self):
+        path = self.write_jsonl([
+            {'external_id': 'a', 'name': 'Alien', 'synopsis': 'Space.', 'genres': ['horror', 'sci-fi'],
+             'franchise': 'Alien', 'release_date': '1979-05-25'},
+            {'external_id': 'b', 'name': 'Aliens', 'synopsis': 'More space.', 'genres': ['sci-fi'],
+             'franchise': 'Alien'},
+        ])
+
+        call_command('import_catalogue', path, batch_size=1, stdout=StringIO())
+
+        film = Film.objects.get(external_id='a')
+        self.assertEqual(film.name, 'Alien')
+        self.assertEqual(str(film.release_date), '1979-05-25')
+        self.assertEqual(sorted(film.genre.values_list('name', flat=True)), ['horror', 'sci-fi'])
+        self.assertEqual(film.franchise.films.count(), 2)
+        self.assertEqual(Genre.objects.count(), 2)
+
+    def test_import_upserts_by_external_id(self):
+        film = FilmFactory(external_id='a', name='Old')
+        film.genre.add(GenreFactory(name='drama'))
+        RateFactory(film=film, value=FIVE)
+        path = self.write_jsonl([{'external_id': 'a', 'name': 'New', 'synopsis': '', 'genres': ['comedy']}])
+
+        call_command('import_catalogue', path, stdout=StringIO())
+
+        film.refresh_from_db()
+        self.assertEqual(Film.objects.count(), 1)
+        self.assertEqual(film.name, 'New')
+        self.assertEqual(list(film.genre.values_list('name', flat=True)), ['comedy'])
+        self.assertEqual(film.rating, FIVE)
+        self.assertEqual(get_search_backend().search(Film.objects.all(), 'new').get(), film)
+
+    def test_import_csv(self):
+        path = self.write('catalogue.csv', (
+            'external_id,name,synopsis,genres,franchise\n'
+            'a,Alien,"Two\nlines",horror|sci-fi,\n'
+            'b,Heat,Crime.,,\n'
+        ))
+
+        call_command('import_catalogue', path, stdout=StringIO())
+
+        self.assertEqual(Film.objects.get(external_id='a').synopsis, 'Two\nlines')
+        self.assertEqual(Film.objects.get(external_id='b').genre.count(), 0)
+
+    def test_import_resumes_after_failure(self):
+        path = self.write_jsonl([
+            {'external_id': 'a', 'name': 'A'},
+            {'external_id': 'b', 'name': 'B'},
+            {'name': 'without external id'},
+            {'external_id': 'c', 'name': 'C'},
+        ])
+
+        with self.assertRaises(CommandError):
+            call_command('import_catalogue', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(sorted(Film.objects.values_list('external_id', flat=True)), ['a', 'b'])
+        with open(path) as file:
+            lines = file.readlines()
+        lines[2] = json.dumps({'external_id': 'x', 'name': 'X'}) + '\n'
+        with open(path, 'w') as file:
+            file.writelines(lines)
+        call_command('import_catalogue', path, batch_size=2, resume=True, stdout=StringIO())
+
+        self.assertEqual(sorted(Film.objects.values_list('external_id', flat=True)), ['a', 'b', 'c', 'x'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+class ExportUserDataCommandTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.users = CustomUserFactory.create_batch(3)
+        RateFactory(user=self.users[0], value=FOUR)
+
+    @staticmethod
+    def read_records(path):
+        with gzip.open(path, 'rt') if path.endswith('.gz') else open(path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_export_given_users(self):
+        call_command('export_user_data', self.users[0].id, output=self.directory.name, stdout=StringIO())
+
+        records = self.read_records(os.path.join(self.directory.name, f'user-{self.users[0].id}.jsonl'))
+        self.assertEqual(records[0]['username'], self.users[0].username)
+        self.assertEqual([record['value'] for record in records if record['record'] == 'rate'], [FOUR])
+
+    def test_export_all_users_in_shards(self):
+        call_command(
+            'export_user_data', output=self.directory.name, shard_size=2, processes=1, gzip=True, stdout=StringIO()
+        )
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['users-00000.jsonl.gz', 'users-00001.jsonl.gz'])
+        users = [
+            record['id']
+            for name in sorted(os.listdir(self.directory.name))
+            for record in self.read_records(os.path.join(self.directory.name, name))
+            if record['record'] == 'user'
+        ]
+        self.assertEqual(users, [user.id for user in self.users])
+
+
+class PosterThumbnailsTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def make_poster(size=(1000, 1500), color='red'):
+        output = BytesIO()
+        Image.new('RGB', size, color).save(output, 'JPEG')
+        return ContentFile(output.getvalue())
+
+    def assert_thumbnails(self, poster_hash):
+        for size_name, size in {'small': (160, 240), 'large': (640, 960)}.items():
+            with default_storage.open(get_thumbnail_name(poster_hash, size_name)) as file:
+                image = Image.open(file)
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, size)
+
+    def test_poster_upload_generates_thumbnails(self):
+        film = FilmFactory()
+
+        film.poster.save('poster.jpg', self.make_poster())
+
+        film.refresh_from_db()
+        self.assertTrue(film.poster_hash)
+        self.assert_thumbnails(film.poster_hash)
+
+    def test_new_poster_changes_hash(self):
+        film = FilmFactory()
+        film.poster.save('poster.jpg', self.make_poster())
+        old_hash = film.poster_hash
+
+        film.poster.save('poster.jpg', self.make_poster(color='blue'))
+
+        self.assertNotEqual(Film.objects.get(id=film.id).poster_hash, old_hash)
+
+    def test_generate_poster_thumbnails_command(self):
+        film = FilmFactory()
+        name = default_storage.save('poster.jpg', self.make_poster())
+        Film.objects.filter(id=film.id).update(poster=name)
+        broken_film = FilmFactory()
+        Film.objects.filter(id=broken_film.id).update(poster=default_storage.save('broken.jpg', ContentFile(b'no')))
+
+        call_command('generate_poster_thumbnails', processes=1, stdout=StringIO(), stderr=StringIO())
+
+        film.refresh_from_db()
+        self.assert_thumbnails(film.poster_hash)
+        self.assertEqual(Film.objects.get(id=broken_film.id).poster_hash, '')
+
+    def test_serve_poster_thumbnail_cache_headers(self):
+        film = FilmFactory()
+        film.poster.save('poster.jpg', self.make_poster())
+        path = get_thumbnail_name(film.poster_hash, 'small').split('/', 1)[1]
+
+        response = serve_poster_thumbnail(RequestFactory().get('/'), path)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+
+def get_generated_rows():
+    """Rates and comments of a generated dataset, with user and film ids counted from the first generated ones."""
+    first_user_id = CustomUser.objects.order_by('id').values_list('id', flat=True).first()
+    first_film_id = Film.objects.order_by('id').values_list('id', flat=True).first()
+    rates = Rate.objects.order_by('user_id', 'film_id').values_list('user_id', 'film_id', 'value')
+    comments = Comment.objects.order_by('author_id', 'film_id', 'text').values_list('author_id', 'film_id', 'text')
+    return {
+        'rates': [[user_id - first_user_id, film_id - first_film_id, value] for user_id, film_id, value in rates],
+        'comments': [[user_id - first_user_id, film_id - first_film_id, text] for user_id, film_id, text in comments],
+    }
+
+
+# Forked workers can't see the test database, so the multi-process run migrates a database file of its own
+GENERATE_IN_PROCESSES = """
+import io, json, sys
+import django
+django.setup()
+from django.core.management import call_command
+from main.tests.test_models import get_generated_rows
+call_command('migrate', verbosity=0)
+call_command('generate_dataset', stdout=io.StringIO(), **json.loads(sys.argv[1]))
+print(json.dumps(get_generated_rows()))
+"""
+
+
+class GenerateDatasetCommandTestCase(TestCase):
+    options = {'users': 30, 'films': 40, 'genres': 4, 'franchises': 3, 'rates': 300, 'comments': 60, 'chunk_size': 7}
+
+    def generate(self):
+        call_command('generate_dataset', processes=1, stdout=StringIO(), **self.options)
+        return get_generated_rows()
+
+    def generate_in_processes(self, processes):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'dataset_settings.py'), 'w') as file:
+                file.write(
+                    'from iwatched.settings import *\n'
+                    f'DATABASES = {{"default": {{"ENGINE": "django.db.backends.sqlite3", '
+                    f'"NAME": {os.path.join(directory, "db.sqlite3")!r}}}}}\n'
+                    'DATABASE_REPLICAS = []\n'
+                )
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'dataset_settings',
+                'PYTHONPATH': os.pathsep.join([directory, str(settings.BASE_DIR)]),
+            }
+            result = subprocess.run(
+                [sys.executable, '-c', GENERATE_IN_PROCESSES, json.dumps({**self.options, 'processes': processes})],
+                env=env, capture_output=True, text=True, check=True,
+            )
+        return json.loads(result.stdout)
+
+    def test_generate_dataset(self):
+        rows = self.generate()
+
+        self.assertEqual(CustomUser.objects.count(), 30)
+        self.assertEqual(Film.objects.count(), 40)
+        self.assertEqual(FilmsList.objects.count(), 30 * 3)
+        self.assertFalse(CustomUser.objects.annotate(lists=Count('films_lists')).exclude(lists=3).exists())
+        self.assertGreater(len(rows['rates']), 0)
+        film = Film.objects.order_by('-rating_count').first()
+        self.assertEqual(film.rating_count, Rate.objects.filter(film=film).count())
+        self.assertTrue(get_search_backend().search(Film.objects.all(), film.name).exists())
+
+    def test_generate_dataset_is_deterministic(self):
+        rows = self.generate()
+        for model in (Rate, Comment, FilmsList, Film, CustomUser):
+            model.objects.all().delete()
+
+        self.assertEqual(self.generate(), rows)
+
+    def test_generate_dataset_does_not_depend_on_processes(self):
+        self.assertEqual(self.generate_in_processes(3), self.generate())
+
+
+# The async views' thread pool can't see the test's uncommitted dataset
+@override_settings(ASYNC_DATABASE_THREADS=None)
+class EndpointBenchmarkTestCase(TestCase):
+    def setUp(self):
+        self.data = seed_dataset(DATASETS['tiny'])
+        self.cases = get_cases(self.data)
+
+    def test_cases_cover_every_route(self):
+        check_coverage(self.cases)
+
+    def test_run_benchmarks(self):
+        endpoints = run_benchmarks(self.data, self.cases, requests=2)
+
+        self.assertEqual(set(endpoints), {case.name for case in self.cases})
+        for name, result in endpoints.items():
+            self.assertLess(result['status'], 300, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_compare_results_reports_extra_queries(self):
+        endpoint = {'status': 200, 'queries': 3, 'peak_memory_kib': 100.0, 'p50_ms': 5.0, 'p95_ms': 8.0}
+        baseline = {'dataset': DATASETS['tiny'], 'warm_cache': False, 'endpoints': {'films': endpoint}}
+        results = {'dataset': DATASETS['tiny'], 'warm_cache': False, 'endpoints': {'films': {**endpoint, 'queries': 4}}}
+
+        regressions = compare_results(results, baseline)
+
+        self.assertEqual(regressions, ['films: 3 -> 4 queries'])
+
+    def test_benchmark_recommendations(self):
+        result = benchmark_recommendations(self.data.user, calls=2, limit=5)
+
+        self.assertEqual(result['queries'], 2)
+        self.assertLessEqual(result['films'], 5)
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+    def test_benchmark_throttle_command(self):
+        out = StringIO()
+
+        call_command('benchmark_throttle', checks=100, clients=10, shared_cache='default', stdout=out)
+
+        self.assertIn('local: ', out.getvalue())
+        self.assertIn('shared: ', out.getvalue())
+        self.assertIn('Measured 100 throttle checks per counter.', out.getvalue())
+
+
+class SyncReplicasCommandTestCase(TestCase):
+    def test_unknown_replica(self):
+        with self.assertRaisesMessage(CommandError, 'Not replicas: primary.'):
+            call_command('sync_replicas', 'primary', stdout=StringIO())
+
+    def test_without_replicas(self):
+        out = StringIO()
+
+        call_command('sync_replicas', stdout=out)
+
+        self.assertIn('Synced 0 replica(s)', out.getvalue())
+
+
+class ReplicaCachesCheckTestCase(TestCase):
+    def test_without_replicas(self):
+        self.assertEqual(check_replica_caches(None), [])
+
+    @override_settings(DATABASE_REPLICAS=['replica_a'])
+    def test_process_local_caches_with_replicas(self):
+        errors = check_replica_caches(None)
+
+        self.assertEqual([error.id for error in errors], ['main.E001', 'main.E001'])
+
+    @override_settings(DATABASE_REPLICAS=['replica_a'])
+    def test_shared_caches_with_replicas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(CACHES={'default': shared}):
+                self.assertEqual(check_replica_caches(None), [])
@@ -1,6 +1,10 @@
+from django.conf import settings
+from django.utils.cache import patch_cache_control
 from django.views.generic import ListView, TemplateView
+from django.views.static import serve
 
 from main.models import Film
+from main.posters import THUMBNAIL_DIRECTORY
 
 
 class FilmsListView(ListView):
@@ -11,3 +15,10 @@ class FilmsListView(ListView):
 
 class AboutView(TemplateView):
     template_name = 'main/about.html'
+
+
+def serve_poster_thumbnail(request, path):
+    """Serve a poster thumbnail from MEDIA_ROOT; its name changes with its content, so it can be cached forever."""
+    response = serve(request, f'{THUMBNAIL_DIRECTORY}/{path}', document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, public=True, max_age=settings.POSTER_THUMBNAIL_CACHE_MAX_AGE, immutable=True)
+    return response